@@ -0,0 +1,259 @@
+"""Benchmark every stage of the pipeline on synthetic volumes
+
+Each stage is timed (the best of a few repeats, after a warm-up call
+that also compiles the numba kernels), and its peak memory is measured
+with `tracemalloc`. Results can be saved as a baseline, and later runs
+compared against it. A run fails if a stage is slower, or uses more
+memory, than the baseline by more than the allowed factors. Baselines
+depend on the machine, so compare runs on the same machine only.
+
+The startup stages run in a new interpreter, so they include the time
+to import the modules, and to load the kernels from the numba cache.
+Their memory is not measured.
+
+Examples:
+
+    python benchmarks/run.py --sizes 64 128 --channels 3 8 --save base.json
+    python benchmarks/run.py --sizes 64 128 --channels 3 8 --compare base.json
+"""
+
+import argparse
+import json
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from multivariate_view.app.compute import (
+    build_label_index,
+    compute_gbc,
+    data_topology_reduction,
+    gbc_to_rgb,
+)
+from multivariate_view.app.compute.preprocess import (
+    nonzero_voxels,
+    normalize_channels,
+    remove_padding_uniform,
+)
+from multivariate_view.app.compute.selection import label_means, lens_alpha
+from multivariate_view.app.io import READERS, identify_loader_function
+
+from synthetic import WRITERS, synthetic_label_map, synthetic_volume
+
+# The CSV loader parses text, and is far slower than the others
+MAX_CSV_VOXELS = 64**3
+
+
+def measure(func, repeat: int) -> dict:
+    """Time a function, and measure its peak memory"""
+    # Warm up, e.g. compile the numba kernels
+    func()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'time': min(times), 'peak_memory': peak}
+
+
+def startup_stages():
+    """Generate the name and function of every startup stage"""
+    yield 'startup_import', lambda: _run_python(
+        'import multivariate_view.app.app'
+    )
+    yield 'startup_warm_up', lambda: _run_python(
+        'from multivariate_view.app.compute.warmup import warm_up; warm_up()'
+    )
+
+
+def _run_python(code: str):
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def stages(data: np.ndarray, tmp_dir: Path):
+    """Generate the name and function of every stage to benchmark
+
+    Each stage runs on the output of the previous ones, so the inputs
+    have realistic sizes.
+    """
+    for ext, writer in WRITERS.items():
+        if ext == 'csv' and np.prod(data.shape[:3]) > MAX_CSV_VOXELS:
+            continue
+
+        path = tmp_dir / f'data.{ext}'
+        writer(path, data)
+        loader = identify_loader_function(path)
+        assert loader in READERS.values()
+        yield f'load_{ext}', lambda: loader(path)
+
+    yield 'remove_padding_uniform', lambda: remove_padding_uniform(data)
+    cropped = remove_padding_uniform(data)
+
+    yield 'normalize', lambda: normalize_channels(cropped, False)
+    yield 'normalize_channels', lambda: normalize_channels(cropped, True)
+    normalized = normalize_channels(cropped, False)
+    flattened = normalized.reshape(-1, normalized.shape[-1])
+
+    yield 'nonzero_voxels', lambda: nonzero_voxels(flattened)
+    nonzero_data = flattened[nonzero_voxels(flattened)]
+
+    yield 'compute_gbc', lambda: compute_gbc(nonzero_data)
+    gbc, _ = compute_gbc(nonzero_data)
+
+    rng = np.random.default_rng(0)
+    sample = gbc[rng.choice(len(gbc), min(len(gbc), 10000), replace=False)]
+    yield 'data_topology_reduction', lambda: data_topology_reduction(sample, 6)
+    yield 'gbc_to_rgb', lambda: gbc_to_rgb(gbc)
+    yield 'lens_alpha', lambda: lens_alpha(gbc, [0.1, 0.2], 0.5)
+
+    label_index = build_label_index(synthetic_label_map(cropped.shape[:3]))
+    yield 'label_means', lambda: label_means(flattened, label_index)
+
+    # The volume upload. This needs VTK, with offscreen rendering.
+    from multivariate_view.app.volume_view import VolumeView
+
+    volume_view = VolumeView()
+    rgba = np.random.default_rng(0).random((*cropped.shape[:3], 4))
+    yield 'volume_view_set_data', lambda: volume_view.set_data(rgba)
+
+
+def run(args) -> dict:
+    results = {}
+    for name, func in startup_stages():
+        results[name] = measure(func, args.repeat)
+        print(format_result(name, results[name]), flush=True)
+
+    for size in args.sizes:
+        for num_channels in args.channels:
+            for sparsity in args.sparsity:
+                data = synthetic_volume(
+                    size, num_channels, args.padding, sparsity
+                )
+                case = f'{size}^3 x {num_channels} (sparsity {sparsity})'
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    for name, func in stages(data, Path(tmp_dir)):
+                        key = f'{name} [{case}]'
+                        results[key] = measure(func, args.repeat)
+                        print(format_result(key, results[key]), flush=True)
+
+    return results
+
+
+def format_result(key: str, result: dict) -> str:
+    time_ms = result['time'] * 1000
+    memory_mb = result['peak_memory'] / 2**20
+    return f'{key:<60} {time_ms:10.2f} ms {memory_mb:10.1f} MB'
+
+
+def compare(results: dict, baseline: dict, args) -> list[str]:
+    """List the stages that regressed compared to the baseline"""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+
+        reference = baseline[key]
+        if reference['time'] < args.min_time:
+            # Too fast to be timed reliably
+            continue
+
+        time_ratio = result['time'] / max(reference['time'], 1e-9)
+        memory_ratio = result['peak_memory'] / max(reference['peak_memory'], 1)
+        if time_ratio > args.time_factor:
+            regressions.append(f'{key}: {time_ratio:.2f}x slower')
+        if memory_ratio > args.memory_factor:
+            regressions.append(f'{key}: {memory_ratio:.2f}x more memory')
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[64, 128],
+        help='Side lengths of the volumes',
+    )
+    parser.add_argument(
+        '--channels',
+        type=int,
+        nargs='+',
+        default=[3, 8],
+        help='Numbers of channels',
+    )
+    parser.add_argument(
+        '--sparsity',
+        type=float,
+        nargs='+',
+        default=[0.5],
+        help='Fractions of the voxels that are zero',
+    )
+    parser.add_argument(
+        '--padding',
+        type=int,
+        default=4,
+        help='Voxels of zeros around each volume',
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of timed runs of each stage. The best is kept.',
+    )
+    parser.add_argument('--save', help='Save the results as a baseline')
+    parser.add_argument('--compare', help='Compare against a baseline')
+    parser.add_argument(
+        '--time-factor',
+        type=float,
+        default=1.5,
+        help='Slowdown compared to the baseline that fails the run',
+    )
+    parser.add_argument(
+        '--memory-factor',
+        type=float,
+        default=1.2,
+        help='Memory increase compared to the baseline that fails the run',
+    )
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=0.001,
+        help='Baseline time (s) below which slowdowns are ignored',
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import csv
+from pathlib import Path
+
+import h5py
+import numpy as np
+from vtkmodules.vtkCommonDataModel import vtkImageData
+from vtkmodules.vtkIOXML import vtkXMLImageDataWriter
+import vtkmodules.util.numpy_support as np_s
+
+
+def synthetic_volume(
+    size: int,
+    num_channels: int,
+    padding: int = 0,
+    sparsity: float = 0.5,
+    seed: int = 0,
+) -> np.ndarray:
+    """Generate a multichannel volume of shape `(size, size, size, C)`
+
+    The volume is surrounded by `padding` voxels of zeros, which the
+    application crops. A `sparsity` fraction of the other voxels is zero
+    in every channel. The channels of nonzero voxels are mixtures of a
+    few phases, like the compositions of real samples.
+    """
+    rng = np.random.default_rng(seed)
+    inner = size - 2 * padding
+    shape = (inner, inner, inner)
+
+    # A handful of phases, each with its own composition
+    num_phases = 6
+    phases = rng.dirichlet(np.ones(num_channels) * 0.5, size=num_phases)
+    labels = rng.integers(0, num_phases, size=shape)
+
+    data = np.zeros((size, size, size, num_channels), dtype=np.float32)
+    inner_data = phases[labels].astype(np.float32)
+    inner_data += rng.random(inner_data.shape, dtype=np.float32) * 0.1
+    inner_data[rng.random(shape) < sparsity] = 0
+
+    box = slice(padding, size - padding)
+    data[box, box, box] = inner_data
+    return data
+
+
+def synthetic_label_map(shape: tuple[int], num_labels=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, num_labels, size=shape)
+
+
+def channel_names(num_channels: int) -> list[str]:
+    return [f'C{i}' for i in range(num_channels)]
+
+
+def write_h5(path: Path, data: np.ndarray):
+    with h5py.File(path, 'w') as f:
+        for i, name in enumerate(channel_names(data.shape[-1])):
+            f.create_dataset(name, data=data[..., i])
+
+
+def write_npz(path: Path, data: np.ndarray):
+    names = channel_names(data.shape[-1])
+    np.savez(path, **{name: data[..., i] for i, name in enumerate(names)})
+
+
+def write_vti(path: Path, data: np.ndarray):
+    # VTK uses Fortran ordering
+    array = np.ascontiguousarray(data.transpose(2, 1, 0, 3))
+    vtk_array = np_s.numpy_to_vtk(array.reshape(-1, data.shape[-1]), deep=True)
+    for i, name in enumerate(channel_names(data.shape[-1])):
+        vtk_array.SetComponentName(i, name)
+
+    image_data = vtkImageData()
+    image_data.SetDimensions(data.shape[:3])
+    image_data.GetPointData().SetScalars(vtk_array)
+
+    writer = vtkXMLImageDataWriter()
+    writer.SetFileName(str(path))
+    writer.SetInputData(image_data)
+    writer.Write()
+
+
+def write_csv(path: Path, data: np.ndarray):
+    # One row per voxel
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(channel_names(data.shape[-1]))
+        writer.writerows(data.reshape(-1, data.shape[-1]))
+
+
+WRITERS = {
+    'h5': write_h5,
+    'npz': write_npz,
+    'vti': write_vti,
+    'csv': write_csv,
+}
@@ -1,11 +1,13 @@
+import asyncio
+import atexit
+import copy
 from pathlib import Path
+import tempfile
+import time
 
-import numba
 import numpy as np
 
-import plotly.graph_objects as go
-
-from trame.app import TrameApp
+from trame.app import TrameApp, asynchronous
 from trame.assets.remote import download_file_from_google_drive
 from trame.decorators import change, life_cycle
 from trame.ui.vuetify3 import VAppLayout
@@ -14,14 +16,100 @@ from multivariate_view.widgets import radvolviz
 from .assets import ASSETS
 
 from .compute import (
+    apply_label_factors,
+    build_label_index,
+    compute_density,
     compute_gbc,
-    data_topology_reduction,
+    density_to_image,
+    GBCSampler,
     gbc_to_rgb,
     rotate_coordinates,
+    selection_factors,
+)
+from .compute.labels import label_mask
+from .compute.composition import build_composition_grid
+from .compute.clip import box_offset, box_shape, clip_box, voxels_in_box
+from .compute.parallel import start_threading_layer
+from .compute.warmup import warm_up
+from .compute.preprocess import (
+    crop_padding,
+    nonzero_voxels,
+    normalization_ranges,
+    normalize_channels,
+    normalize_data,
+    normalize_rows,
+    normalized_nonzero_voxels,
+    padding_width,
+    remove_padding_uniform,
+)
+from .compute.pyramid import (
+    LatencyModel,
+    PyramidLevel,
+    build_level,
+    choose_level,
+)
+from .compute.segmentation import (
+    SEGMENTATION_METHODS,
+    segment_voxels,
+    segmentation_label_map,
+)
+from .compute.selection import label_means, lens_alpha
+from .compute.voxels import (
+    SparseVolume,
+    VoxelIndex,
+    build_voxel_index,
+    index_rows,
+)
+from .compute.histogram import (
+    HistogramCache,
+    SelectionHistograms,
+    scale_histogram,
 )
-from .io import load_dataset
-from .volume_view import VolumeView
+from .export import export_selection
+from .memory import (
+    choose_decimation,
+    estimate_footprint,
+    format_report,
+    format_size,
+    memory_report,
+    parse_size,
+)
+from .profiling import PROFILER, profiled
+from .remote import BLOCK_CACHE
+from .replay import SessionRecorder
+from .slabs import SlabPool
+from .store import DatasetStore
+from .timeseries import TimestepCache, find_timesteps
+from .transport import float32_buffer, uint8_buffer
+from .volume_view import RENDER_BACKENDS, VolumeView
+
+
+# Downsampling factors of the coarse levels used while interacting
+PYRAMID_FACTORS = (2, 4)
+
+# Seconds without input before a coarse preview is refined
+REFINE_DELAY = 0.3
+
+# Maximum number of voxels of the preview rendered while loading
+PREVIEW_VOXELS = 64**3
+
+# Side length of the density image of all GBC points in the color map
+DENSITY_RESOLUTION = 128
 
+# Scale of the image rendered while interacting, for each render backend
+INTERACTIVE_RATIOS = {'gpu': 1, 'cpu': 0.5, 'smart': 0.5}
+
+# Maximum number of voxels sampled to estimate the memory footprint
+FOOTPRINT_SAMPLES = 64**3
+
+# Version of the arrays saved to the dataset store
+STORE_VERSION = 4
+
+# Seconds between updates of the profile summary in the UI
+PROFILE_INTERVAL = 1
+
+# Number of the slowest spans shown in the profile summary
+PROFILE_ROWS = 30
 
 # We will cache downloaded data examples in this directory.
 EXAMPLE_DATA_DIR = Path(__file__).parent.parent.parent / 'data'
@@ -38,7 +126,14 @@ class App(TrameApp):
 
         # CLI
         self.server.cli.add_argument(
-            "--data", help="Path to the file to load", default=None
+            "--data",
+            help=(
+                "Path to the file to load. A time series may be loaded "
+                "from a file pattern (e.g. 'scan_*.h5'), or from an HDF5 "
+                "file with a group per timestep. HDF5 and NPZ files may "
+                "also be read from HTTP(S) URLs."
+            ),
+            default=None,
         )
         self.server.cli.add_argument(
             "--nan", help="Replace NaN to specific value", default=0
@@ -66,6 +161,143 @@ class App(TrameApp):
             help="Set a path to a label map file",
             default=None,
         )
+        self.server.cli.add_argument(
+            "--segment",
+            help=(
+                "Segment the nonzero voxels into phases once the data is "
+                "loaded, and use them as the label map. The voxels are "
+                "clustered by composition or GBC position with mini-batch "
+                "k-means, or by the peaks of their GBC density."
+            ),
+            choices=SEGMENTATION_METHODS,
+            default=None,
+        )
+        self.server.cli.add_argument(
+            "--num-phases",
+            help="Number of phases of `--segment` (the most, for density)",
+            type=int,
+            default=6,
+        )
+        self.server.cli.add_argument(
+            "--latency-target",
+            help=(
+                "Target time (ms) to update the volume while interacting. "
+                "Slower updates first render a coarse preview. "
+                "Use 0 to always render at full resolution."
+            ),
+            type=float,
+            default=100,
+        )
+        self.server.cli.add_argument(
+            "--render-backend",
+            help=(
+                "Volume mapper: 'gpu', 'cpu' (multithreaded ray casting, "
+                "for servers without a GPU), or 'smart' (the GPU if "
+                "available, the CPU otherwise)"
+            ),
+            choices=RENDER_BACKENDS,
+            default='gpu',
+        )
+        self.server.cli.add_argument(
+            "--render-threads",
+            help=(
+                "Number of threads of the CPU backends (all the cores by "
+                "default)"
+            ),
+            type=int,
+            default=None,
+        )
+        self.server.cli.add_argument(
+            "--interactive-ratio",
+            help=(
+                "Scale of the image rendered while interacting with the "
+                "view. Full resolution is rendered on release. Defaults "
+                "to 1 for the GPU backend, and 0.5 otherwise."
+            ),
+            type=float,
+            default=None,
+        )
+        self.server.cli.add_argument(
+            "--store",
+            help=(
+                "Directory of the dataset store. The arrays prepared from "
+                "the data are saved there once, and memory-mapped by every "
+                "process that loads the same data with the same options."
+            ),
+            default=None,
+        )
+        self.server.cli.add_argument(
+            "--remote-cache",
+            help=(
+                "Directory of the cache of the blocks read from URLs, so "
+                "that reopening remote data mostly reads the disk "
+                f"(default: {BLOCK_CACHE.directory})"
+            ),
+            default=None,
+        )
+        self.server.cli.add_argument(
+            "--max-memory",
+            help=(
+                "Memory budget, e.g. 8G. If the data is estimated to need "
+                "more, its prepared arrays are memory-mapped from the "
+                "dataset store (a temporary one without --store), and it "
+                "is decimated if that is not enough."
+            ),
+            default=None,
+        )
+        self.server.cli.add_argument(
+            "--timestep-cache",
+            help=(
+                "Number of prepared timesteps of a time series kept in "
+                "memory, including the displayed one. The adjacent "
+                "timesteps are prepared in the background."
+            ),
+            type=int,
+            default=3,
+        )
+        self.server.cli.add_argument(
+            "--export",
+            help=(
+                "Path that the selected voxels are exported to with the "
+                "download button, as HDF5 (.h5) or NPZ (.npz)"
+            ),
+            default="mv-view-selection.h5",
+        )
+        self.server.cli.add_argument(
+            "--record",
+            help=(
+                "Record the interactions to a session file, which can be "
+                "replayed with `python -m multivariate_view.app.replay`"
+            ),
+            default=None,
+        )
+        self.server.cli.add_argument(
+            "--profile",
+            help=(
+                "Profile the pipeline stages and state callbacks, show a "
+                "summary in the UI, and save a Chrome trace (which can be "
+                "opened in Perfetto) to this path on exit"
+            ),
+            nargs="?",
+            const="mv-view-trace.json",
+            default=None,
+        )
+        self.server.cli.add_argument(
+            "--slab-workers",
+            help=(
+                "Number of worker processes that prepare and color large "
+                "volumes in z-slabs, over shared memory. By default, "
+                "everything runs in this process."
+            ),
+            type=int,
+            default=0,
+        )
+        self.server.cli.add_argument(
+            "--seed",
+            help="Seed for the random sampling of the color map points",
+            type=int,
+            default=None,
+        )
 
         args, _ = self.server.cli.parse_known_args()
         self.enable_preprocessing = args.preprocess
@@ -73,7 +305,33 @@ class App(TrameApp):
         self.normalize_channels = args.normalize_channels
         self.opacity_channel = args.opacity_channel
         self.label_map_file = args.label_map
+        self.sampling_seed = args.seed
+        self.latency_target = args.latency_target / 1000
+        self.store = None if args.store is None else DatasetStore(args.store)
+        if args.remote_cache is not None:
+            BLOCK_CACHE.directory = Path(args.remote_cache)
+        self.render_backend = args.render_backend
+        self.render_threads = args.render_threads
+        self.slab_pool = None
+        if args.slab_workers > 0:
+            self.slab_pool = SlabPool(args.slab_workers)
+        self.interactive_ratio = args.interactive_ratio
+        if self.interactive_ratio is None:
+            self.interactive_ratio = INTERACTIVE_RATIOS[self.render_backend]
+        self.temporary_store = None
+        self.max_memory = None
+        if args.max_memory is not None:
+            self.max_memory = parse_size(args.max_memory)
+        self.profile_path = args.profile
+        self.timestep_cache_size = args.timestep_cache
+        self.export_path = args.export
         self.label_map = None
+        self.label_index = None
+        self.segmentation = args.segment
+        self.num_phases = args.num_phases
+        if self.segmentation is not None and self.label_map_file is not None:
+            msg = 'A label map cannot be given with `--segment`'
+            raise ValueError(msg)
 
         if self.label_map_file is not None:
             # Load the label map
@@ -81,13 +339,15 @@ class App(TrameApp):
             # the padding removed.
             self.label_map = np.load(self.label_map_file)
 
+            # Per-label voxel lists, so selections only touch the
+            # voxels of the labels that changed.
+            self.label_index = build_label_index(self.label_map)
+
         # Set this if you want label map names other than "0, 1, 2, ..."
         self.label_map_names = None
 
-        file_to_load = args.data
-        if file_to_load is None:
-            EXAMPLE_DATA_DIR.mkdir(parents=True, exist_ok=True)
-
+        self.file_to_load = args.data
+        if self.file_to_load is None:
             print(
                 '\nData path was not provided using `--data`'
                 f'\nDefaulting to example: {EXAMPLE_DATA_PATH.name}'
@@ -97,84 +357,430 @@ class App(TrameApp):
             boundary_str = '*' * len(citation_str)
             print(f'\n{boundary_str}\n{citation_str}\n{boundary_str}\n')
 
-            if not EXAMPLE_DATA_PATH.exists():
-                # Automatically download the example dataset, and put it in the
-                # data directory.
-                print(f'Downloading example dataset to: {EXAMPLE_DATA_PATH}')
-                download_file_from_google_drive(
-                    EXAMPLE_GOOGLE_DRIVE_ID, EXAMPLE_DATA_PATH
-                )
+            self.file_to_load = EXAMPLE_DATA_PATH
 
-            file_to_load = EXAMPLE_DATA_PATH
+        self.volume_view = VolumeView(self.render_backend, self.render_threads)
 
-        self.volume_view = VolumeView()
+        # The data is loaded in the background once the server is ready.
+        # Nothing that depends on it may run until it is loaded.
+        self.data_loaded = False
+        self.histograms = None
+        self.selection_histograms = None
 
         self.unrotated_gbc = None
         self.unrotated_components = None
+        self.gbc_sampler = None
+
+        # The cropped data is the only copy of the data. The other arrays
+        # are views of it, or derive from the nonzero voxels. Sparse data
+        # only has a row per voxel of `raw_index`, and `nonzero_rows` are
+        # the rows of the nonzero voxels (their flat indices otherwise).
+        self.raw_data = None
+        self.raw_index = None
+        self.nonzero_rows = None
+        self.channel_names = None
+        self.decimation = 1
+
+        # The width of the padding cropped from every timestep
+        self.padding = None
+
+        # The timesteps of the data, and the prepared timesteps
+        self.timesteps = None
+        self.timestep_cache = None
+        self.current_timestep = 0
+
+        # The `(lo, hi)` values of the channels that are normalized to
+        # 0 and 1. The data is normalized on demand.
+        self.normalization = None
 
         self.gbc_data = None
         self.rgb_data = None
         self.opacity_data = None
 
+        # Coarse levels of the volume, and the one currently displayed
+        # (None for full resolution).
+        self.levels = []
+        self.displayed_level = None
+        self.latency = LatencyModel()
+
+        # Only the nonzero voxels inside the clip box are colored and
+        # uploaded. These are their positions in the nonzero arrays, and
+        # their index within the box.
+        self.clip_box = None
+        self.box_positions = None
+        self.box_index = None
+        self.box_label_index = None
+        self.alpha = None
+
+        # The composition of the voxels in the clip box, over the GBC
+        # plane, for the statistics of the lens
+        self.composition_grid = None
+        self._lens_statistics_key = None
+        self._refine_handle = None
+        self._refine_colors = False
+
+        # The alpha before the table selection is applied, and the
+        # per-label factors currently applied on top of it.
+        self.base_alpha = None
+        self.label_factors = None
+
+        if self.profile_path is not None:
+            PROFILER.enable()
+            atexit.register(self.export_profile)
+
+        self.recorder = None
+        if args.record is not None:
+            self.recorder = SessionRecorder(self.state, args.record)
+
         self.ui = self._build_ui()
-        self.load_data(file_to_load)
-        self.create_table()
 
         if self.server.hot_reload:
             self.ctrl.on_server_reload.add(self._build_ui)
 
     def load_data(self, file_to_load):
-        header, data = load_dataset(Path(file_to_load))
+        # Load and display everything at once, without previews
+        self.timesteps = find_timesteps(file_to_load)
+        timestep = self.timesteps[0]
+        loaded = self.load_stored_data(timestep)
+        if loaded is None:
+            header, data = self.read_data(timestep)
+            header, fields = self.prepare_data(header, data)
+            self.store_data(timestep, header, fields)
+        else:
+            header, fields = loaded
+
+        self.prepare_session()
+        self.show_data(header, fields)
+        if self.needs_segmentation:
+            self.show_segmentation(self.compute_segmentation())
+
+        self.start_timesteps(header, fields)
+
+    @life_cycle.server_ready
+    def start_loading(self, **kwargs):
+        # The kernels run in worker threads while loading
+        start_threading_layer()
+
+        # Compile the kernels while the data is downloaded and read
+        asynchronous.create_task(asyncio.to_thread(warm_up))
+        asynchronous.create_task(self.load_data_async(self.file_to_load))
+
+        if PROFILER.enabled:
+            asynchronous.create_task(self.publish_profile())
+
+    async def publish_profile(self):
+        # Push the summary of the new spans to the UI periodically
+        version = None
+        while True:
+            await asyncio.sleep(PROFILE_INTERVAL)
+            if PROFILER.version == version:
+                continue
+
+            version = PROFILER.version
+            with self.state:
+                self.state.profile_summary = profile_rows(PROFILER.summary())
+
+    def export_profile(self):
+        PROFILER.save_chrome_trace(self.profile_path)
+        print(f'Saved the profile trace to: {self.profile_path}')
+
+    def clear_profile(self):
+        PROFILER.clear()
+
+    async def load_data_async(self, file_to_load):
+        """Load the data in the background, reporting progress in the state
+
+        The work that does not touch the state or the view runs in worker
+        threads. A decimated preview is rendered as soon as the data is
+        read, and replaced once the full resolution pipeline finishes.
+        """
+        if needs_example_download(file_to_load):
+            self.set_loading_stage('Downloading example dataset', 0)
+        else:
+            self.set_loading_stage('Reading data', 0)
+
+        try:
+            self.timesteps = await asyncio.to_thread(
+                find_timesteps, file_to_load
+            )
+            timestep = self.timesteps[0]
+            loaded = await asyncio.to_thread(self.load_stored_data, timestep)
+            if loaded is None:
+                header, fields = await self._read_and_prepare(timestep)
+            else:
+                header, fields = loaded
+
+            await asyncio.to_thread(self.prepare_session)
+
+            self.set_loading_stage('Rendering full resolution', 90)
+            with self.state:
+                self.show_data(header, fields)
+                if self.displayed_level is None:
+                    self.initial_reset_camera()
+
+                self.state.loading = False
+
+            if self.needs_segmentation:
+                # The phases are shown once they are ready
+                label_map = await asyncio.to_thread(self.compute_segmentation)
+                with self.state:
+                    self.show_segmentation(label_map)
+        except Exception as e:
+            self.set_loading_stage(f'Failed to load the data: {e}', 0)
+            raise
+
+        self.start_timesteps(header, fields)
+
+    async def _read_and_prepare(self, timestep):
+        header, data = await asyncio.to_thread(self.read_data, timestep)
+
+        self.set_loading_stage('Rendering preview', 30)
+        preview = await asyncio.to_thread(self.compute_preview, header, data)
+        if preview is not None:
+            with self.state:
+                self.render_level(preview)
+                self.initial_reset_camera()
+
+        self.set_loading_stage('Processing full resolution', 50)
+        header, fields = await asyncio.to_thread(
+            self.prepare_data, header, data
+        )
+        await asyncio.to_thread(self.store_data, timestep, header, fields)
+        return header, fields
+
+    def set_loading_stage(self, message, progress):
+        with self.state:
+            self.state.loading = True
+            self.state.loading_message = message
+            self.state.loading_progress = progress
+
+    @profiled(category='stage')
+    def read_data(self, timestep):
+        if needs_example_download(timestep.path):
+            download_example_data()
+
+        header, data = timestep.load()
+        if isinstance(data, SparseVolume):
+            return header, self.crop_sparse_data(timestep, data)
 
         # Handle NaN if provided
         if self.nan_replacement is not None:
             data[np.isnan(data)] = float(self.nan_replacement)
 
-        # Remove padding so it will render faster.
-        # This removes faces that are all zeros recursively until
-        # the first non-zero voxel is hit.
-        # Our sample data has a *lot* of padding.
-        data = _remove_padding_uniform(data)
+        if self.padding is None:
+            # Remove padding so it will render faster.
+            # This removes faces that are all zeros recursively until
+            # the first non-zero voxel is hit.
+            # Our sample data has a *lot* of padding.
+            cropped = remove_padding_uniform(data)
+            self.padding = padding_width(data, cropped)
+            data = self.fit_memory_budget(cropped)
+        else:
+            # The other timesteps are cropped and decimated like the
+            # first one, so every timestep has the same shape.
+            f = self.decimation
+            data = crop_padding(data, self.padding)[::f, ::f, ::f]
+            if data.shape[:3] != self.data_shape:
+                msg = (
+                    f'Timestep {timestep} has the shape {data.shape[:3]} '
+                    f'once cropped, but the first has {self.data_shape}'
+                )
+                raise ValueError(msg)
+
+        # Copy the cropped data, so the uncropped data is released
+        return header, np.ascontiguousarray(data)
+
+    def crop_sparse_data(self, timestep, data):
+        # Like `read_data`, without materializing the volume
+        if self.opacity_channel is not None:
+            msg = 'An opacity channel is not supported with sparse data'
+            raise ValueError(msg)
+
+        if self.nan_replacement is not None:
+            values = data.values
+            values[np.isnan(values)] = float(self.nan_replacement)
+
+        if self.padding is None:
+            self.padding = data.padding_width()
+            return self.fit_memory_budget(data.crop(self.padding))
+
+        data = data.crop(self.padding).decimate(self.decimation)
+        if data.shape[:3] != self.data_shape:
+            msg = (
+                f'Timestep {timestep} has the shape {data.shape[:3]} '
+                f'once cropped, but the first has {self.data_shape}'
+            )
+            raise ValueError(msg)
+
+        return data
+
+    def fit_memory_budget(self, data):
+        """Decimate the cropped data if it does not fit in `--max-memory`
+
+        If the data does not fit in memory, the prepared arrays are
+        memory-mapped from the dataset store (a temporary one if none was
+        given) first. The data is only decimated if that is not enough.
+        """
+        if self.max_memory is None:
+            return data
+
+        shape = data.shape[:3]
+        num_voxels = int(np.prod(shape))
+
+        sparse = isinstance(data, SparseVolume)
+        if sparse:
+            # Every voxel of sparse data is counted
+            lo, hi = data.normalization_ranges(self.normalize_channels)
+            nonzero = normalized_nonzero_voxels(data.values, lo, hi)
+            nonzero_fraction = np.count_nonzero(nonzero) / num_voxels
+        else:
+            # Estimate the fraction of nonzero voxels from a sample
+            lo, hi = normalization_ranges(data, self.normalize_channels)
+            step = int(np.ceil((num_voxels / FOOTPRINT_SAMPLES) ** (1 / 3)))
+            sample = data[::step, ::step, ::step].reshape(-1, data.shape[-1])
+            nonzero_fraction = normalized_nonzero_voxels(sample, lo, hi).mean()
+
+        options = {
+            'num_channels': data.shape[-1],
+            'itemsize': data.dtype.itemsize,
+            'nonzero_fraction': nonzero_fraction,
+            'label_map': self.has_label_map,
+            'sparse': sparse,
+        }
+        footprint = estimate_footprint(num_voxels, **options)
+        if footprint <= self.max_memory:
+            return data
+
+        if self.store is None:
+            self.temporary_store = tempfile.TemporaryDirectory(
+                prefix='mv-view-'
+            )
+            self.store = DatasetStore(self.temporary_store.name)
+
+        factor = choose_decimation(
+            shape, self.max_memory, mapped=True, **options
+        )
+        print(
+            f'The data needs about {format_size(footprint)}, over the '
+            f'memory budget of {format_size(self.max_memory)}. '
+            'Its prepared arrays are memory-mapped'
+            + (f', and it is decimated by {factor}.' if factor > 1 else '.')
+        )
+
+        self.set_decimation(factor)
+        if sparse:
+            return data.decimate(factor)
+
+        return data[::factor, ::factor, ::factor]
 
+    def set_decimation(self, factor):
+        # The label map must match the decimated data
+        if factor > 1 and self.label_map is not None:
+            self.label_map = np.ascontiguousarray(
+                self.label_map[::factor, ::factor, ::factor]
+            )
+            self.label_index = build_label_index(self.label_map)
+
+        self.decimation = factor
+
+    @profiled(category='stage')
+    def compute_preview(self, header, data):
+        """Decimate the cropped data for a first preview
+
+        The decimation factor keeps the preview under `PREVIEW_VOXELS`.
+        None is returned if the data is already small enough.
+        """
+        if isinstance(data, SparseVolume):
+            # Sparse data is prepared in time proportional to its voxels
+            return None
+
+        num_voxels = np.prod(data.shape[:3])
+        factor = int(np.ceil((num_voxels / PREVIEW_VOXELS) ** (1 / 3)))
+        if factor <= 1:
+            return None
+
+        data = data[::factor, ::factor, ::factor]
+        if self.opacity_channel is not None:
+            data = np.delete(data, header.index(self.opacity_channel), axis=3)
+
+        data = self.normalize_data(np.ascontiguousarray(data))
+        flattened_data = data.reshape(-1, data.shape[-1])
+        index = build_voxel_index(
+            nonzero_voxels(flattened_data), data.shape[:3]
+        )
+        nonzero_data = index.gather(flattened_data)
+        gbc, _ = compute_gbc(nonzero_data)
+
+        return PyramidLevel(factor, data.shape[:3], index, nonzero_data, gbc)
+
+    def normalize_data(self, data):
+        return normalize_channels(data, self.normalize_channels)
+
+    @profiled(category='stage')
+    def prepare_data(self, header, data):
+        """Compute everything that derives from the data, and use it
+
+        This does not modify the state or the view, so it may run in a
+        worker thread. The header (without the opacity channel) and the
+        data channel fields are returned.
+        """
+        metadata, arrays = self.compute_prepared_data(header, data)
+        self.set_stored_data(metadata, arrays)
+        self.selection_histograms = None
+        return metadata['header'], metadata['fields']
+
+    def compute_prepared_data(self, header, data):
+        """Compute the metadata and the arrays that derive from the data
+
+        Nothing is modified, so this may prepare a timestep while another
+        one is displayed.
+        """
+        header = list(header)
+        opacity_data = None
         if self.opacity_channel is not None:
             # Extract the opacity data
             opacity_idx = header.index(self.opacity_channel)
-            self.opacity_data = _normalize_data(data[:, :, :, opacity_idx])
+            opacity_data = normalize_data(data[:, :, :, opacity_idx])
 
             # Set all data less than 80% to 0, and then re-normalize
-            # self.opacity_data[self.opacity_data < 0.8] = 0
-            # self.opacity_data = _normalize_data(self.opacity_data**5)
+            # opacity_data[opacity_data < 0.8] = 0
+            # opacity_data = normalize_data(opacity_data**5)
 
             header.pop(opacity_idx)
             data = np.delete(data, opacity_idx, axis=3)
 
-        self.state.component_labels = header
-
-        # Remember the data shape (without the multichannel part)
-        self.data_shape = data.shape[:-1]
-        self.num_channels = data.shape[-1]
-
-        self.raw_unpadded_flattened_data = data.reshape(
-            np.prod(self.data_shape), self.num_channels
-        )
-
-        if self.normalize_channels:
-            # Normalize each channel to be between 0 and 1
-            for i in range(data.shape[-1]):
-                data[:, :, :, i] = _normalize_data(data[:, :, :, i])
+        raw_index = None
+        if isinstance(data, SparseVolume):
+            raw_index = data.index
+            flattened_data = data.values
+            normalization = data.normalization_ranges(self.normalize_channels)
         else:
-            data = _normalize_data(data)
+            flattened_data = data.reshape(-1, data.shape[-1])
+            normalization = normalization_ranges(data, self.normalize_channels)
+
+        # Bin every channel once. The displayed histograms, and the
+        # histograms of the selection, are computed from this binning.
+        histograms = HistogramCache(flattened_data)
 
         fields = None
         if self.enable_preprocessing:
-            self.arrays_raw = {}
-            fields = {}
+            # Normalizing preserves the order of the values
+            if raw_index is None:
+                axes = tuple(range(data.ndim - 1))
+                channel_ranges = (
+                    np.nanmin(data, axis=axes),
+                    np.nanmax(data, axis=axes),
+                )
+            else:
+                channel_ranges = data.channel_ranges()
 
-            all_zero_voxels = np.all(np.isclose(data, 0), axis=3)
+            min_vals, max_vals = (
+                normalize_rows(x, *normalization) for x in channel_ranges
+            )
+            fields = {}
             for idx, name in enumerate(header):
-                array = data[:, :, :, idx]
-                min_val = np.nanmin(array)
-                max_val = np.nanmax(array)
+                min_val = float(min_vals[idx])
+                max_val = float(max_vals[idx])
                 fields[name] = {
                     "label": name,
                     "data_range": [min_val, max_val],
@@ -184,24 +790,282 @@ class App(TrameApp):
                     "color": "black",
                 }
 
-                # Save array for later processing
-                self.arrays_raw[name] = array
+        # Only store the normalized nonzero data, and the indices of the
+        # nonzero voxels. We will reconstruct the zeros later.
+        if raw_index is None and self.use_slab_pool(len(flattened_data)):
+            slabs = self.slab_pool.prepare(data, *normalization)
+            nonzero_data = slabs['nonzero_data']
+            gbc_arrays = self.gbc_arrays(
+                slabs['gbc'], slabs['components'], slabs['nonzero_means']
+            )
+            voxel_index = VoxelIndex(data.shape[:-1], slabs['nonzero_indices'])
+        else:
+            voxel_index, rows = index_rows(
+                normalized_nonzero_voxels(flattened_data, *normalization),
+                raw_index,
+                data.shape[:-1],
+            )
+            nonzero_data = normalize_rows(
+                rows.gather(flattened_data), *normalization
+            )
+            gbc_arrays = self.compute_gbc_arrays(nonzero_data)
+
+        arrays = {
+            'raw_data': data if raw_index is None else data.values,
+            'normalization_lo': normalization[0],
+            'normalization_hi': normalization[1],
+            'nonzero_indices': voxel_index.indices,
+            'nonzero_data': nonzero_data,
+            **gbc_arrays,
+            'histogram_counts': histograms.counts,
+            'histogram_bins': histograms.bins,
+            'histogram_edges': histograms.edges,
+        }
+        if opacity_data is not None:
+            arrays['opacity_data'] = opacity_data
+
+        if raw_index is not None:
+            arrays['raw_indices'] = raw_index.indices
+            arrays['nonzero_rows'] = rows.indices
+
+        metadata = self.prepared_metadata(header, fields, data.shape[:-1])
+        return metadata, arrays
+
+    @property
+    def raw_unpadded_flattened_data(self):
+        # A view of the data, with a row per voxel (of `raw_index`)
+        return self.raw_data.reshape(-1, self.num_channels)
+
+    def store_key(self, timestep):
+        return self.store.key(
+            timestep.path,
+            group=timestep.group,
+            version=STORE_VERSION,
+            nan=self.nan_replacement,
+            normalize_channels=self.normalize_channels,
+            opacity_channel=self.opacity_channel,
+            max_memory=self.max_memory,
+        )
+
+    @property
+    def prepared_arrays(self):
+        # The arrays that only depend on the data and the CLI options
+        arrays = {
+            'raw_data': self.raw_data,
+            'normalization_lo': self.normalization[0],
+            'normalization_hi': self.normalization[1],
+            'nonzero_indices': self.voxel_index.indices,
+            'nonzero_data': self.nonzero_data,
+            'nonzero_means': self.nonzero_means,
+            'gbc': self.unrotated_gbc,
+            'components': self.unrotated_components,
+            'density': self.density,
+            'histogram_counts': self.histograms.counts,
+            'histogram_bins': self.histograms.bins,
+            'histogram_edges': self.histograms.edges,
+        }
+        if self.opacity_data is not None:
+            arrays['opacity_data'] = self.opacity_data
+
+        if self.raw_index is not None:
+            arrays['raw_indices'] = self.raw_index.indices
+            arrays['nonzero_rows'] = self.nonzero_rows
+
+        return arrays
+
+    def set_prepared_arrays(self, arrays):
+        self.raw_data = arrays['raw_data']
+        self.raw_index = None
+        if 'raw_indices' in arrays:
+            self.raw_index = VoxelIndex(self.data_shape, arrays['raw_indices'])
+
+        self.normalization = (
+            arrays['normalization_lo'],
+            arrays['normalization_hi'],
+        )
+        self.voxel_index = VoxelIndex(
+            self.data_shape, arrays['nonzero_indices']
+        )
+        self.nonzero_rows = arrays.get(
+            'nonzero_rows', self.voxel_index.indices
+        )
+        self.nonzero_data = arrays['nonzero_data']
+        self.nonzero_means = arrays['nonzero_means']
+        self.unrotated_gbc = arrays['gbc']
+        self.unrotated_components = arrays['components']
+        self.density = arrays['density']
+        self.histograms = HistogramCache.from_arrays(
+            arrays['histogram_counts'],
+            arrays['histogram_bins'],
+            arrays['histogram_edges'],
+        )
+        self.opacity_data = arrays.get('opacity_data')
+
+    @profiled(category='stage')
+    def load_stored_data(self, timestep):
+        """Memory-map the prepared arrays from the store
+
+        The header and fields are returned, or None if the data was not
+        stored yet. This may run in a worker thread.
+        """
+        stored = self.stored_data(timestep)
+        if stored is None:
+            return None
+
+        metadata, arrays = stored
+        self.set_stored_data(metadata, arrays)
+        return metadata['header'], metadata['fields']
+
+    def stored_data(self, timestep):
+        # The stored metadata and arrays, or None
+        if self.store is None or needs_example_download(timestep.path):
+            return None
+
+        return self.store.load(self.store_key(timestep))
+
+    @profiled(category='stage')
+    def store_data(self, timestep, header, fields):
+        """Save the prepared arrays, and use the memory-mapped copies
+
+        This may run in a worker thread.
+        """
+        if self.store is None:
+            return
+
+        metadata = self.prepared_metadata(header, fields, self.data_shape)
+        metadata, arrays = self.store.save(
+            self.store_key(timestep), metadata, self.prepared_arrays
+        )
+        self.set_stored_data(metadata, arrays)
+
+    def prepared_metadata(self, header, fields, data_shape):
+        return {
+            'header': header,
+            'fields': fields,
+            'data_shape': list(data_shape),
+            'decimation': self.decimation,
+            'padding': self.padding,
+        }
+
+    def set_stored_data(self, metadata, arrays):
+        self.data_shape = tuple(metadata['data_shape'])
+        self.channel_names = metadata['header']
+        self.padding = metadata['padding']
+        self.set_prepared_arrays(arrays)
+        self.num_channels = self.nonzero_data.shape[1]
+        if self.decimation != metadata['decimation']:
+            self.set_decimation(metadata['decimation'])
+
+    @profiled(category='stage')
+    def show_data(self, header, fields):
+        """Push the prepared data to the state and the view"""
+        first_load = not self.data_loaded
+        self.state.component_labels = header
 
         # Provide control on data arrays
         self.state.data_channels = fields
 
-        # Store the data in a flattened form. It is easier to work with.
-        flattened_data = data.reshape(
-            np.prod(self.data_shape), self.num_channels
+        self.data_loaded = True
+        self.show_gbc_data()
+        self.create_table()
+
+        if fields:
+            self.update_histograms(self.state.use_log_histogram)
+            self.state.dirty("data_channels")
+
+        if not first_load:
+            return
+
+        if self.recorder is not None:
+            # Only record the changes made after loading
+            self.state.flush()
+            self.recorder.start()
+
+        if self.max_memory is not None:
+            print(format_report(memory_report(self.memory_arrays)))
+
+    @property
+    def memory_arrays(self):
+        # The large arrays, named like in `memory.estimate_arrays`
+        arrays = {
+            'raw_data': self.raw_data,
+            'raw_flattened_data': self.raw_unpadded_flattened_data,
+            'raw_indices': (
+                None if self.raw_index is None else self.raw_index.indices
+            ),
+            'opacity_data': self.opacity_data,
+            'histogram_bins': self.histograms.bins,
+            'nonzero_indices': self.voxel_index.indices,
+            'nonzero_rows': self.nonzero_rows,
+            'nonzero_data': self.nonzero_data,
+            'nonzero_means': self.nonzero_means,
+            'gbc': self.unrotated_gbc,
+            'sampler_permutation': self.gbc_sampler.permutation,
+            'box_positions': self.box_positions,
+            'box_indices': self.box_index.indices,
+            'gbc_data': self.gbc_data,
+            'rgb_data': self.rgb_data,
+            'alpha': self.alpha,
+            'base_alpha': self.base_alpha,
+            'volume_rgba': self.volume_view.volume_reference,
+            'volume_mask': self.volume_view.mask_reference,
+        }
+        for level in self.levels:
+            arrays[f'level_{level.factor}_data'] = level.nonzero_data
+            arrays[f'level_{level.factor}_gbc'] = level.gbc
+
+        if self.composition_grid is not None:
+            arrays['composition_order'] = self.composition_grid.order
+
+        if self.label_index is not None:
+            arrays['label_map'] = self.label_map
+            arrays['label_index'] = self.label_index.indices
+
+        return arrays
+
+    @property
+    def has_label_map(self):
+        # Whether there is a label map, or will be once segmented
+        return self.label_map is not None or self.segmentation is not None
+
+    @property
+    def needs_segmentation(self):
+        return self.segmentation is not None and self.label_map is None
+
+    @profiled(category='stage')
+    def compute_segmentation(self):
+        """Segment the nonzero voxels into phases, as a label map
+
+        The zero voxels are labeled 0. This may run in a worker thread.
+        """
+        clusters = segment_voxels(
+            self.segmentation,
+            self.nonzero_data,
+            self.unrotated_gbc,
+            self.num_phases,
+            seed=self.sampling_seed,
+        )
+        return segmentation_label_map(
+            self.voxel_index, clusters, self.num_phases
         )
-        self.nonzero_indices = ~np.all(np.isclose(flattened_data, 0), axis=1)
 
-        # Only store nonzero data. We will reconstruct the zeros later.
-        self.nonzero_data = flattened_data[self.nonzero_indices]
+    @profiled(category='stage')
+    def show_segmentation(self, label_map):
+        """Use the phases as the label map, in the table and selections"""
+        self.label_map = label_map
+        self.label_index = build_label_index(label_map)
+        self.label_map_names = [
+            f'Phase {value}' for value in self.label_index.values
+        ]
+        if self.clip_box is not None:
+            self.box_label_index = build_label_index(label_map[self.clip_box])
 
-        # Trigger an update of the data
-        self.update_gbc()
+        self.create_table()
 
+        # Keep the alpha that the table selection scales
+        self.update_volume_data()
+
+    @profiled(category='stage')
     def create_table(self):
         if self.label_map is None:
             # Nothing to do
@@ -218,35 +1082,20 @@ class App(TrameApp):
 
         table_content = []
 
-        label_values = np.unique(self.label_map)
+        label_values = self.label_index.values
 
-        data = self.raw_unpadded_flattened_data.reshape(
-              (*self.data_shape, self.num_channels)
-        )
-        if self.normalize_channels:
-            # Normalize all channels separately
-            for i in range(data.shape[-1]):
-                data[:, :, :, i] = _normalize_data(data[:, :, :, i])
-        else:
-            # Normalize them all together
-            data = _normalize_data(data)
+        # Calculate the percent of each element
+        means = self.label_means()
 
         if self.label_map_names:
             labels = self.label_map_names
         else:
             labels = list(map(str, label_values))
 
-        for name, value in zip(labels, label_values):
-            # Calculate the percent of each element
-            matching_voxels = data[self.label_map == value]
-
-            # Remove voxels that are all close to zero
-            matching_voxels = matching_voxels[
-                ~np.all(np.isclose(matching_voxels, 0), axis=1)]
-
-            mean_values = matching_voxels.mean(axis=0)
-            # Get each mean to add up to 1
-            mean_values /= mean_values.sum()
+        for name, value, mean_values in zip(labels, label_values, means):
+            if value == 0 and self.segmentation is not None:
+                # The zero voxels are not a phase
+                continue
 
             row = {"id": value.item(), "name": name}
             for i in range(len(self.state.component_labels)):
@@ -257,156 +1106,604 @@ class App(TrameApp):
         self.state.table_headers = table_headers
         self.state.table_content = table_content
 
-    def update_histograms(self, use_log_histogram):
-        # histogram always use the full spectrum of the data
-        # TODO: should we then store the two instances (log/non-log) instead of re-calculating ?
-        nonzero_indices = ~np.all(
-            np.isclose(self.raw_unpadded_flattened_data, 0), axis=1
+    def label_means(self):
+        if self.raw_index is None:
+            return label_means(
+                self.raw_unpadded_flattened_data,
+                self.label_index,
+                self.normalization,
+            )
+
+        # The label index of the rows of the sparse data. The voxels that
+        # are not listed are zero, and ignored.
+        row_labels = build_label_index(
+            self.raw_index.gather(self.label_map.ravel())
+        )
+        means = np.zeros((len(self.label_index), self.num_channels))
+        positions = np.searchsorted(self.label_index.values, row_labels.values)
+        means[positions] = label_means(
+            self.raw_unpadded_flattened_data, row_labels, self.normalization
         )
-        nonzero_data = self.raw_unpadded_flattened_data[nonzero_indices]
+        return means
 
-        for idx, name in enumerate(self.state.component_labels):
-            histogram_array = nonzero_data[:, idx]
-            hist_count = np.histogram(histogram_array, bins=200)[0].astype(
-                float
+    @profiled(category='stage')
+    def update_histograms(self, use_log_histogram):
+        # histogram always use the full spectrum of the data
+        counts = self.histograms.counts
+        for idx, name in enumerate(self.state.data_channels):
+            self.state.data_channels[name]['histogram'] = uint8_buffer(
+                scale_histogram(counts[idx], use_log_histogram)
             )
 
-            zero_counts = np.isclose(hist_count, 0)
-            # Perform log scaling, as that is easier to see. Ignore zeros.
-            if use_log_histogram:
-                hist_count[~zero_counts] = np.log10(hist_count[~zero_counts])
-            max_count = hist_count.max()
-            hist = [int(v / max_count * 100) for v in hist_count.tolist()]
-            self.state.data_channels[name]['histogram'] = hist
+        self.update_selection_histograms()
+
+    @profiled(category='stage')
+    def update_selection_histograms(self, alpha=None):
+        if self.selection_histograms is None or not self.tune_data_enabled:
+            return
+
+        if alpha is None:
+            counts = self.selection_histograms.counts
+        else:
+            counts = self.selection_histograms.update(alpha)
+
+        if counts is None:
+            return
+
+        use_log = self.state.use_log_histogram
+        reference = self.histograms.counts
+        self.state.selection_histograms = {
+            name: uint8_buffer(
+                scale_histogram(counts[idx], use_log, reference[idx])
+            )
+            for idx, name in enumerate(self.state.data_channels)
+        }
 
     def update_gbc(self):
-        gbc, components = compute_gbc(self.nonzero_data)
+        self.compute_gbc_data()
+        self.prepare_session()
+        self.show_gbc_data()
+
+    @profiled(category='stage')
+    def compute_gbc_data(self):
+        # Everything that derives from the GBC. This may run in a thread.
+        arrays = self.compute_gbc_arrays(self.nonzero_data)
+        self.unrotated_gbc = arrays['gbc']
+        self.unrotated_components = arrays['components']
+        self.density = arrays['density']
+        self.nonzero_means = arrays['nonzero_means']
+
+    def compute_gbc_arrays(self, nonzero_data):
+        gbc, components = compute_gbc(nonzero_data)
+        return self.gbc_arrays(gbc, components, nonzero_data.mean(axis=1))
+
+    def gbc_arrays(self, gbc, components, nonzero_means):
+        return {
+            'gbc': gbc,
+            'components': components,
+            # The density of every point. The client rotates the image.
+            'density': compute_density(gbc, DENSITY_RESOLUTION),
+            # The default opacity of every voxel
+            'nonzero_means': nonzero_means,
+        }
+
+    def use_slab_pool(self, num_rows):
+        return self.slab_pool is not None and self.slab_pool.handles(num_rows)
+
+    @profiled(category='stage')
+    def prepare_session(self):
+        # The buffers of this session that derive from the GBC.
+        # This may run in a thread.
+        self.set_session(
+            self.compute_session(
+                self.unrotated_gbc,
+                self.voxel_index.indices,
+                self.nonzero_rows,
+                self.nonzero_data,
+                self.histograms,
+            )
+        )
 
-        self.unrotated_gbc = gbc
-        self.state.unrotated_component_coords = components.tolist()
+    def compute_session(
+        self, gbc, flat_indices, rows, nonzero_data, histograms
+    ):
+        return {
+            'histograms': histograms,
+            # Shuffle the points once. Samples are prefixes of the
+            # permutation.
+            'gbc_sampler': GBCSampler(gbc, seed=self.sampling_seed),
+            # Downsample the new data for previews
+            'levels': [
+                build_level(flat_indices, nonzero_data, self.data_shape, f)
+                for f in PYRAMID_FACTORS
+            ],
+            # The voxels that may be selected have changed
+            'selection_histograms': SelectionHistograms(histograms, rows),
+        }
+
+    def set_session(self, session):
+        self.gbc_sampler = session['gbc_sampler']
+        self.levels = session['levels']
+        self.selection_histograms = session['selection_histograms']
+        self.histograms = session['histograms']
+        self.clip_box = None
+
+    def start_timesteps(self, header, fields):
+        """Prefetch the timesteps adjacent to the first one"""
+        self.state.num_timesteps = len(self.timesteps)
+        if len(self.timesteps) == 1:
+            return
+
+        self.timestep_cache = TimestepCache(
+            self.prepare_timestep, self.timestep_cache_size
+        )
+        self.timestep_cache.put(0, self.current_timestep_data(header, fields))
+        self.prefetch_timesteps(0)
+
+    def current_timestep_data(self, header, fields):
+        metadata = self.prepared_metadata(header, fields, self.data_shape)
+        session = {
+            'histograms': self.histograms,
+            'gbc_sampler': self.gbc_sampler,
+            'levels': self.levels,
+            'selection_histograms': self.selection_histograms,
+        }
+        return copy.deepcopy(metadata), self.prepared_arrays, session
+
+    @profiled(category='stage')
+    def prepare_timestep(self, index):
+        """Prepare a timestep, without changing the displayed one
+
+        This runs in the prefetch worker. The metadata, the prepared
+        arrays and the session of the timestep are returned.
+        """
+        timestep = self.timesteps[index]
+        stored = self.stored_data(timestep)
+        if stored is None:
+            header, data = self.read_data(timestep)
+            stored = self.compute_prepared_data(header, data)
+            if self.store is not None:
+                stored = self.store.save(self.store_key(timestep), *stored)
+
+        metadata, arrays = stored
+        histograms = HistogramCache.from_arrays(
+            arrays['histogram_counts'],
+            arrays['histogram_bins'],
+            arrays['histogram_edges'],
+        )
+        session = self.compute_session(
+            arrays['gbc'],
+            arrays['nonzero_indices'],
+            arrays.get('nonzero_rows', arrays['nonzero_indices']),
+            arrays['nonzero_data'],
+            histograms,
+        )
+        return metadata, arrays, session
+
+    def prefetch_timesteps(self, index):
+        # The next timestep is more likely to be shown than the previous
+        adjacent = [index - 1, index + 1]
+        self.timestep_cache.prefetch(
+            [i for i in adjacent if 0 <= i < len(self.timesteps)]
+        )
+
+    @change('timestep')
+    @profiled(category='callback')
+    def on_timestep_change(self, timestep, **kwargs):
+        if not self.data_loaded or timestep == self.current_timestep:
+            return
+
+        asynchronous.create_task(self.show_timestep_async(timestep))
+
+    async def show_timestep_async(self, index):
+        """Swap to a prepared timestep, waiting for it if needed"""
+        future = self.timestep_cache.get(index)
+        if not future.done():
+            self.set_loading_stage(f'Preparing timestep {index + 1}', 50)
+
+        try:
+            prepared = await asyncio.wrap_future(future)
+        except Exception as e:
+            self.set_loading_stage(f'Failed to load timestep: {e}', 0)
+            raise
+
+        if index != self.state.timestep:
+            # Another timestep was chosen meanwhile
+            return
+
+        with self.state:
+            self.show_timestep(index, prepared)
+            self.state.loading = False
+
+    @profiled(category='stage')
+    def show_timestep(self, index, prepared):
+        """Show a prepared timestep, and prefetch the adjacent ones
+
+        Only the arrays change. The clipping, the lens, the rotation and
+        the other settings of the session are kept.
+        """
+        metadata, arrays, session = prepared
+        self.set_stored_data(metadata, arrays)
+        self.set_session(session)
+        self.current_timestep = index
+
+        # The channels are reset to those of the timestep, which must not
+        # trigger `on_data_change`. Their fields are modified by the state.
+        self.state.array_modified = ''
+        self.show_data(metadata['header'], copy.deepcopy(metadata['fields']))
+        self.prefetch_timesteps(index)
+
+    @profiled(category='stage')
+    def show_gbc_data(self):
+        self.state.unrotated_component_coords = float32_buffer(
+            self.unrotated_components
+        )
+        self.state.density_image = density_to_image(self.density)
 
         self.update_bin_data()
         self.update_voxel_colors()
 
     @change('use_log_histogram')
+    @profiled(category='callback')
     def on_use_log_histogram(self, use_log_histogram, **kwargs):
+        if not self.data_loaded:
+            return
+
         self.update_histograms(use_log_histogram)
         # make data_channels dirty so that the UI element of the histogram is updated
         self.state.dirty("data_channels")
 
-    @change('w_bins', 'w_sample_size')
+    @change('w_bins', 'w_sample_size', 'w_stratified_sampling')
+    @profiled(category='callback')
     def update_bin_data(self, **kwargs):
+        if not self.data_loaded:
+            return
+
         num_samples = self.state.w_sample_size
         num_bins = self.state.w_bins
 
-        # Perform random sampling
-        sample_idx = np.random.choice(
-            len(self.unrotated_gbc), size=num_samples
+        unrotated_bin_data = self.gbc_sampler.bin_data(
+            num_bins,
+            num_samples,
+            stratified=self.state.w_stratified_sampling,
         )
-        data = self.unrotated_gbc[sample_idx]
-        unrotated_bin_data = data_topology_reduction(data, num_bins)
-        self.state.unrotated_bin_data = unrotated_bin_data.tolist()
+        self.state.unrotated_bin_data = float32_buffer(unrotated_bin_data)
 
     @change('w_rotation')
+    @profiled(category='callback')
+    def on_rotation_change(self, **kwargs):
+        # The lens moves relative to the voxels
+        self.update_displayed_voxel_means()
+        self.progressive_update(colors=True)
+
+    @profiled(category='stage')
     def update_voxel_colors(self, **kwargs):
-        angle = np.radians(self.state.w_rotation)
-        gbc = rotate_coordinates(self.unrotated_gbc, angle)
+        self.update_clip_box()
 
-        self.gbc_data = gbc
-        self.rgb_data = gbc_to_rgb(gbc)
+        angle = np.radians(self.state.w_rotation)
+        unrotated = self.unrotated_gbc[self.box_positions]
+        if self.use_slab_pool(len(unrotated)):
+            self.gbc_data, self.rgb_data = self.slab_pool.colors(
+                unrotated, angle
+            )
+        else:
+            self.gbc_data = rotate_coordinates(unrotated, angle)
+            self.rgb_data = gbc_to_rgb(self.gbc_data)
 
         self.update_volume_data()
 
-    @change(
-        "table_selection",
-        "unselected_opacity_multiplier",
-    )
+    def update_clip_box(self):
+        box = clip_box(self.data_shape, self.clip_ranges)
+        if box == self.clip_box:
+            return
+
+        self.clip_box = box
+        self.box_positions, box_indices = voxels_in_box(
+            self.voxel_index.indices, self.data_shape, box
+        )
+        self.box_index = VoxelIndex(box_shape(box), box_indices)
+        self.composition_grid = None
+        self._lens_statistics_key = None
+
+        if self.label_index is not None:
+            self.box_label_index = build_label_index(self.label_map[box])
+
+    @profiled(category='stage')
     def update_volume_data(self, **kwargs):
         if any(x is None for x in (self.rgb_data, self.gbc_data)):
             return
 
+        start = time.perf_counter()
         rgb = self.rgb_data
+        shape = box_shape(self.clip_box)
+        box_index = self.box_index
+
+        self.base_alpha = None
+        self.label_factors = None
+        if len(box_index) == 0:
+            # The box is empty, or has no nonzero voxels, so there is
+            # nothing to scatter
+            self.volume_view.set_data(
+                np.zeros((*shape, 4)), offset=box_offset(self.clip_box)
+            )
+            self.displayed_level = None
+            self.update_mask_data()
+            return
 
-        # Reconstruct full data with rgba values
-        full_data = np.zeros((np.prod(self.data_shape), 4))
-        full_data[self.nonzero_indices, :3] = rgb.T
+        # Reconstruct the data in the clip box with rgba values
+        full_data = np.zeros((np.prod(shape), 4))
+        box_index.scatter(rgb.T, full_data[:, :3])
 
         if self.opacity_data is None:
             # Make nonzero voxels have an alpha of the mean of the channels.
-            full_data[self.nonzero_indices, 3] = self.nonzero_data.mean(axis=1)
-            if self.state.table_selection:
-                idx = self.state.table_selection[0]
-                # Significantly decrease opacity of non-selected voxels
-                selected_voxels = self.label_map == idx
-                multiplier = self.state.unselected_opacity_multiplier
-                full_data[~selected_voxels.flatten(), 3] *= multiplier
+            means = self.nonzero_means[self.box_positions]
+            box_index.scatter(means, full_data[:, 3])
+            if self.label_index is not None:
+                # Remember the alpha so selections can be re-applied
+                self.base_alpha = full_data[:, 3].copy()
+                self.label_factors = self.current_label_factors
+                apply_label_factors(
+                    full_data[:, 3],
+                    self.base_alpha,
+                    self.box_label_index,
+                    self.label_factors,
+                    np.ones(len(self.box_label_index)),
+                )
         else:
-            full_data[self.nonzero_indices, 3] = self.opacity_data.flatten()[
-                self.nonzero_indices
-            ]
+            opacity = self.opacity_data[self.clip_box].ravel()
+            box_index.scatter(box_index.gather(opacity), full_data[:, 3])
 
-        full_data = full_data.reshape((*self.data_shape, 4))
+        full_data = full_data.reshape((*shape, 4))
 
         # Set the data on the volume
-        self.volume_view.set_data(full_data)
+        self.volume_view.set_data(full_data, offset=box_offset(self.clip_box))
+        self.displayed_level = None
 
         # Update the mask data too. This will trigger an update.
         self.update_mask_data()
 
+        self.latency.record(np.prod(shape), time.perf_counter() - start)
+
+    def progressive_update(self, colors=False):
+        """Update the volume, with a coarse preview first if needed
+
+        If updating at full resolution is estimated to exceed the latency
+        target, a coarse level is rendered instead, and full resolution is
+        rendered once there has been no input for `REFINE_DELAY` seconds.
+        """
+        if not self.data_loaded:
+            return
+
+        self._refine_colors |= colors
+        level = None
+        if self.latency_target > 0:
+            box = clip_box(self.data_shape, self.clip_ranges)
+            num_voxels = np.prod(box_shape(box))
+            level = choose_level(
+                self.levels,
+                num_voxels,
+                self.latency,
+                self.latency_target,
+                num_voxels / np.prod(self.data_shape),
+            )
+
+        if level is None:
+            self.refine()
+            return
+
+        self.render_level(level)
+        self.schedule_refine()
+
+    def schedule_refine(self):
+        if self._refine_handle is not None:
+            self._refine_handle.cancel()
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (e.g. not served). Refine right away.
+            self.refine()
+            return
+
+        self._refine_handle = loop.call_later(REFINE_DELAY, self._on_idle)
+
+    def _on_idle(self):
+        # Flush any state modified while refining
+        with self.state:
+            self.refine()
+
+    @profiled(category='stage')
+    def refine(self):
+        if self._refine_handle is not None:
+            self._refine_handle.cancel()
+            self._refine_handle = None
+
+        if self._refine_colors:
+            self._refine_colors = False
+            self.update_voxel_colors()
+        else:
+            self.update_mask_data()
+
+    @profiled(category='stage')
+    def render_level(self, level):
+        """Render a coarse level of the volume, including its mask"""
+        start = time.perf_counter()
+        box = clip_box(level.shape, self.clip_ranges)
+        shape = box_shape(box)
+        positions, box_indices = voxels_in_box(
+            level.index.indices, level.shape, box
+        )
+        if len(positions) == 0:
+            # The box is empty, or has no nonzero voxels
+            self.volume_view.set_data(
+                np.zeros((*shape, 4)), level.factor, offset=box_offset(box)
+            )
+            self.displayed_level = level
+            self.ctrl.view_update()
+            return
+
+        box_index = VoxelIndex(shape, box_indices)
+
+        angle = np.radians(self.state.w_rotation)
+        gbc = rotate_coordinates(level.gbc[positions], angle)
+
+        rgba = np.zeros((np.prod(shape), 4))
+        box_index.scatter(gbc_to_rgb(gbc).T, rgba[:, :3])
+
+        f = level.factor
+        if self.opacity_data is None:
+            nonzero_data = level.nonzero_data[positions]
+            box_index.scatter(nonzero_data.mean(axis=1), rgba[:, 3])
+            if self.label_index is not None:
+                # Use the label at the corner of each block
+                labels = self.label_map[::f, ::f, ::f][box].ravel()
+                factors = self.label_factors_for(self.label_index)
+                rgba[:, 3] *= factors[
+                    np.searchsorted(self.label_index.values, labels)
+                ]
+        else:
+            opacity = self.opacity_data[::f, ::f, ::f][box].ravel()
+            box_index.scatter(box_index.gather(opacity), rgba[:, 3])
+
+        self.volume_view.set_data(
+            rgba.reshape((*shape, 4)), f, offset=box_offset(box)
+        )
+        self.displayed_level = level
+
+        alpha = self.compute_alpha(gbc)
+        box_index.scatter(alpha, self.volume_view.mask_reference)
+        self.volume_view.mask_data.Modified()
+        self.ctrl.view_update()
+
+        self.latency.record(np.prod(shape), time.perf_counter() - start)
+
+    @change(
+        "table_selection",
+        "unselected_opacity_multiplier",
+    )
+    @profiled(category='callback')
+    def update_table_selection(self, **kwargs):
+        if self.base_alpha is None or self.displayed_level is not None:
+            # Selections are applied when refining a preview
+            return
+
+        # Only the voxels of labels whose factor changed are modified
+        factors = self.current_label_factors
+        alpha = self.volume_view.volume_reference[:, 3]
+        apply_label_factors(
+            alpha,
+            self.base_alpha,
+            self.box_label_index,
+            factors,
+            self.label_factors,
+        )
+        self.label_factors = factors
+        self.volume_view.volume_data.Modified()
+
+        # Update the view
+        self.ctrl.view_update()
+
+    @property
+    def current_label_factors(self):
+        return self.label_factors_for(self.box_label_index)
+
+    def label_factors_for(self, label_index):
+        return selection_factors(
+            label_index,
+            self.state.table_selection,
+            self.state.unselected_opacity_multiplier,
+        )
+
+    @change('w_clip_x', 'w_clip_y', 'w_clip_z')
+    @profiled(category='callback')
+    def on_clip_change(self, **kwargs):
+        # The voxels to color and upload changed
+        self.progressive_update(colors=True)
+
     @change(
         'lens_center',
         'show_groups',
         'w_lradius',
         'w_linvert',
-        'w_clip_x',
-        'w_clip_y',
-        'w_clip_z',
     )
+    @profiled(category='callback')
+    def on_mask_change(self, **kwargs):
+        # The statistics are updated right away, even if the volume is
+        # refined later
+        self.update_displayed_voxel_means()
+        self.progressive_update()
+
+    @profiled(category='stage')
     def update_mask_data(self, **kwargs):
         if any(x is None for x in (self.rgb_data, self.gbc_data)):
             return
 
-        alpha = self.compute_alpha()
+        if self.displayed_level is not None:
+            # Replace the preview. This also updates the mask.
+            self.update_volume_data()
+            return
+
+        box_alpha = self.compute_alpha()
         mask_ref = self.volume_view.mask_reference
-        mask_ref[self.nonzero_indices] = alpha
+        self.box_index.scatter(box_alpha, mask_ref)
         self.volume_view.mask_data.Modified()
 
+        # The alpha of every nonzero voxel, for the statistics
+        alpha = np.zeros(len(self.nonzero_data), dtype=bool)
+        alpha[self.box_positions] = box_alpha
+        self.alpha = alpha
+
         # Update the view
         self.ctrl.view_update()
 
         # Also update the statistics
         self.update_displayed_voxel_means()
+        self.update_selection_histograms(alpha)
 
     @change("show_groups")
+    @profiled(category='callback')
     def update_displayed_voxel_means(self, **kwargs):
+        if not self.data_loaded:
+            return
+
         first_call = not hasattr(self, '_initial_display_voxel_means_call')
-        if not first_call and not self.voxel_means_enabled:
+        if (
+            not first_call
+            and not self.voxel_means_enabled
+            and not self.lens_enabled
+        ):
             # Only perform this on the first call if voxel means is not enabled
             return
 
         if first_call:
             self._initial_display_voxel_means_call = False
 
-        alpha = self.volume_view.mask_reference[self.nonzero_indices]
-        raw_nonzero = self.raw_unpadded_flattened_data[self.nonzero_indices]
-
-        display_data = raw_nonzero[alpha == 1]
-        if display_data.shape[0] > 0:
-            # divide each row with the row sum to create percentages for each voxel
-            row_sums = display_data.sum(axis=1)
-            percentage_per_voxel = np.divide(
-                display_data,
-                row_sums[:, None],
-                out=np.zeros_like(display_data),
-                where=row_sums[:, None] != 0,
-            )
-            means = (
-                100.0
-                * percentage_per_voxel.sum(axis=0)
-                / percentage_per_voxel.shape[0]
+        if self.clip_box is None:
+            # The clip box is computed with the colors
+            return
+
+        if self.composition_grid is None:
+            self.composition_grid = build_composition_grid(
+                self.unrotated_gbc,
+                self.box_positions,
+                self.nonzero_rows,
+                self.raw_unpadded_flattened_data,
             )
-        else:
-            means = np.zeros(display_data.shape[1])
+
+        key = (
+            self.lens_enabled,
+            tuple(self.state.lens_center),
+            self.state.w_lradius,
+            self.state.w_linvert,
+            self.state.w_rotation,
+            tuple(self.state.component_labels),
+        )
+        if key == self._lens_statistics_key:
+            return
+
+        count, means = self.lens_statistics()
+        self._lens_statistics_key = key
+        self.state.selected_voxel_count = count
 
         labels = self.state.component_labels
         displayed_voxel_means = {k: v for k, v in zip(labels, means.tolist())}
@@ -415,63 +1712,68 @@ class App(TrameApp):
 
     @change("data_channels")
     @change("normalize_ranges")
+    @profiled(category='callback')
     def on_data_change(self, data_channels, **_):
-        if not self.state.array_modified:
+        if not self.data_loaded or not self.state.array_modified:
             # No updates were actually made. Just return
             return
 
-        print("data_channels - changed")
         self.state.component_labels = [
             item.get("label")
             for item in data_channels.values()
             if item.get("enabled")
         ]
 
-        arrays = []
+        enabled = [
+            (self.channel_names.index(key), item["focus_range"])
+            for key, item in data_channels.items()
+            if item.get("enabled")
+        ]
+
+        # The data has a row per voxel. Sparse data has an extra row for
+        # the voxels that are not listed, which are zero.
+        raw = self.raw_unpadded_flattened_data
+        num_rows = len(raw)
+        if self.raw_index is not None and num_rows < np.prod(self.data_shape):
+            num_rows += 1
 
         # Set a voxel to be zero in all channels if one channel
         # is outside the focus range.
-        set_to_zero = np.zeros(self.data_shape, dtype=bool)
-        for key, item in data_channels.items():
-            if item.get("enabled"):
-                array = self.arrays_raw[key]
-
-                focus_range = item["focus_range"]
-                set_to_zero[array < focus_range[0]] = True
-                set_to_zero[array > focus_range[1]] = True
-
-                arrays.append(array)
+        lo, hi = self.normalization
+        set_to_zero = np.zeros(num_rows, dtype=bool)
+        data = np.empty((num_rows, len(enabled)))
+        for i, (idx, focus_range) in enumerate(enabled):
+            array = data[:, i]
+            array[: len(raw)] = normalize_rows(raw[:, idx], lo[idx], hi[idx])
+            array[len(raw) :] = normalize_rows(np.zeros(1), lo[idx], hi[idx])
 
-        # Update rest of pipeline
-        data = np.stack(arrays, axis=3)
+            set_to_zero[array < focus_range[0]] = True
+            set_to_zero[array > focus_range[1]] = True
 
         if self.state.normalize_ranges:
             # Set any invalid voxels to zero before normalizing
             data[set_to_zero] = 0
 
-        if self.normalize_channels:
-            # Normalize all channels separately
-            for i in range(data.shape[-1]):
-                data[:, :, :, i] = _normalize_data(data[:, :, :, i])
-        else:
-            # Normalize them all together
-            data = _normalize_data(data)
+        ranges = normalization_ranges(data, self.normalize_channels)
+        data = data[: len(raw)]
+        nonzero = normalized_nonzero_voxels(data, *ranges)
 
         if not self.state.normalize_ranges:
             # The invalid voxels are set to zero after normalizing instead
-            data[set_to_zero] = 0
-
-        # Store the data in a flattened form. It is easier to work with.
-        flattened_data = data.reshape(np.prod(self.data_shape), len(arrays))
-        self.nonzero_indices = ~np.all(np.isclose(flattened_data, 0), axis=1)
+            nonzero &= ~set_to_zero[: len(raw)]
 
         # Only store nonzero data. We will reconstruct the zeros later.
-        self.nonzero_data = flattened_data[self.nonzero_indices]
+        self.voxel_index, rows = index_rows(
+            nonzero, self.raw_index, self.data_shape
+        )
+        self.nonzero_rows = rows.indices
+        self.nonzero_data = normalize_rows(rows.gather(data), *ranges)
 
         # Trigger an update of the data
         self.update_gbc()
 
     @change("w_rendering_shadow", "w_rendering_bg")
+    @profiled(category='callback')
     def on_rendering_settings(
         self, w_rendering_shadow, w_rendering_bg, **kwargs
     ):
@@ -492,13 +1794,16 @@ class App(TrameApp):
     def lens_enabled(self):
         return "lens" in self.state.show_groups
 
+    @property
+    def tune_data_enabled(self):
+        return "tune-data" in self.state.show_groups
+
     @property
     def voxel_means_enabled(self):
         return ("voxel-means" in self.state.show_groups) or (
             "voxel-means-plot" in self.state.show_groups
         )
 
-    @life_cycle.server_ready
     def initial_reset_camera(self, **kwargs):
         self.volume_view.renderer.ResetCameraClippingRange()
         self.volume_view.renderer.ResetCamera()
@@ -511,46 +1816,145 @@ class App(TrameApp):
             self.state.w_clip_z,
         ]
 
-    def compute_alpha(self):
-        gbc_data = self.gbc_data
-        if gbc_data is None:
-            # Can't do anything
-            return None
+    @property
+    def selected_voxels(self):
+        # The nonzero voxels in the clip box and the lens. Once rows of
+        # the label table are selected, only the voxels of those labels.
+        selected = self.alpha
+        selection = self.state.table_selection
+        if self.label_index is not None and selection:
+            selected = selected & label_mask(
+                self.label_index, selection, self.voxel_index.indices
+            )
+
+        return selected
+
+    def selection_columns(self):
+        """The columns of the selected voxels, computed for a chunk
 
-        clip_mask = np.zeros(self.data_shape, dtype=bool)
-        slices = []
-        for i, (min_clip, max_clip) in enumerate(self.clip_ranges):
-            min_idx = int(np.round(self.data_shape[i] * min_clip))
-            max_idx = int(np.round(self.data_shape[i] * max_clip))
-            slices.append(np.s_[min_idx:max_idx])
+        The coordinates are in the cropped (and decimated) volume. The
+        columns refer to the current arrays, so that they are not
+        affected by the changes made while exporting.
+        """
+        flat_indices = self.voxel_index.indices
+        shape = self.data_shape
+        raw = self.raw_unpadded_flattened_data
+        rows = self.nonzero_rows
+        gbc = self.unrotated_gbc
+        angle = np.radians(self.state.w_rotation)
+
+        def coordinates(positions):
+            indices = np.unravel_index(flat_indices[positions], shape)
+            return np.stack(indices, axis=1)
+
+        def rotated_gbc(positions):
+            return rotate_coordinates(gbc[positions], angle)
 
-        clip_mask[slices[0], slices[1], slices[2]] = True
+        return {
+            'coordinates': coordinates,
+            'values': lambda positions: raw[rows[positions]],
+            'gbc': rotated_gbc,
+            'rgb': lambda positions: gbc_to_rgb(rotated_gbc(positions)).T,
+        }
 
-        # Reshape into the flat form and remove any zero index data
-        clip_flattened = clip_mask.reshape(np.prod(self.data_shape))
-        # If we perform any other operations, we can logical_and them
-        alpha = clip_flattened[self.nonzero_indices]
+    @property
+    def selection_metadata(self):
+        # The voxel at `coordinates` was at
+        # `padding + coordinates * decimation` in the data
+        return {
+            'channels': np.array(self.channel_names),
+            'components': np.array(self.state.component_labels),
+            'shape': np.array(self.data_shape),
+            'padding': np.array(self.padding),
+            'decimation': np.array(self.decimation),
+        }
+
+    def export_selection(self):
+        asynchronous.create_task(self.export_selection_async())
+
+    async def export_selection_async(self):
+        """Stream the selected voxels to the export path in a thread"""
+        if not self.data_loaded or self.state.exporting:
+            return
 
+        if self.displayed_level is not None:
+            # The selection of a preview is not at full resolution
+            self.refine()
+
+        selected = self.selected_voxels
+        columns = self.selection_columns()
+        metadata = self.selection_metadata
+
+        self.set_loading_stage('Exporting the selection', 0)
+        with self.state:
+            self.state.exporting = True
+
+        try:
+            num_voxels = await asyncio.to_thread(
+                export_selection,
+                self.export_path,
+                selected,
+                columns,
+                metadata,
+            )
+        except Exception as e:
+            self.set_loading_stage(f'Failed to export: {e}', 0)
+            raise
+        finally:
+            with self.state:
+                self.state.exporting = False
+
+        print(f'Exported {num_voxels} voxels to: {self.export_path}')
+        with self.state:
+            self.state.loading = False
+
+    def lens_statistics(self):
+        """Count the voxels in the clip box and the lens, like
+        `compute_alpha`, and compute their mean composition"""
+        grid = self.composition_grid
         if not self.lens_enabled:
-            # Only apply clipping
-            return alpha
+            return grid.statistics()
+
+        # The lens is in rotated coordinates, and the grid is not
+        # The center may be ints, like the default [0, 0]
+        angle = np.radians(self.state.w_rotation)
+        center = np.asarray(self.state.lens_center, dtype=np.float64)
+        center = rotate_coordinates(center[np.newaxis], -angle)
+        return grid.lens_statistics(
+            center[0], self.state.w_lradius, self.state.w_linvert
+        )
+
+    def compute_alpha(self, gbc_data=None):
+        # Compute the alpha of the nonzero voxels inside the clip box
+        if gbc_data is None:
+            gbc_data = self.gbc_data
+
+        if gbc_data is None:
+            # Can't do anything
+            return None
+
+        if not self.lens_enabled:
+            # Clipping is already applied
+            return np.ones(len(gbc_data), dtype=bool)
 
         # These are in unit circle coordinates
         r = self.state.w_lradius
         x, y = self.state.lens_center
 
-        lens_alpha = _compute_alpha(np.array([x, y]), r, gbc_data)
-        if self.state.w_linvert:
-            lens_alpha = np.invert(lens_alpha)
-
-        # Combine the lens alpha with the current alpha
-        return np.logical_and(alpha, lens_alpha)
+        return lens_alpha(gbc_data, [x, y], r, self.state.w_linvert)
 
     def _build_ui(self):
         self.state.setdefault('lens_center', [0, 0])
         self.state.setdefault("array_modified", '')
         self.state.setdefault('normalize_ranges', False)
         self.state.setdefault("unselected_opacity_multiplier", 0.1)
+        self.state.setdefault("selection_histograms", {})
+        self.state.setdefault("loading_message", "")
+        self.state.setdefault("data_channels", None)
+        self.state.setdefault("profile_summary", [])
+        self.state.setdefault("num_timesteps", 1)
+        self.state.setdefault("exporting", False)
+        self.state.setdefault("selected_voxel_count", 0)
 
         server = self.server
         ctrl = self.ctrl
@@ -562,7 +1966,7 @@ class App(TrameApp):
             client.Style('html { overflow-y: hidden; }')
 
             with vtk.VtkRemoteView(
-                self.render_window, interactive_ratio=1
+                self.render_window, interactive_ratio=self.interactive_ratio
             ) as html_view:
                 ctrl.reset_camera = html_view.reset_camera
                 ctrl.view_update = html_view.update
@@ -590,7 +1994,19 @@ class App(TrameApp):
                             density="compact",
                             classes="mx-3",
                         )
+                        v.VProgressLinear(
+                            color="secondary",
+                            model_value=("loading_progress", 0),
+                            v_show=("loading", False),
+                            absolute=True,
+                            style="bottom: 0; top: none;",
+                        )
                         v.VSpacer()
+                        html.Div(
+                            "{{ loading_message }}",
+                            v_show="loading",
+                            classes="text-caption text-no-wrap mr-4",
+                        )
 
                         with v.VBtnToggle(
                             v_show=("show_control_panel", True),
@@ -630,6 +2046,11 @@ class App(TrameApp):
                                 icon="mdi-table",
                                 value="table",
                             )
+                            v.VBtn(
+                                icon="mdi-timer-outline",
+                                value="profile",
+                                v_if=("profiling", PROFILER.enabled),
+                            )
 
                         v.VSpacer()
 
@@ -641,6 +2062,13 @@ class App(TrameApp):
                                 density="compact",
                             )
 
+                        v.VBtn(
+                            icon="mdi-download",
+                            density="compact",
+                            classes="mr-1",
+                            disabled=("exporting",),
+                            click=self.export_selection,
+                        )
                         v.VBtn(
                             icon="mdi-crop-free",
                             density="compact",
@@ -652,11 +2080,14 @@ class App(TrameApp):
                     radvolviz.NdColorMap(
                         v_show="show_control_panel",
                         component_labels=('component_labels', []),
-                        unrotated_bin_data=('unrotated_bin_data', []),
+                        unrotated_bin_data=('unrotated_bin_data', None),
                         unrotated_component_coords=(
                             'unrotated_component_coords',
-                            [],
+                            None,
                         ),
+                        density_image=('density_image', None),
+                        density_resolution=DENSITY_RESOLUTION,
+                        show_density=('w_show_density', True),
                         size=600,
                         rotation=('w_rotation', 0),
                         sample_size=('w_sample_size', 1100),
@@ -667,6 +2098,25 @@ class App(TrameApp):
                         # style="position: sticky; top: 3rem; z-index: 1; background: white;",
                     )
 
+                    # Time series
+                    with v.VCard(
+                        flat=True,
+                        v_show="show_control_panel && num_timesteps > 1",
+                        classes="py-1",
+                    ):
+                        v.VSlider(
+                            v_model=('timestep', 0),
+                            min=0,
+                            max=("num_timesteps - 1",),
+                            step=1,
+                            density='compact',
+                            prepend_icon="mdi-clock-outline",
+                            messages=(
+                                "`Timestep ${timestep + 1} of "
+                                "${num_timesteps}`",
+                            ),
+                        )
+
                     # Lense control
                     with v.VCard(
                         flat=True,
@@ -692,6 +2142,11 @@ class App(TrameApp):
                             color="green",
                             classes="ml-2",
                         )
+                        html.Div(
+                            "{{ selected_voxel_count.toLocaleString() }} "
+                            "voxels selected",
+                            classes="text-caption ml-2",
+                        )
 
                     # Color / Rotation management
                     with v.VCard(
@@ -751,6 +2206,24 @@ class App(TrameApp):
                             prepend_icon="mdi-chart-scatter-plot-hexbin",
                             messages="Number of bins for the sampling algorithm",
                         )
+                        v.VSwitch(
+                            label="Show the density of all voxels",
+                            v_model=('w_show_density', True),
+                            density="compact",
+                            hide_details=True,
+                            inset=True,
+                            color="green",
+                            classes="ml-2",
+                        )
+                        v.VSwitch(
+                            label="Sample every bin of the whole population",
+                            v_model=('w_stratified_sampling', False),
+                            density="compact",
+                            hide_details=True,
+                            inset=True,
+                            color="green",
+                            classes="ml-2",
+                        )
 
                     # Cropping
                     with v.VCard(
@@ -862,7 +2335,7 @@ class App(TrameApp):
                                         update_modelValue="data_channels[name].enabled = $event; array_modified=''; flushState('data_channels')",
                                     )
                                 with html.Div(
-                                    style="height: 4rem;",
+                                    style="height: 4rem; position: relative;",
                                     classes="align-baseline d-flex mt-5 ml-12 mr-2 mb-n3",
                                 ):
                                     html.Div(
@@ -873,6 +2346,20 @@ class App(TrameApp):
                                         ),
                                         classes="d-flex bg-blue",
                                     )
+                                    # Histogram of the selected voxels
+                                    with html.Div(
+                                        v_if="selection_histograms[name]",
+                                        style="position: absolute; inset: 0;",
+                                        classes="align-baseline d-flex",
+                                    ):
+                                        html.Div(
+                                            v_for="v, idx in selection_histograms[name]",
+                                            key="idx",
+                                            style=(
+                                                "`height: ${v}%; width: 0.5%;`",
+                                            ),
+                                            classes="d-flex bg-orange",
+                                        )
                                 v.VRangeSlider(
                                     model_value=('data.focus_range',),
                                     min=("data.data_range[0]",),
@@ -918,7 +2405,7 @@ class App(TrameApp):
                                 figure.update
                             )
 
-                    if self.label_map is not None:
+                    if self.has_label_map:
                         # Table (phase selection)
                         with v.VCard(
                             flat=True,
@@ -937,64 +2424,120 @@ class App(TrameApp):
                                 prepend_icon="mdi-chart-scatter-plot-hexbin",
                                 messages="Unselected Voxels Opacity Multiplier",
                             )
+                            v.VSwitch(
+                                label="Select multiple labels",
+                                v_model=("table_multi_select", False),
+                                density="compact",
+                                hide_details=True,
+                                inset=True,
+                                color="green",
+                                classes="ml-2",
+                            )
                             v.VDataTable(
                                 headers=("table_headers", []),
                                 items=("table_content", None),
                                 density="compact",
                                 item_value="id",
                                 item_selectable=True,
-                                select_strategy="single",  # all / single
+                                select_strategy=(
+                                    "table_multi_select ? 'page' : 'single'",
+                                ),
                                 show_select=True,
                                 v_model=("table_selection", []),
                                 hide_default_footer=True,
                             )
 
+                    if PROFILER.enabled:
+                        # Summary of the profiled spans
+                        with v.VCard(
+                            flat=True,
+                            v_show="show_control_panel && show_groups.includes('profile')",
+                            classes="py-1",
+                        ):
+                            with html.Div(classes="d-flex align-center"):
+                                v.VLabel("Profile", classes="text-body-2 ml-1")
+                                v.VSpacer()
+                                v.VBtn(
+                                    "Clear",
+                                    click=self.clear_profile,
+                                    density="compact",
+                                    variant="text",
+                                )
+                                v.VBtn(
+                                    "Export trace",
+                                    click=self.export_profile,
+                                    density="compact",
+                                    variant="text",
+                                )
+                            v.VDivider()
+                            with v.VTable(density="compact"):
+                                with html.Thead():
+                                    with html.Tr():
+                                        for column in PROFILE_COLUMNS:
+                                            html.Th(
+                                                column,
+                                                classes="text-caption",
+                                            )
+                                with html.Tbody():
+                                    with html.Tr(
+                                        v_for="row in profile_summary",
+                                        key="row.name",
+                                    ):
+                                        html.Td(
+                                            "{{ row.name }}",
+                                            classes="text-caption",
+                                        )
+                                        for key in PROFILE_COLUMNS[1:]:
+                                            html.Td(
+                                                f"{{{{ row['{key}'] }}}}",
+                                                classes="text-caption",
+                                                style="text-align: right;",
+                                            )
+
             # print(layout)
             return layout
 
 
-@numba.njit(cache=True, nogil=True)
-def _compute_alpha(center, radius, gbc_data):
-    # Compute distance formula to lens center
-    distances = np.sqrt(((gbc_data - center) ** 2).sum(axis=1))
-
-    # Any distances less than the radius are within the lens
-    return distances < radius
-
+def needs_example_download(file_to_load):
+    return Path(file_to_load) == EXAMPLE_DATA_PATH and not (
+        EXAMPLE_DATA_PATH.exists()
+    )
 
-@numba.njit(cache=True, nogil=True)
-def _remove_padding_uniform(data: np.ndarray) -> np.ndarray:
-    num_channels = data.shape[-1]
-    zero_data = np.isclose(data, 0).sum(axis=3) == num_channels
 
-    # This is the number to crop
-    n = 0
-    indices = np.array([n, -n - 1])
-    while (
-        zero_data[indices].all()
-        & zero_data[:, indices].all()
-        & zero_data[:, :, indices].all()
-    ):
-        n += 1
-        indices = np.array([n, -n - 1])
+def download_example_data():
+    # Automatically download the example dataset, and put it in the
+    # data directory.
+    EXAMPLE_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    print(f'Downloading example dataset to: {EXAMPLE_DATA_PATH}')
+    download_file_from_google_drive(EXAMPLE_GOOGLE_DRIVE_ID, EXAMPLE_DATA_PATH)
 
-    if n != 0:
-        data = data[n : -n - 1, n : -n - 1, n : -n - 1]
 
-    return data
+# Columns of the profile summary. Times are in ms, and sizes in MB.
+PROFILE_COLUMNS = ('name', 'count', 'total', 'mean', 'max', 'allocated')
 
 
-@numba.njit(cache=True, nogil=True)
-def _normalize_data(data: np.ndarray, new_min: float = 0, new_max: float = 1):
-    max_val = data.max()
-    min_val = data.min()
+def profile_rows(summary):
+    # Round the slowest spans of the summary for display
+    rows = []
+    for s in summary[:PROFILE_ROWS]:
+        rows.append(
+            {
+                'name': s['name'],
+                'count': s['count'],
+                'total': round(s['total'] * 1000, 1),
+                'mean': round(s['mean'] * 1000, 2),
+                'max': round(s['max'] * 1000, 1),
+                'allocated': round(s['allocated'] / 2**20, 1),
+            }
+        )
 
-    return (new_max - new_min) * (data.astype(np.float64) - min_val) / (
-        max_val - min_val
-    ) + new_min
+    return rows
 
 
 def _bar_plot(key_values):
+    # Plotly is only needed once the voxel means are plotted
+    import plotly.graph_objects as go
+
     return go.Figure(
         data=go.Bar(x=list(key_values.keys()), y=list(key_values.values()))
     ).update_layout(yaxis_title="%", margin=dict(l=10, r=10, t=25, b=10))
@@ -0,0 +1,256 @@
+"""Run the pipeline over many datasets, without rendering
+
+Usage: mv-view batch [options] FILE [FILE ...]
+
+Every dataset is loaded, cropped, normalized, and colored in the same
+way as the application. The results are written to one HDF5 or NPZ
+file per dataset. Datasets are processed in parallel by a pool of
+worker processes.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+
+import h5py
+import numba
+import numpy as np
+
+from .compute import (
+    build_label_index,
+    compute_gbc,
+    gbc_to_rgb,
+    rotate_coordinates,
+)
+from .compute.preprocess import (
+    nonzero_voxels,
+    normalize_channels,
+    normalize_data,
+    remove_padding_uniform,
+)
+from .compute.selection import label_means, lens_alpha, mean_composition
+from .compute.voxels import SparseVolume, build_voxel_index
+from .io import load_dataset
+from .remote import path_name
+
+OUTPUT_FORMATS = ('h5', 'npz')
+
+
+def run_pipeline(path, options) -> dict[str, np.ndarray]:
+    """Run the pipeline on a dataset, and return the resulting arrays
+
+    The RGBA volume and the GBC of the nonzero voxels are always
+    computed. The lens and label statistics are computed if the options
+    include a lens radius or a label map.
+    """
+    header, data = load_dataset(path)
+    if isinstance(data, SparseVolume):
+        # The RGBA volume is written out whole anyway
+        data = data.to_dense()
+
+    if options.nan is not None:
+        data[np.isnan(data)] = float(options.nan)
+
+    data = remove_padding_uniform(data)
+
+    opacity_data = None
+    if options.opacity_channel is not None:
+        opacity_idx = header.index(options.opacity_channel)
+        opacity_data = normalize_data(data[:, :, :, opacity_idx])
+        header.pop(opacity_idx)
+        data = np.delete(data, opacity_idx, axis=3)
+
+    shape = data.shape[:-1]
+    num_channels = data.shape[-1]
+    raw_data = data.reshape(-1, num_channels)
+    normalized_data = normalize_channels(
+        data, options.normalize_channels
+    ).reshape(-1, num_channels)
+
+    index = build_voxel_index(nonzero_voxels(normalized_data), shape)
+    nonzero_data = index.gather(normalized_data)
+
+    unrotated_gbc, components = compute_gbc(nonzero_data)
+    gbc = rotate_coordinates(unrotated_gbc, np.radians(options.rotation))
+
+    # Reconstruct the volume with rgba values
+    rgba = np.zeros((len(normalized_data), 4), dtype=np.float32)
+    index.scatter(gbc_to_rgb(gbc).T, rgba[:, :3])
+    if opacity_data is None:
+        index.scatter(nonzero_data.mean(axis=1), rgba[:, 3])
+    else:
+        index.scatter(index.gather(opacity_data.ravel()), rgba[:, 3])
+
+    results = {
+        'channels': np.array(header),
+        'rgba': rgba.reshape((*shape, 4)),
+        'gbc': unrotated_gbc,
+        'components': components,
+        'nonzero_indices': index.indices,
+    }
+
+    if options.lens_radius is not None:
+        alpha = lens_alpha(
+            gbc, options.lens_center, options.lens_radius, options.lens_invert
+        )
+        results['lens_alpha'] = alpha
+        results['lens_means'] = mean_composition(index.gather(raw_data)[alpha])
+
+    if options.label_map is not None:
+        label_map = np.load(options.label_map)
+        if label_map.shape != shape:
+            msg = (
+                f'Label map shape {label_map.shape} does not match the '
+                f'cropped data shape {shape}'
+            )
+            raise ValueError(msg)
+
+        label_index = build_label_index(label_map)
+        results['label_values'] = label_index.values
+        results['label_means'] = label_means(normalized_data, label_index)
+
+    return results
+
+
+def save_results(results: dict[str, np.ndarray], path: Path):
+    """Save the arrays to an HDF5 or NPZ file, depending on the suffix"""
+    if path.suffix == '.npz':
+        np.savez(path, **results)
+        return
+
+    with h5py.File(path, 'w') as f:
+        for name, array in results.items():
+            if array.dtype.kind == 'U':
+                array = array.astype(h5py.string_dtype())
+
+            f.create_dataset(name, data=array)
+
+
+def process_file(path, options) -> Path:
+    name = f'{Path(path_name(path)).stem}.{options.format}'
+    output_path = Path(options.output_dir) / name
+    save_results(run_pipeline(path, options), output_path)
+    return output_path
+
+
+def _init_worker(num_threads):
+    # Share the cores between the workers
+    numba.set_num_threads(num_threads)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='mv-view batch',
+        description=(
+            'Compute the colors and statistics of many datasets, '
+            'without rendering'
+        ),
+    )
+    parser.add_argument(
+        'files', nargs='+', help='Paths or URLs of the datasets'
+    )
+    parser.add_argument(
+        '-o',
+        '--output-dir',
+        default='.',
+        help='Directory to write the results to',
+    )
+    parser.add_argument(
+        '--format',
+        choices=OUTPUT_FORMATS,
+        default='h5',
+        help='Format of the results',
+    )
+    parser.add_argument(
+        '-j',
+        '--workers',
+        type=int,
+        default=os.cpu_count(),
+        help='Number of worker processes',
+    )
+    parser.add_argument(
+        '--nan', help='Replace NaN to specific value', default=0
+    )
+    parser.add_argument(
+        '--normalize-channels',
+        help='Normalize each channel to be between 0 and 1',
+        action='store_true',
+        default=False,
+    )
+    parser.add_argument(
+        '--opacity-channel',
+        help='Set the specified channel to be opacity only',
+        default=None,
+    )
+    parser.add_argument(
+        '--label-map',
+        help='Path to a label map, to compute the label table',
+        default=None,
+    )
+    parser.add_argument(
+        '--rotation',
+        type=float,
+        default=0,
+        help='Rotation of the color wheel, in degrees',
+    )
+    parser.add_argument(
+        '--lens-radius',
+        type=float,
+        default=None,
+        help='Radius of the lens, to compute the lens statistics',
+    )
+    parser.add_argument(
+        '--lens-center',
+        type=float,
+        nargs=2,
+        default=(0, 0),
+        metavar=('X', 'Y'),
+        help='Center of the lens, in unit circle coordinates',
+    )
+    parser.add_argument(
+        '--lens-invert',
+        action='store_true',
+        default=False,
+        help='Select the voxels outside of the lens',
+    )
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    Path(options.output_dir).mkdir(parents=True, exist_ok=True)
+
+    num_workers = max(min(options.workers, len(options.files)), 1)
+    num_threads = max(numba.config.NUMBA_NUM_THREADS // num_workers, 1)
+
+    # The parallel kernels are not fork-safe once their threads started,
+    # so the workers are spawned
+    num_failed = 0
+    with ProcessPoolExecutor(
+        num_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(num_threads,),
+    ) as executor:
+        futures = {
+            executor.submit(process_file, path, options): path
+            for path in options.files
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                output_path = future.result()
+            except Exception as e:
+                num_failed += 1
+                print(f'Failed to process {path}: {e}', file=sys.stderr)
+            else:
+                print(f'{path} -> {output_path}')
+
+    return 1 if num_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,6 @@
 from .bin import data_topology_reduction
+from .density import compute_density, density_to_image
 from .gbc import compute_gbc, rotate_coordinates
 from .hsl import gbc_to_hsl, gbc_to_rgb, hsl_to_rgb
+from .labels import apply_label_factors, build_label_index, selection_factors
+from .sampling import GBCSampler
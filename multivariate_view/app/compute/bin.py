@@ -7,35 +7,11 @@ def data_topology_reduction(
     if rand_func is None:
         rand_func = np.random.rand
 
-    bins = []
-    bin_map = {}
-    for i in range(num_bins):
-        bin_map[i] = {}
-        for j in range(num_bins):
-            bin_map[i][j] = []
-            bins.append(bin_map[i][j])
-
-    delta = 2 / num_bins
-    c_min = 0
-    c_max = num_bins - 1
-    for entry in data:
-        i, j = np.clip(np.floor((entry + 1) / delta), c_min, c_max)
-        bin_map[i][j].append(entry)
-
     q = []
-    for entries in bins:
+    for entries in bin_entries(data, num_bins):
         num_entries = len(entries)
-        if num_entries == 0:
-            # Skip empty bins
-            continue
-
         sample_idx = set()
-        target_size = num_entries / 2
-        if target_size > 1000:
-            target_size = 5 * np.log2(num_entries)
-        elif target_size > 100:
-            target_size = np.log2(num_entries)
-
+        target_size = target_bin_size(num_entries)
         while len(sample_idx) < target_size:
             rd = int(np.floor(rand_func() * num_entries))
             if rd in sample_idx:
@@ -45,3 +21,45 @@ def data_topology_reduction(
             q.append(entries[rd])
 
     return np.asarray(q)
+
+
+def target_bin_size(num_entries: float) -> float:
+    """The number of entries to keep from a bin with `num_entries`"""
+    target_size = num_entries / 2
+    if target_size > 1000:
+        target_size = 5 * np.log2(num_entries)
+    elif target_size > 100:
+        target_size = np.log2(num_entries)
+
+    return target_size
+
+
+def bin_indices(data: np.ndarray, num_bins: int) -> np.ndarray:
+    """Compute the index of the 2D bin of each coordinate
+
+    The bins are a `num_bins` x `num_bins` grid over [-1, 1] in both
+    dimensions, ordered by row.
+    """
+    delta = 2 / num_bins
+    ij = np.clip(np.floor((data + 1) / delta), 0, num_bins - 1).astype(
+        np.int64
+    )
+    return ij[:, 0] * num_bins + ij[:, 1]
+
+
+def bin_entries(data: np.ndarray, num_bins: int) -> list[np.ndarray]:
+    """Group the coordinates by bin, skipping empty bins
+
+    The entries of each bin keep the order they have in the data.
+    """
+    if len(data) == 0:
+        return []
+
+    indices = bin_indices(data, num_bins)
+    order = np.argsort(indices, kind='stable')
+    counts = np.bincount(indices, minlength=num_bins**2)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    return [
+        data[order[offsets[i] : offsets[i + 1]]] for i in np.nonzero(counts)[0]
+    ]
@@ -0,0 +1,72 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+
+
+def clip_box(shape: tuple[int], clip_ranges) -> tuple[slice]:
+    """Compute the box of voxels kept by the clip ranges
+
+    Each clip range is a `[min, max]` fraction of the matching axis.
+    """
+    box = []
+    for n, (min_clip, max_clip) in zip(shape, clip_ranges):
+        min_idx = int(np.round(n * min_clip))
+        max_idx = int(np.round(n * max_clip))
+        box.append(slice(min_idx, max(min_idx, max_idx)))
+
+    return tuple(box)
+
+
+def box_shape(box: tuple[slice]) -> tuple[int]:
+    return tuple(s.stop - s.start for s in box)
+
+
+def box_offset(box: tuple[slice]) -> tuple[int]:
+    return tuple(s.start for s in box)
+
+
+@profiled
+def voxels_in_box(
+    flat_indices: np.ndarray, shape: tuple[int], box: tuple[slice]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Find the voxels at the flattened indices that are inside the box
+
+    Returns the positions of those voxels in `flat_indices`, and their
+    flattened indices within the box (of the same type as `flat_indices`).
+    """
+    return _voxels_in_box(
+        flat_indices,
+        np.array(shape),
+        np.array(box_offset(box)),
+        np.array(box_shape(box)),
+    )
+
+
+@numba.njit(cache=True, nogil=True)
+def _voxels_in_box(flat_indices, shape, offset, size):
+    ny, nx = shape[1], shape[2]
+    positions = np.empty(len(flat_indices), dtype=np.int64)
+    box_indices = np.empty(len(flat_indices), dtype=flat_indices.dtype)
+
+    count = 0
+    for i in range(len(flat_indices)):
+        idx = flat_indices[i]
+        z = idx // (ny * nx) - offset[0]
+        y = (idx // nx) % ny - offset[1]
+        x = idx % nx - offset[2]
+        if (
+            z < 0
+            or y < 0
+            or x < 0
+            or z >= size[0]
+            or y >= size[1]
+            or x >= size[2]
+        ):
+            continue
+
+        positions[count] = i
+        box_indices[count] = (z * size[1] + y) * size[2] + x
+        count += 1
+
+    return positions[:count], box_indices[:count]
@@ -0,0 +1,289 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+from .parallel import chunk_bounds
+
+# Number of cells along each axis of the composition grid
+GRID_RESOLUTION = 256
+
+
+class CompositionGrid:
+    """The composition of the voxels in a grid over the GBC plane
+
+    The grid covers [-1, 1] x [-1, 1] in unrotated GBC coordinates, like
+    the density image. Each cell holds the number of voxels in it, and
+    the sum of their compositions (each voxel divided by its sum). These
+    are accumulated along the rows of the grid, so that the voxels of a
+    run of cells are counted in constant time.
+
+    The voxels of cell `i` are `order[offsets[i]:offsets[i + 1]]`, which
+    are positions in `gbc`. Their rows in `data` are at `flat_indices`.
+    """
+
+    def __init__(self, counts, sums, offsets, order, gbc, flat_indices, data):
+        self.counts = counts
+        self.sums = sums
+        self.offsets = offsets
+        self.order = order
+        self.gbc = gbc
+        self.flat_indices = flat_indices
+        self.data = data
+
+    @property
+    def resolution(self) -> int:
+        return self.counts.shape[0]
+
+    @property
+    def num_voxels(self) -> int:
+        return int(self.counts[:, -1].sum())
+
+    @profiled
+    def lens_statistics(
+        self, center, radius: float, invert: bool = False
+    ) -> tuple[int, np.ndarray]:
+        """Count the voxels in the lens, and their mean composition
+
+        The center is in unrotated GBC coordinates. The means are the
+        same as `mean_composition` of the voxels in the lens: only the
+        voxels of the cells on the border of the lens are visited.
+        """
+        count, sums = _lens_sums(
+            np.asarray(center, dtype=np.float64),
+            float(radius),
+            self.counts,
+            self.sums,
+            self.offsets,
+            self.order,
+            self.gbc,
+            self.flat_indices,
+            self.data,
+        )
+        if invert:
+            count = self.num_voxels - count
+            sums = self.sums[:, -1].sum(axis=0) - sums
+
+        return _statistics(count, sums)
+
+    def statistics(self) -> tuple[int, np.ndarray]:
+        """Count all the voxels, and compute their mean composition"""
+        return _statistics(self.num_voxels, self.sums[:, -1].sum(axis=0))
+
+
+def _statistics(count, sums):
+    if count == 0:
+        return 0, np.zeros(len(sums))
+
+    return int(count), 100.0 * sums / count
+
+
+@profiled
+def build_composition_grid(
+    gbc: np.ndarray,
+    positions: np.ndarray,
+    flat_indices: np.ndarray,
+    data: np.ndarray,
+    resolution: int = GRID_RESOLUTION,
+) -> CompositionGrid:
+    """Build the composition grid of some of the voxels
+
+    The voxels are the `positions` in `gbc` and `flat_indices`, and
+    `data` is the flattened data. This is a single pass over the voxels.
+    """
+    cells = _grid_cells(
+        gbc, positions, chunk_bounds(len(positions)), resolution
+    )
+    counts = np.bincount(cells, minlength=resolution**2)
+    offsets = np.zeros(resolution**2 + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    order = _bucket_positions(cells, positions, offsets)
+
+    sums = _cell_sums(cells, positions, flat_indices, data, resolution**2)
+
+    # Accumulate along the rows
+    cumulative_counts = np.zeros((resolution, resolution + 1), np.int64)
+    np.cumsum(
+        counts.reshape(resolution, resolution),
+        axis=1,
+        out=cumulative_counts[:, 1:],
+    )
+    cumulative_sums = np.zeros((resolution, resolution + 1, data.shape[1]))
+    np.cumsum(
+        sums.reshape(resolution, resolution, -1),
+        axis=1,
+        out=cumulative_sums[:, 1:],
+    )
+
+    return CompositionGrid(
+        cumulative_counts,
+        cumulative_sums,
+        offsets,
+        order,
+        gbc,
+        flat_indices,
+        data,
+    )
+
+
+@numba.njit(cache=True, nogil=True)
+def _cell_of(x, y, resolution):
+    scale = resolution / 2
+    col = min(max(int((x + 1) * scale), 0), resolution - 1)
+    row = min(max(int((y + 1) * scale), 0), resolution - 1)
+    return row * resolution + col
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _grid_cells(gbc, positions, bounds, resolution):
+    cells = np.empty(len(positions), dtype=np.int64)
+    for chunk in numba.prange(len(bounds) - 1):
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            p = positions[i]
+            cells[i] = _cell_of(gbc[p, 0], gbc[p, 1], resolution)
+
+    return cells
+
+
+@numba.njit(cache=True, nogil=True)
+def _bucket_positions(cells, positions, offsets):
+    # Counting sort of the positions by cell
+    cursor = offsets[:-1].copy()
+    order = np.empty(len(cells), dtype=np.int64)
+    for i in range(len(cells)):
+        order[cursor[cells[i]]] = positions[i]
+        cursor[cells[i]] += 1
+
+    return order
+
+
+@numba.njit(cache=True, nogil=True)
+def _add_composition(data, row, out, i):
+    # Add the composition of a voxel to `out[i]`. Voxels that sum to zero
+    # add zero.
+    total = 0.0
+    for c in range(data.shape[1]):
+        total += data[row, c]
+
+    if total != 0:
+        for c in range(data.shape[1]):
+            out[i, c] += data[row, c] / total
+
+
+@numba.njit(cache=True, nogil=True)
+def _cell_sums(cells, positions, flat_indices, data, num_cells):
+    # The voxels are visited in the order of the data, which is faster
+    # than gathering the voxels of each cell
+    sums = np.zeros((num_cells, data.shape[1]))
+    for i in range(len(cells)):
+        _add_composition(data, flat_indices[positions[i]], sums, cells[i])
+
+    return sums
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _lens_sums(
+    center, radius, counts, sums, offsets, order, gbc, flat_indices, data
+):
+    resolution = counts.shape[0]
+    num_channels = sums.shape[2]
+    size = 2 / resolution
+    cx, cy = center[0], center[1]
+
+    row_counts = np.zeros(resolution, dtype=np.int64)
+    row_sums = np.zeros((resolution, num_channels))
+    for y in numba.prange(resolution):
+        bottom = -1 + y * size
+        top = bottom + size
+
+        # The cells that the lens overlaps in this row
+        near = 0.0
+        if cy < bottom:
+            near = bottom - cy
+        elif cy > top:
+            near = cy - top
+
+        if near >= radius:
+            first = last = 0
+        else:
+            half = np.sqrt(radius**2 - near**2)
+            first = max(int(np.floor((cx - half + 1) / size)), 0)
+            last = min(int(np.floor((cx + half + 1) / size)) + 1, resolution)
+
+        # The cells entirely inside the lens. Points outside of the grid
+        # are clamped to the border cells, which are never inside. These
+        # points are further from the lens than their cell, so the cells
+        # that the lens overlaps have all the points that may be in it.
+        far = max(abs(bottom - cy), abs(top - cy))
+        inner_first = inner_last = 0
+        if 0 < y < resolution - 1 and far < radius:
+            half = np.sqrt(radius**2 - far**2)
+            inner_first = max(int(np.ceil((cx - half + 1) / size)), 1)
+            inner_last = min(
+                int(np.floor((cx + half + 1) / size)), resolution - 1
+            )
+            # Cells with a corner on the circle are not inside
+            while inner_first < inner_last and not _corners_inside(
+                inner_first, y, size, cx, cy, radius
+            ):
+                inner_first += 1
+            while inner_last > inner_first and not _corners_inside(
+                inner_last - 1, y, size, cx, cy, radius
+            ):
+                inner_last -= 1
+
+            if inner_last <= inner_first:
+                inner_first = inner_last = 0
+
+        if inner_last > inner_first:
+            row_counts[y] = counts[y, inner_last] - counts[y, inner_first]
+            row_sums[y] = sums[y, inner_last] - sums[y, inner_first]
+
+        # Test the voxels of the other cells one by one
+        for x in range(first, last):
+            if inner_first <= x < inner_last:
+                continue
+
+            row_counts[y] += _add_lens_voxels(
+                y * resolution + x,
+                cx,
+                cy,
+                radius,
+                offsets,
+                order,
+                gbc,
+                flat_indices,
+                data,
+                row_sums,
+                y,
+            )
+
+    return row_counts.sum(), row_sums.sum(axis=0)
+
+
+@numba.njit(cache=True, nogil=True)
+def _corners_inside(x, y, size, cx, cy, radius):
+    for i in range(2):
+        for j in range(2):
+            dx = -1 + (x + i) * size - cx
+            dy = -1 + (y + j) * size - cy
+            if np.sqrt(dx**2 + dy**2) >= radius:
+                return False
+
+    return True
+
+
+@numba.njit(cache=True, nogil=True)
+def _add_lens_voxels(
+    cell, cx, cy, radius, offsets, order, gbc, flat_indices, data, out, i
+):
+    # Add the voxels of the cell that are in the lens to `out[i]`
+    count = 0
+    for k in range(offsets[cell], offsets[cell + 1]):
+        p = order[k]
+        dx = gbc[p, 0] - cx
+        dy = gbc[p, 1] - cy
+        if np.sqrt(dx**2 + dy**2) < radius:
+            _add_composition(data, flat_indices[p], out, i)
+            count += 1
+
+    return count
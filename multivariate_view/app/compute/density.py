@@ -0,0 +1,44 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+from .parallel import chunk_bounds
+
+
+@profiled
+def compute_density(gbc: np.ndarray, resolution: int = 128) -> np.ndarray:
+    """Count the GBC points in a 2D grid over [-1, 1] x [-1, 1]
+
+    The result has a shape of `(resolution, resolution)`, indexed by
+    `[y, x]`. Points outside of the grid are clamped to its border.
+    """
+    return _density_counts(gbc, chunk_bounds(len(gbc)), resolution)
+
+
+def density_to_image(counts: np.ndarray) -> bytes:
+    """Log scale density counts to an 8-bit grayscale image
+
+    The image is returned as raw bytes in row-major order.
+    """
+    max_count = counts.max()
+    if max_count == 0:
+        return bytes(counts.size)
+
+    image = np.log1p(counts) / np.log1p(max_count) * 255
+    return np.round(image).astype(np.uint8).tobytes()
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _density_counts(gbc, bounds, resolution):
+    num_chunks = len(bounds) - 1
+    chunk_counts = np.zeros((num_chunks, resolution, resolution), np.int64)
+    scale = resolution / 2
+    for c in numba.prange(num_chunks):
+        for i in range(bounds[c], bounds[c + 1]):
+            x = int((gbc[i, 0] + 1) * scale)
+            y = int((gbc[i, 1] + 1) * scale)
+            x = min(max(x, 0), resolution - 1)
+            y = min(max(y, 0), resolution - 1)
+            chunk_counts[c, y, x] += 1
+
+    return chunk_counts.sum(axis=0)
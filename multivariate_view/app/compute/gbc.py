@@ -1,7 +1,10 @@
 import numba
 import numpy as np
 
+from ..profiling import profiled
 
+
+@profiled(category='kernel')
 @numba.njit(cache=True, nogil=True)
 def compute_gbc(data: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
     # Compute dimensions
@@ -62,6 +65,7 @@ def compute_gbc(data: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
     return gbc, components
 
 
+@profiled(category='kernel')
 @numba.njit(cache=True, nogil=True)
 def rotate_coordinates(coords, angle):
     """Rotate coordinates by the angle (radians) about the origin"""
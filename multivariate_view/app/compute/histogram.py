@@ -0,0 +1,201 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+from .parallel import chunk_bounds
+
+# Values with a magnitude at or below this are treated as zero, which
+# matches `np.isclose(x, 0)`.
+ZERO_ATOL = 1e-8
+
+
+class HistogramCache:
+    """Histogram counts of every channel, computed once
+
+    The bin index of every channel of every voxel is kept so that the
+    histograms of any subset of voxels can be computed, and updated
+    incrementally, using the same binning. Voxels that are zero in
+    every channel are assigned the bin `num_bins`, and are never counted.
+    """
+
+    @profiled
+    def __init__(self, data: np.ndarray, num_bins: int = 200):
+        bounds = chunk_bounds(len(data))
+        lo, hi = _channel_ranges(data, bounds, ZERO_ATOL)
+
+        # Same as `np.histogram()` when the range is empty
+        empty = lo >= hi
+        lo[empty] -= 0.5
+        hi[empty] += 0.5
+
+        dtype = np.uint8 if num_bins < 255 else np.uint16
+        bins = np.empty(data.shape, dtype=dtype)
+        self.counts = _bin_data(
+            data, bounds, lo, hi, num_bins, ZERO_ATOL, bins
+        )
+        self.bins = bins
+        self.num_bins = num_bins
+        self.edges = np.linspace(lo, hi, num_bins + 1, axis=1)
+
+    @classmethod
+    def from_arrays(
+        cls, counts: np.ndarray, bins: np.ndarray, edges: np.ndarray
+    ) -> 'HistogramCache':
+        """Restore a cache from its arrays, e.g. after storing them"""
+        cache = cls.__new__(cls)
+        cache.counts = counts
+        cache.bins = bins
+        cache.num_bins = counts.shape[1]
+        cache.edges = edges
+        return cache
+
+    def subset_counts(self, indices: np.ndarray) -> np.ndarray:
+        """Compute the counts of the voxels at the flattened indices"""
+        counts = np.zeros_like(self.counts)
+        _accumulate_counts(self.bins, indices, 1, counts)
+        return counts
+
+
+class SelectionHistograms:
+    """Histograms of a selection that are updated incrementally
+
+    The selection is a boolean mask over the voxels at `indices`.
+    When it changes, only the voxels entering or leaving the selection
+    are added or removed, unless most of the selection changed.
+    """
+
+    def __init__(self, cache: HistogramCache, indices: np.ndarray):
+        self.cache = cache
+        self.indices = indices
+        self.mask = None
+        self.counts = None
+
+    def update(self, mask: np.ndarray) -> np.ndarray:
+        if self.mask is None:
+            changed = None
+        else:
+            changed = np.nonzero(mask != self.mask)[0]
+
+        if changed is None or len(changed) > mask.sum():
+            # Recomputing is cheaper
+            self.counts = self.cache.subset_counts(self.indices[mask])
+        elif len(changed) > 0:
+            entering = changed[mask[changed]]
+            leaving = changed[~mask[changed]]
+            bins = self.cache.bins
+            _accumulate_counts(bins, self.indices[entering], 1, self.counts)
+            _accumulate_counts(bins, self.indices[leaving], -1, self.counts)
+
+        self.mask = mask.copy()
+        return self.counts
+
+
+def scale_histogram(
+    counts: np.ndarray, use_log: bool, reference: np.ndarray | None = None
+) -> np.ndarray:
+    """Scale histogram counts to 8-bit integer percentages of the max count
+
+    If `use_log` is set, non-zero counts are log scaled first.
+    If `reference` counts are provided, their max is used instead, so
+    that the histogram of a subset can be drawn on top of the full one.
+    """
+    counts = _scale_counts(counts, use_log)
+    if reference is None:
+        max_count = counts.max()
+    else:
+        max_count = _scale_counts(reference, use_log).max()
+
+    if max_count <= 0:
+        return np.zeros(len(counts), dtype=np.uint8)
+
+    return (counts / max_count * 100).astype(np.uint8)
+
+
+def _scale_counts(counts, use_log):
+    counts = counts.astype(float)
+    if use_log:
+        # Ignore zeros
+        nonzero = counts > 0
+        counts[nonzero] = np.log10(counts[nonzero])
+
+    return counts
+
+
+@numba.njit(cache=True, nogil=True)
+def _is_zero_row(data, i, atol):
+    for k in range(data.shape[1]):
+        if abs(data[i, k]) > atol:
+            return False
+
+    return True
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _channel_ranges(data, bounds, atol):
+    # Min and max of each channel over the rows that are not all zero
+    n = data.shape[1]
+    num_chunks = len(bounds) - 1
+
+    chunk_lo = np.full((num_chunks, n), np.inf)
+    chunk_hi = np.full((num_chunks, n), -np.inf)
+    for c in numba.prange(num_chunks):
+        for i in range(bounds[c], bounds[c + 1]):
+            if _is_zero_row(data, i, atol):
+                continue
+
+            for k in range(n):
+                v = data[i, k]
+                if v < chunk_lo[c, k]:
+                    chunk_lo[c, k] = v
+                if v > chunk_hi[c, k]:
+                    chunk_hi[c, k] = v
+
+    lo = np.empty(n)
+    hi = np.empty(n)
+    for k in range(n):
+        lo[k] = chunk_lo[:, k].min()
+        hi[k] = chunk_hi[:, k].max()
+
+        if lo[k] > hi[k]:
+            # Every row is zero
+            lo[k] = 0
+            hi[k] = 0
+
+    return lo, hi
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _bin_data(data, bounds, lo, hi, num_bins, atol, bins):
+    # Store the bin index of every value, and count them, in one pass
+    n = data.shape[1]
+    num_chunks = len(bounds) - 1
+
+    norm = num_bins / (hi - lo)
+    chunk_counts = np.zeros((num_chunks, n, num_bins), dtype=np.int64)
+    for c in numba.prange(num_chunks):
+        for i in range(bounds[c], bounds[c + 1]):
+            if _is_zero_row(data, i, atol):
+                bins[i] = num_bins
+                continue
+
+            for k in range(n):
+                b = int((data[i, k] - lo[k]) * norm[k])
+                if b < 0:
+                    b = 0
+                elif b >= num_bins:
+                    b = num_bins - 1
+
+                bins[i, k] = b
+                chunk_counts[c, k, b] += 1
+
+    return chunk_counts.sum(axis=0)
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _accumulate_counts(bins, indices, sign, counts):
+    num_bins = counts.shape[1]
+    for k in numba.prange(bins.shape[1]):
+        for i in indices:
+            b = bins[i, k]
+            if b < num_bins:
+                counts[k, b] += sign
@@ -1,7 +1,10 @@
 import numba
 import numpy as np
 
+from ..profiling import profiled
 
+
+@profiled
 def gbc_to_rgb(gbc: np.ndarray, lightness=0.55) -> np.ndarray:
     hsl = gbc_to_hsl(gbc, lightness)
     return hsl_to_rgb(hsl)
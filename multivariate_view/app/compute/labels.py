@@ -0,0 +1,132 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+
+
+class LabelIndex:
+    """CSR-style lists of the flattened voxel indices of each label
+
+    The voxels of the label `values[i]` are
+    `indices[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(self, values, offsets, indices):
+        self.values = values
+        self.offsets = offsets
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.values)
+
+    def position(self, value) -> int:
+        """Get the position of a label value, or -1 if it is not present"""
+        i = np.searchsorted(self.values, value)
+        if i < len(self.values) and self.values[i] == value:
+            return int(i)
+
+        return -1
+
+    def voxels_at(self, i: int) -> np.ndarray:
+        return self.indices[self.offsets[i] : self.offsets[i + 1]]
+
+    def voxels(self, value) -> np.ndarray:
+        """Get the flattened voxel indices that have the label value"""
+        i = self.position(value)
+        if i < 0:
+            return self.indices[:0]
+
+        return self.voxels_at(i)
+
+
+@profiled
+def build_label_index(label_map: np.ndarray) -> LabelIndex:
+    """Build the per-label voxel lists of a label map
+
+    The label map is flattened with C ordering, matching the flattened
+    volume used throughout the application.
+    """
+    values, inverse, counts = np.unique(
+        label_map.ravel(), return_inverse=True, return_counts=True
+    )
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    indices = _bucket_indices(inverse.ravel(), offsets)
+
+    return LabelIndex(values, offsets, indices)
+
+
+@numba.njit(cache=True, nogil=True)
+def _bucket_indices(inverse, offsets):
+    # Counting sort of the voxel indices by label position
+    cursor = offsets[:-1].copy()
+    indices = np.empty(len(inverse), dtype=np.int64)
+    for i in range(len(inverse)):
+        label = inverse[i]
+        indices[cursor[label]] = i
+        cursor[label] += 1
+
+    return indices
+
+
+def selection_factors(
+    label_index: LabelIndex, selection, multiplier: float
+) -> np.ndarray:
+    """Compute the opacity factor of every label for a table selection
+
+    If nothing is selected, every label keeps its full opacity.
+    Otherwise, labels that are not selected are scaled by the multiplier.
+    """
+    if not selection:
+        return np.ones(len(label_index))
+
+    factors = np.full(len(label_index), float(multiplier))
+    for value in selection:
+        i = label_index.position(value)
+        if i >= 0:
+            factors[i] = 1
+
+    return factors
+
+
+def label_mask(
+    label_index: LabelIndex, values, flat_indices: np.ndarray
+) -> np.ndarray:
+    """Find which of the sorted flattened indices have one of the labels"""
+    mask = np.zeros(len(flat_indices), dtype=bool)
+    for value in values:
+        voxels = label_index.voxels(value)
+        positions = np.searchsorted(flat_indices, voxels)
+        found = positions < len(flat_indices)
+        found[found] = flat_indices[positions[found]] == voxels[found]
+        mask[positions[found]] = True
+
+    return mask
+
+
+def apply_label_factors(
+    alpha: np.ndarray,
+    base_alpha: np.ndarray,
+    label_index: LabelIndex,
+    factors: np.ndarray,
+    previous_factors: np.ndarray | None = None,
+) -> int:
+    """Scale the alpha of each label by its factor
+
+    If the previously applied factors are provided, only the voxels of
+    labels whose factor changed are touched.
+
+    The number of modified voxels is returned.
+    """
+    if previous_factors is None:
+        changed = np.arange(len(label_index))
+    else:
+        changed = np.nonzero(factors != previous_factors)[0]
+
+    num_modified = 0
+    for i in changed:
+        idx = label_index.voxels_at(i)
+        alpha[idx] = base_alpha[idx] * factors[i]
+        num_modified += len(idx)
+
+    return num_modified
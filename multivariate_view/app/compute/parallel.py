@@ -0,0 +1,32 @@
+import numba
+import numpy as np
+
+
+def chunk_bounds(num_rows: int) -> np.ndarray:
+    """Split rows into chunks that are processed in parallel
+
+    Kernels iterate over the chunks with `numba.prange`, accumulating
+    into per-chunk buffers that are reduced afterwards. Chunk `i` is
+    the rows `bounds[i]:bounds[i + 1]`.
+    """
+    num_chunks = max(min(numba.get_num_threads() * 4, num_rows), 1)
+    return np.linspace(0, num_rows, num_chunks + 1).astype(np.int64)
+
+
+def start_threading_layer():
+    """Start the threads of the parallel kernels from the calling thread
+
+    This must be called from the main thread before any parallel kernel
+    runs in a worker thread. Otherwise, the TBB threading layer may hang
+    when the interpreter exits.
+    """
+    _sum_chunks(chunk_bounds(1))
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _sum_chunks(bounds):
+    total = 0
+    for i in numba.prange(len(bounds) - 1):
+        total += bounds[i + 1] - bounds[i]
+
+    return total
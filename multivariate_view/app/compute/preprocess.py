@@ -0,0 +1,142 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+from .parallel import chunk_bounds
+
+# Normalized values with a magnitude at or below this are treated as
+# zero, which matches `np.isclose(x, 0)`.
+ZERO_ATOL = 1e-8
+
+
+@profiled(category='kernel')
+@numba.njit(cache=True, nogil=True)
+def remove_padding_uniform(data: np.ndarray) -> np.ndarray:
+    num_channels = data.shape[-1]
+    zero_data = np.isclose(data, 0).sum(axis=3) == num_channels
+
+    # This is the number to crop
+    n = 0
+    indices = np.array([n, -n - 1])
+    while (
+        zero_data[indices].all()
+        & zero_data[:, indices].all()
+        & zero_data[:, :, indices].all()
+    ):
+        n += 1
+        indices = np.array([n, -n - 1])
+
+    if n != 0:
+        data = data[n : -n - 1, n : -n - 1, n : -n - 1]
+
+    return data
+
+
+def padding_width(data: np.ndarray, cropped: np.ndarray) -> int:
+    """The width of the padding removed by `remove_padding_uniform`"""
+    return (data.shape[0] - cropped.shape[0]) // 2
+
+
+def crop_padding(data: np.ndarray, width: int) -> np.ndarray:
+    """Crop padding like `remove_padding_uniform`, given its width"""
+    if width == 0:
+        return data
+
+    n = width
+    return data[n : -n - 1, n : -n - 1, n : -n - 1]
+
+
+@numba.njit(cache=True, nogil=True)
+def normalize_data(data: np.ndarray, new_min: float = 0, new_max: float = 1):
+    max_val = data.max()
+    min_val = data.min()
+
+    return (new_max - new_min) * (data.astype(np.float64) - min_val) / (
+        max_val - min_val
+    ) + new_min
+
+
+@profiled
+def normalize_channels(data: np.ndarray, separately: bool) -> np.ndarray:
+    """Normalize the channels (the last axis) to be between 0 and 1
+
+    The channels are normalized either separately, or all together.
+    The data is not modified. It may be read-only.
+    """
+    if not separately:
+        return normalize_data(data)
+
+    normalized = np.empty(data.shape)
+    for i in range(data.shape[-1]):
+        normalized[..., i] = normalize_data(data[..., i])
+
+    return normalized
+
+
+@profiled
+def nonzero_voxels(flattened_data: np.ndarray) -> np.ndarray:
+    """Find the voxels (rows) that are nonzero in at least one channel"""
+    return ~np.all(np.isclose(flattened_data, 0), axis=1)
+
+
+def normalization_ranges(
+    data: np.ndarray, separately: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    """Compute the `(lo, hi)` values of each channel that map to 0 and 1
+
+    These are the ranges used by `normalize_channels`, so the data may
+    be kept as is, and only the rows that are needed normalized with
+    `normalize_rows`. The ranges have the dtype of the data.
+    """
+    num_channels = data.shape[-1]
+    if not separately:
+        lo = np.full(num_channels, data.min(), dtype=data.dtype)
+        hi = np.full(num_channels, data.max(), dtype=data.dtype)
+        return lo, hi
+
+    axes = tuple(range(data.ndim - 1))
+    return data.min(axis=axes), data.max(axis=axes)
+
+
+def normalize_rows(data: np.ndarray, lo: np.ndarray, hi: np.ndarray):
+    """Normalize the channels (the last axis) with `normalization_ranges`
+
+    The result is the same as normalizing all of the data with
+    `normalize_channels`, and then selecting the rows.
+    """
+    return (data.astype(np.float64) - lo) / (hi - lo)
+
+
+@profiled
+def normalized_nonzero_voxels(
+    flattened_data: np.ndarray, lo: np.ndarray, hi: np.ndarray
+) -> np.ndarray:
+    """Find the voxels (rows) that are nonzero once normalized
+
+    This matches `nonzero_voxels` of the normalized rows, without
+    normalizing them.
+    """
+    return _normalized_nonzero(
+        flattened_data,
+        lo.astype(np.float64),
+        (hi - lo).astype(np.float64),
+        chunk_bounds(len(flattened_data)),
+        ZERO_ATOL,
+    )
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _normalized_nonzero(data, lo, span, bounds, atol):
+    nonzero = np.zeros(len(data), dtype=np.bool_)
+    for chunk in numba.prange(len(bounds) - 1):
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            for j in range(data.shape[1]):
+                # An empty range normalizes to NaN or infinity
+                if (
+                    span[j] == 0
+                    or not abs((data[i, j] - lo[j]) / span[j]) <= atol
+                ):
+                    nonzero[i] = True
+                    break
+
+    return nonzero
@@ -0,0 +1,193 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+from .gbc import compute_gbc
+from .voxels import VoxelIndex, index_dtype
+
+
+class PyramidLevel:
+    """A downsampled copy of the nonzero voxels and their GBC
+
+    Each voxel of the level is the mean of a `factor`^3 block of voxels
+    at full resolution. Blocks on the upper edges may be partial. The
+    nonzero voxels of the level are those of its `VoxelIndex`.
+    """
+
+    def __init__(self, factor, shape, index: VoxelIndex, nonzero_data, gbc):
+        self.factor = factor
+        self.shape = shape
+        self.index = index
+        self.nonzero_data = nonzero_data
+        self.gbc = gbc
+
+    @property
+    def num_voxels(self) -> int:
+        return int(np.prod(self.shape))
+
+
+@profiled
+def build_level(
+    flat_indices: np.ndarray,
+    nonzero_data: np.ndarray,
+    shape: tuple[int],
+    factor: int,
+) -> PyramidLevel:
+    """Downsample the nonzero voxels at the flattened indices by a factor
+
+    Only the nonzero voxels are visited, and only the blocks that they
+    are in are kept, so no dense array of the volume (or of the level) is
+    built. Since the indices are sorted, the voxels of each layer of
+    blocks are consecutive, and the layers are summed in parallel.
+    """
+    nz, ny, nx = shape
+    coarse_shape = tuple(-(-n // factor) for n in shape)
+
+    # The position of the first voxel of each layer of blocks
+    layer_starts = np.minimum(
+        np.arange(coarse_shape[0] + 1) * factor * ny * nx, nz * ny * nx
+    )
+    layer_bounds = np.searchsorted(
+        flat_indices, layer_starts.astype(flat_indices.dtype)
+    )
+
+    # Like `build_voxel_index`, count the blocks of each layer first, so
+    # that each layer knows where to write them
+    counts = _count_blocks(flat_indices, layer_bounds, np.array(shape), factor)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    num_blocks = offsets[-1]
+    blocks = np.empty(num_blocks, dtype=index_dtype(np.prod(coarse_shape)))
+    data = np.empty((num_blocks, nonzero_data.shape[1]))
+    _mean_blocks(
+        flat_indices,
+        nonzero_data,
+        layer_bounds,
+        offsets,
+        np.array(shape),
+        factor,
+        blocks,
+        data,
+    )
+
+    nonzero = ~np.all(np.isclose(data, 0), axis=1)
+    if not nonzero.all():
+        blocks = blocks[nonzero]
+        data = data[nonzero]
+
+    gbc, _ = compute_gbc(data)
+    index = VoxelIndex(coarse_shape, blocks)
+    return PyramidLevel(factor, coarse_shape, index, data, gbc)
+
+
+class LatencyModel:
+    """Estimate the time to update the volume from its number of voxels
+
+    The time per voxel is a running average of the recorded updates.
+    """
+
+    def __init__(self, smoothing: float = 0.5):
+        self.smoothing = smoothing
+        self.seconds_per_voxel = None
+
+    def record(self, num_voxels: int, seconds: float):
+        if num_voxels == 0:
+            return
+
+        value = seconds / num_voxels
+        if self.seconds_per_voxel is None:
+            self.seconds_per_voxel = value
+        else:
+            self.seconds_per_voxel += self.smoothing * (
+                value - self.seconds_per_voxel
+            )
+
+    def estimate(self, num_voxels: int) -> float | None:
+        if self.seconds_per_voxel is None:
+            return None
+
+        return num_voxels * self.seconds_per_voxel
+
+
+def choose_level(
+    levels: list[PyramidLevel],
+    num_voxels: int,
+    latency: LatencyModel,
+    target: float,
+    fraction: float = 1.0,
+) -> PyramidLevel | None:
+    """Choose the finest level that can be updated within the target
+
+    `None` is returned if full resolution (with `num_voxels`) is fast
+    enough, or if there is no estimate yet. Levels are ordered from the
+    finest to the coarsest, and the coarsest is used if none are fast
+    enough. Only a `fraction` of the voxels of each level is updated,
+    e.g. when the volume is clipped.
+    """
+    estimate = latency.estimate(num_voxels)
+    if not levels or estimate is None or estimate <= target:
+        return None
+
+    for level in levels:
+        if latency.estimate(level.num_voxels * fraction) <= target:
+            return level
+
+    return levels[-1]
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _count_blocks(flat_indices, layer_bounds, shape, factor):
+    # The number of blocks of each layer that have nonzero voxels
+    _, ny, nx = shape
+    cy = -(-ny // factor)
+    cx = -(-nx // factor)
+
+    counts = np.zeros(len(layer_bounds) - 1, dtype=np.int64)
+    for layer in numba.prange(len(layer_bounds) - 1):
+        occupied = np.zeros(cy * cx, dtype=np.bool_)
+        for i in range(layer_bounds[layer], layer_bounds[layer + 1]):
+            idx = flat_indices[i]
+            cell = ((idx // nx) % ny // factor) * cx + idx % nx // factor
+            if not occupied[cell]:
+                occupied[cell] = True
+                counts[layer] += 1
+
+    return counts
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _mean_blocks(
+    flat_indices, values, layer_bounds, offsets, shape, factor, blocks, out
+):
+    # Each layer sums its voxels by block, and writes the linear indices
+    # and the means of its occupied blocks after those of the previous
+    # layers. Blocks on the upper edges may be partial.
+    nz, ny, nx = shape
+    cy = -(-ny // factor)
+    cx = -(-nx // factor)
+
+    for layer in numba.prange(len(layer_bounds) - 1):
+        sums = np.zeros((cy * cx, values.shape[1]))
+        occupied = np.zeros(cy * cx, dtype=np.bool_)
+        for i in range(layer_bounds[layer], layer_bounds[layer + 1]):
+            idx = flat_indices[i]
+            cell = ((idx // nx) % ny // factor) * cx + idx % nx // factor
+            occupied[cell] = True
+            for k in range(values.shape[1]):
+                sums[cell, k] += values[i, k]
+
+        depth = min(factor, nz - layer * factor)
+        j = offsets[layer]
+        for cell in range(cy * cx):
+            if not occupied[cell]:
+                continue
+
+            height = min(factor, ny - cell // cx * factor)
+            width = min(factor, nx - cell % cx * factor)
+            volume = depth * height * width
+            blocks[j] = layer * cy * cx + cell
+            for k in range(values.shape[1]):
+                out[j, k] = sums[cell, k] / volume
+
+            j += 1
@@ -0,0 +1,31 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+from .parallel import chunk_bounds
+
+
+@profiled
+def masked_rgba_uint8(rgba: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Convert RGBA values between 0 and 1 to unsigned char
+
+    The alpha of the voxels where the mask is zero is set to zero. This is
+    what the GPU mapper renders with a binary mask.
+    """
+    return _masked_rgba_uint8(rgba, mask, chunk_bounds(len(rgba)))
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _masked_rgba_uint8(rgba, mask, bounds):
+    result = np.empty((len(rgba), 4), dtype=np.uint8)
+    for chunk in numba.prange(len(bounds) - 1):
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            for j in range(4):
+                value = rgba[i, j]
+                if j == 3 and mask[i] == 0:
+                    value = 0
+
+                value = min(max(value, 0), 1)
+                result[i, j] = np.uint8(value * 255 + 0.5)
+
+    return result
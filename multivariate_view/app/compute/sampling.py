@@ -0,0 +1,89 @@
+import numpy as np
+
+from ..profiling import profiled
+from .bin import bin_indices, data_topology_reduction, target_bin_size
+
+
+class GBCSampler:
+    """Sample GBC points for the color map
+
+    A single random permutation of the points is computed, so a random
+    sample of any size is a prefix of it, and sampling again with the
+    same parameters gives the same result. Results are cached for every
+    `(num_bins, sample_size, stratified)` that was requested.
+
+    If `stratified` is set, the whole population is binned instead, and
+    every non-empty bin keeps a uniform random sample of its points
+    (its first points in permutation order). This ensures that rare
+    compositions are represented, even with small sample sizes.
+    """
+
+    @profiled
+    def __init__(self, gbc: np.ndarray, seed=None):
+        self.gbc = gbc
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        self.permutation = rng.permutation(len(gbc))
+
+        self._results = {}
+        self._strata = {}
+
+    def sample(self, size: int) -> np.ndarray:
+        """Get a random sample (without replacement) of the points"""
+        return self.gbc[self.permutation[:size]]
+
+    @profiled
+    def bin_data(
+        self, num_bins: int, sample_size: int, stratified: bool = False
+    ) -> np.ndarray:
+        key = (num_bins, sample_size, stratified)
+        if key not in self._results:
+            if stratified:
+                result = self._stratified_bin_data(num_bins, sample_size)
+            else:
+                # Use a separate generator for every call, so results
+                # do not depend on the order parameters are requested.
+                rng = np.random.default_rng(self._seed_for(key))
+                data = self.sample(sample_size)
+                result = data_topology_reduction(data, num_bins, rng.random)
+
+            self._results[key] = result
+
+        return self._results[key]
+
+    def _seed_for(self, key):
+        if self.seed is None:
+            return None
+
+        return [self.seed, *map(int, key)]
+
+    def _stratified_bin_data(self, num_bins, sample_size):
+        order, offsets = self._bin_permutation(num_bins)
+        counts = np.diff(offsets)
+        nonzero = np.nonzero(counts)[0]
+
+        # Size each bin as in the topology reduction of a random sample,
+        # but keep at least one point of every bin.
+        expected = counts[nonzero] * sample_size / max(len(self.gbc), 1)
+        q = []
+        for i, num_expected in zip(nonzero, expected):
+            target = int(np.ceil(target_bin_size(max(num_expected, 1))))
+            target = min(target, counts[i])
+            q.append(order[offsets[i] : offsets[i] + target])
+
+        if not q:
+            return np.empty((0, 2))
+
+        return self.gbc[np.concatenate(q)]
+
+    def _bin_permutation(self, num_bins):
+        # The point indices grouped by bin, in permutation order
+        if num_bins not in self._strata:
+            indices = bin_indices(self.gbc[self.permutation], num_bins)
+            order = self.permutation[np.argsort(indices, kind='stable')]
+            counts = np.bincount(indices, minlength=num_bins**2)
+            offsets = np.concatenate(([0], np.cumsum(counts)))
+            self._strata[num_bins] = (order, offsets)
+
+        return self._strata[num_bins]
@@ -0,0 +1,283 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+from .density import compute_density
+from .parallel import chunk_bounds
+from .voxels import VoxelIndex
+
+SEGMENTATION_METHODS = ('composition', 'gbc', 'density')
+
+# Voxels per batch, and number of batches, of the mini-batch k-means
+BATCH_SIZE = 4096
+NUM_BATCHES = 100
+
+# Number of voxels sampled to choose the initial centers
+INIT_SAMPLES = 20000
+
+# Number of cells along each axis of the grid of the density clustering
+GRID_RESOLUTION = 128
+
+# Number of blurs of the density, so that noise does not make peaks
+SMOOTHING_PASSES = 3
+
+
+@profiled
+def segment_voxels(
+    method: str,
+    nonzero_data: np.ndarray,
+    gbc: np.ndarray,
+    num_clusters: int,
+    seed: int | None = None,
+) -> np.ndarray:
+    """Cluster the nonzero voxels into phases
+
+    With 'composition' and 'gbc', the compositions of the voxels (each
+    voxel divided by its sum) or their unrotated GBC positions are
+    clustered with mini-batch k-means. With 'density', the voxels are
+    clustered by the peaks of the density of their GBC positions, and
+    `num_clusters` is the most clusters. Every pass over all the voxels
+    is linear, and parallel.
+
+    The cluster of each voxel is returned, from 1 to `num_clusters`. The
+    clusters are numbered by decreasing number of voxels.
+    """
+    if method == 'density':
+        clusters = density_clusters(gbc, num_clusters)
+    elif method in ('composition', 'gbc'):
+        features = gbc
+        if method == 'composition':
+            features = compositions(nonzero_data)
+
+        centers = minibatch_kmeans(features, num_clusters, seed=seed)
+        clusters = nearest_centers(features, centers)
+    else:
+        msg = f'Unknown segmentation method: {method}'
+        raise ValueError(msg)
+
+    # Number the clusters by size
+    counts = np.bincount(clusters, minlength=num_clusters)
+    order = np.argsort(-counts, kind='stable')
+    numbers = np.empty(num_clusters, dtype=np.int32)
+    numbers[order] = np.arange(1, num_clusters + 1)
+    return numbers[clusters]
+
+
+def segmentation_label_map(
+    index: VoxelIndex, clusters: np.ndarray, num_clusters: int
+) -> np.ndarray:
+    """The label map of the clusters of the voxels of an index
+
+    The voxels that are not in the index are labeled 0.
+    """
+    dtype = np.min_scalar_type(num_clusters)
+    label_map = np.zeros(index.num_voxels, dtype=dtype)
+    index.scatter(clusters.astype(dtype), label_map)
+    return label_map.reshape(index.shape)
+
+
+@profiled
+def compositions(nonzero_data: np.ndarray) -> np.ndarray:
+    """Divide each voxel by its sum. Voxels that sum to zero are zero."""
+    return _compositions(nonzero_data, chunk_bounds(len(nonzero_data)))
+
+
+@profiled
+def minibatch_kmeans(
+    features: np.ndarray,
+    num_clusters: int,
+    batch_size: int = BATCH_SIZE,
+    num_batches: int = NUM_BATCHES,
+    seed: int | None = None,
+) -> np.ndarray:
+    """Find the centers of clusters of the rows, with mini-batch k-means
+
+    The initial centers are chosen with k-means++ from a sample of the
+    rows. Each batch of random rows then moves the centers towards the
+    rows nearest to them (Sculley, 2010), so the time does not depend on
+    the number of rows.
+    """
+    rng = np.random.default_rng(seed)
+    features = np.asarray(features, dtype=np.float64)
+    if len(features) == 0:
+        return np.zeros((num_clusters, features.shape[1]))
+
+    sample = features[rng.integers(0, len(features), INIT_SAMPLES)]
+    centers = _kmeans_plus_plus(sample, num_clusters, rng)
+
+    counts = np.zeros(num_clusters, dtype=np.int64)
+    for _ in range(num_batches):
+        batch = features[rng.integers(0, len(features), batch_size)]
+        _update_centers(
+            batch, nearest_centers(batch, centers), centers, counts
+        )
+
+    return centers
+
+
+@profiled
+def nearest_centers(features: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """The position of the nearest center of each row"""
+    return _nearest_centers(features, centers, chunk_bounds(len(features)))
+
+
+@profiled
+def density_clusters(
+    gbc: np.ndarray, num_clusters: int, resolution: int = GRID_RESOLUTION
+) -> np.ndarray:
+    """Cluster GBC positions by the peaks of their density
+
+    The positions are counted in a grid, which is smoothed. Each cell
+    climbs to its densest neighbor until it reaches a peak. The cells of
+    each of the `num_clusters` densest peaks form a cluster, and those of
+    the other peaks join the cluster of the nearest of them. The cluster
+    of each position is returned.
+    """
+    if len(gbc) == 0:
+        return np.zeros(0, dtype=np.int32)
+
+    density = _smooth(compute_density(gbc, resolution).astype(np.float64))
+    peaks = _climb(density)
+
+    roots = np.unique(peaks)
+    roots = roots[np.argsort(-density.ravel()[roots], kind='stable')]
+    kept = roots[:num_clusters]
+    kept = kept[density.ravel()[kept] > 0]
+
+    # The cluster of each root is the nearest kept root
+    root_y, root_x = np.divmod(roots, resolution)
+    kept_y, kept_x = np.divmod(kept, resolution)
+    distances = (root_y[:, np.newaxis] - kept_y) ** 2 + (
+        root_x[:, np.newaxis] - kept_x
+    ) ** 2
+    cell_clusters = np.zeros(resolution**2, dtype=np.int32)
+    cell_clusters[roots] = np.argmin(distances, axis=1)
+
+    return _point_clusters(
+        gbc, cell_clusters[peaks], resolution, chunk_bounds(len(gbc))
+    )
+
+
+def _kmeans_plus_plus(points, num_clusters, rng):
+    # Choose each center with a probability proportional to the squared
+    # distance of the points to the nearest center
+    centers = np.empty((num_clusters, points.shape[1]))
+    centers[0] = points[rng.integers(len(points))]
+    distances = ((points - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, num_clusters):
+        total = distances.sum()
+        if total > 0:
+            j = rng.choice(len(points), p=distances / total)
+        else:
+            # There are fewer distinct points than clusters
+            j = rng.integers(len(points))
+
+        centers[i] = points[j]
+        distances = np.minimum(distances, ((points - centers[i]) ** 2).sum(1))
+
+    return centers
+
+
+def _smooth(density):
+    # Binomial blurs along both axes
+    kernel = np.array([1, 4, 6, 4, 1]) / 16
+    for _ in range(SMOOTHING_PASSES):
+        for axis in (0, 1):
+            density = np.apply_along_axis(
+                np.convolve, axis, density, kernel, mode='same'
+            )
+
+    return density
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _compositions(data, bounds):
+    result = np.zeros(data.shape)
+    for chunk in numba.prange(len(bounds) - 1):
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            total = 0.0
+            for j in range(data.shape[1]):
+                total += data[i, j]
+
+            if total != 0:
+                for j in range(data.shape[1]):
+                    result[i, j] = data[i, j] / total
+
+    return result
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _nearest_centers(features, centers, bounds):
+    result = np.empty(len(features), dtype=np.int32)
+    for chunk in numba.prange(len(bounds) - 1):
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            best = 0
+            best_distance = np.inf
+            for c in range(len(centers)):
+                distance = 0.0
+                for j in range(features.shape[1]):
+                    distance += (features[i, j] - centers[c, j]) ** 2
+
+                if distance < best_distance:
+                    best = c
+                    best_distance = distance
+
+            result[i] = best
+
+    return result
+
+
+@numba.njit(cache=True, nogil=True)
+def _update_centers(batch, clusters, centers, counts):
+    # Move each center towards its rows, at a rate that decreases with
+    # the number of rows it has seen
+    for i in range(len(batch)):
+        c = clusters[i]
+        counts[c] += 1
+        rate = 1.0 / counts[c]
+        for j in range(batch.shape[1]):
+            centers[c, j] += rate * (batch[i, j] - centers[c, j])
+
+
+@numba.njit(cache=True, nogil=True)
+def _climb(density):
+    # The peak that each cell climbs to. Ties are broken by the position
+    # of the cells, so that plateaus climb to a single cell.
+    resolution = density.shape[0]
+    up = np.empty(resolution**2, dtype=np.int64)
+    for y in range(resolution):
+        for x in range(resolution):
+            best = y * resolution + x
+            best_density = density[y, x]
+            for yy in range(max(y - 1, 0), min(y + 2, resolution)):
+                for xx in range(max(x - 1, 0), min(x + 2, resolution)):
+                    cell = yy * resolution + xx
+                    d = density[yy, xx]
+                    if d > best_density or (d == best_density and cell > best):
+                        best = cell
+                        best_density = d
+
+            up[y * resolution + x] = best
+
+    for i in range(len(up)):
+        peak = i
+        while up[peak] != peak:
+            peak = up[peak]
+
+        up[i] = peak
+
+    return up
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _point_clusters(gbc, cell_clusters, resolution, bounds):
+    # The cells of the points are those of `compute_density`
+    result = np.empty(len(gbc), dtype=np.int32)
+    scale = resolution / 2
+    for chunk in numba.prange(len(bounds) - 1):
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            x = min(max(int((gbc[i, 0] + 1) * scale), 0), resolution - 1)
+            y = min(max(int((gbc[i, 1] + 1) * scale), 0), resolution - 1)
+            result[i] = cell_clusters[y * resolution + x]
+
+    return result
@@ -0,0 +1,82 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+from .labels import LabelIndex
+from .preprocess import normalize_rows
+
+
+@profiled
+def lens_alpha(
+    gbc: np.ndarray, center, radius: float, invert: bool = False
+) -> np.ndarray:
+    """Find the GBC points inside the lens (or outside, if inverted)"""
+    alpha = _compute_alpha(np.asarray(center, dtype=float), radius, gbc)
+    if invert:
+        alpha = np.invert(alpha)
+
+    return alpha
+
+
+def mean_composition(data: np.ndarray) -> np.ndarray:
+    """Compute the mean percentage of each channel over the voxels
+
+    Each voxel (row) is first divided by its sum, so every voxel has the
+    same weight. Voxels that sum to zero count as zero in every channel.
+    """
+    if data.shape[0] == 0:
+        return np.zeros(data.shape[1])
+
+    # divide each row with the row sum to create percentages for each voxel
+    row_sums = data.sum(axis=1)
+    percentage_per_voxel = np.divide(
+        data,
+        row_sums[:, None],
+        out=np.zeros_like(data, dtype=float),
+        where=row_sums[:, None] != 0,
+    )
+    return 100.0 * percentage_per_voxel.sum(axis=0) / data.shape[0]
+
+
+@profiled
+def label_means(
+    flattened_data: np.ndarray, label_index: LabelIndex, ranges=None
+) -> np.ndarray:
+    """Compute the mean fraction of each channel for every label
+
+    Voxels that are zero in every channel are ignored. The means of each
+    label add up to 1, or are 0 if all of its voxels are zero. The result
+    has a row per label.
+
+    If the `(lo, hi)` normalization ranges of the channels are provided,
+    the voxels of each label are normalized first.
+    """
+    means = np.empty((len(label_index), flattened_data.shape[1]))
+    for i in range(len(label_index)):
+        matching_voxels = flattened_data[label_index.voxels_at(i)]
+        if ranges is not None:
+            matching_voxels = normalize_rows(matching_voxels, *ranges)
+
+        # Remove voxels that are all close to zero
+        matching_voxels = matching_voxels[
+            ~np.all(np.isclose(matching_voxels, 0), axis=1)
+        ]
+
+        if len(matching_voxels) == 0:
+            means[i] = 0
+            continue
+
+        mean_values = matching_voxels.mean(axis=0)
+        # Get each mean to add up to 1
+        means[i] = mean_values / mean_values.sum()
+
+    return means
+
+
+@numba.njit(cache=True, nogil=True)
+def _compute_alpha(center, radius, gbc_data):
+    # Compute distance formula to lens center
+    distances = np.sqrt(((gbc_data - center) ** 2).sum(axis=1))
+
+    # Any distances less than the radius are within the lens
+    return distances < radius
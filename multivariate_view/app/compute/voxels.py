@@ -0,0 +1,275 @@
+import numba
+import numpy as np
+
+from ..profiling import profiled
+from .parallel import chunk_bounds
+from .preprocess import nonzero_voxels
+
+
+def index_dtype(num_voxels: int) -> np.dtype:
+    """The smallest integer type of the linear indices of a volume"""
+    if num_voxels <= np.iinfo(np.int32).max:
+        return np.dtype(np.int32)
+
+    return np.dtype(np.int64)
+
+
+class VoxelIndex:
+    """The sorted linear indices of some of the voxels of a volume
+
+    The indices follow the C ordering of the flattened volume, so the
+    voxels are visited in memory order. They are int32 unless the volume
+    is too large for them. This replaces a boolean mask of the whole
+    volume: gathering and scattering the voxels only visits them.
+
+    Arrays of the whole volume have a row per voxel (any further axes
+    are flattened), like `data.reshape(-1, num_channels)`.
+    """
+
+    def __init__(self, shape: tuple[int], indices: np.ndarray):
+        self.shape = tuple(shape)
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def num_voxels(self) -> int:
+        # The number of voxels of the volume
+        return int(np.prod(self.shape))
+
+    def mask(self) -> np.ndarray:
+        """The boolean mask of the voxels, of the flattened volume"""
+        mask = np.zeros(self.num_voxels, dtype=bool)
+        mask[self.indices] = True
+        return mask
+
+    @profiled
+    def gather(self, array: np.ndarray) -> np.ndarray:
+        """Get the rows of the voxels from an array of the volume"""
+        # The number of columns is explicit, since -1 is ambiguous when
+        # the volume or the index is empty
+        rows = array.reshape(self.num_voxels, int(np.prod(array.shape[1:])))
+        result = _gather_rows(rows, self.indices, chunk_bounds(len(self)))
+        return result.reshape(len(self), *array.shape[1:])
+
+    @profiled
+    def scatter(self, values: np.ndarray, out: np.ndarray):
+        """Set the rows of the voxels in an array of the volume
+
+        `out` must have a row per voxel. It may be a view, like a column
+        of a larger array.
+        """
+        if len(out) != self.num_voxels:
+            msg = f'Expected {self.num_voxels} rows, got {len(out)}'
+            raise ValueError(msg)
+
+        if out.ndim == 1:
+            out = out[:, np.newaxis]
+
+        values = np.asarray(values).reshape(len(self), out.shape[1])
+        _scatter_rows(values, self.indices, out, chunk_bounds(len(self)))
+
+
+class SparseVolume:
+    """The listed voxels of a volume, and their values
+
+    The voxels that are not listed are zero in every channel. `values`
+    has a row per voxel of the index, and a column per channel. Like the
+    dense data, the shape is `(*volume_shape, num_channels)`.
+    """
+
+    def __init__(self, index: VoxelIndex, values: np.ndarray):
+        self.index = index
+        self.values = values
+
+    @classmethod
+    def from_coordinates(
+        cls, coordinates: np.ndarray, shape: tuple[int], values: np.ndarray
+    ) -> 'SparseVolume':
+        """Build a sparse volume from the `(z, y, x)` rows of its voxels
+
+        The voxels may be listed in any order, but only once.
+        """
+        shape = tuple(int(x) for x in shape)
+        coordinates = np.asarray(coordinates, dtype=np.int64)
+        flat_indices = np.ravel_multi_index(tuple(coordinates.T), shape)
+        order = np.argsort(flat_indices, kind='stable')
+        flat_indices = flat_indices[order]
+        if np.any(flat_indices[1:] == flat_indices[:-1]):
+            raise ValueError('Voxels are listed more than once')
+
+        dtype = index_dtype(int(np.prod(shape)))
+        index = VoxelIndex(shape, flat_indices.astype(dtype))
+        return cls(index, np.ascontiguousarray(values[order]))
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def shape(self) -> tuple[int]:
+        return (*self.index.shape, self.values.shape[1])
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.values.dtype
+
+    @property
+    def num_voxels(self) -> int:
+        # The number of voxels of the volume, listed or not
+        return self.index.num_voxels
+
+    def coordinates(self) -> np.ndarray:
+        return np.stack(np.unravel_index(self.index.indices, self.index.shape))
+
+    def channel_ranges(self) -> tuple[np.ndarray, np.ndarray]:
+        """The min and max of each channel, ignoring NaN
+
+        The voxels that are not listed count as zeros.
+        """
+        if len(self) == 0:
+            zeros = np.zeros(self.shape[-1], dtype=self.dtype)
+            return zeros, zeros.copy()
+
+        lo = np.nanmin(self.values, axis=0)
+        hi = np.nanmax(self.values, axis=0)
+        if len(self) < self.num_voxels:
+            lo = np.minimum(lo, 0, dtype=self.dtype)
+            hi = np.maximum(hi, 0, dtype=self.dtype)
+
+        return lo, hi
+
+    def normalization_ranges(
+        self, separately: bool
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """The ranges of `preprocess.normalization_ranges` of the volume"""
+        lo, hi = self.channel_ranges()
+        if not separately:
+            lo = np.full_like(lo, lo.min())
+            hi = np.full_like(hi, hi.max())
+
+        return lo, hi
+
+    def padding_width(self) -> int:
+        """The width of the padding that `remove_padding_uniform` removes"""
+        nonzero = nonzero_voxels(self.values)
+        if not nonzero.any():
+            return 0
+
+        coordinates = self.coordinates()[:, nonzero]
+        sizes = np.array(self.index.shape)
+        return int(
+            min(
+                coordinates.min(axis=1).min(),
+                (sizes - 1 - coordinates.max(axis=1)).min(),
+            )
+        )
+
+    def crop(self, width: int) -> 'SparseVolume':
+        """Crop the padding like `preprocess.crop_padding`"""
+        if width == 0:
+            return self
+
+        shape = tuple(n - 2 * width - 1 for n in self.index.shape)
+        coordinates = self.coordinates() - width
+        sizes = np.array(shape)[:, np.newaxis]
+        inside = np.all((coordinates >= 0) & (coordinates < sizes), axis=0)
+        return self._select(inside, coordinates, shape)
+
+    def decimate(self, factor: int) -> 'SparseVolume':
+        """Keep every `factor` voxel along each axis, like slicing"""
+        if factor == 1:
+            return self
+
+        shape = tuple(-(-n // factor) for n in self.index.shape)
+        coordinates = self.coordinates()
+        kept = np.all(coordinates % factor == 0, axis=0)
+        return self._select(kept, coordinates // factor, shape)
+
+    def to_dense(self) -> np.ndarray:
+        """Materialize the volume, with zeros for the missing voxels"""
+        data = np.zeros(self.shape, dtype=self.dtype)
+        rows = data.reshape(self.num_voxels, self.shape[-1])
+        self.index.scatter(self.values, rows)
+        return data
+
+    def _select(self, mask, coordinates, shape):
+        # The coordinates are those of every voxel in the new shape. The
+        # C order of the voxels is unchanged.
+        flat_indices = np.ravel_multi_index(tuple(coordinates[:, mask]), shape)
+        dtype = index_dtype(int(np.prod(shape)))
+        index = VoxelIndex(shape, flat_indices.astype(dtype))
+        return SparseVolume(index, self.values[mask])
+
+
+@profiled
+def index_rows(
+    mask: np.ndarray, raw_index: VoxelIndex | None, shape: tuple[int]
+) -> tuple[VoxelIndex, VoxelIndex]:
+    """Index the voxels of the rows of the raw data in a mask
+
+    The raw data has a row per voxel of the volume, or per voxel of
+    `raw_index` if it is sparse. The index of the voxels, and the index
+    of their rows in the raw data, are returned.
+    """
+    rows = build_voxel_index(mask, (len(mask),))
+    if raw_index is None:
+        return VoxelIndex(shape, rows.indices), rows
+
+    return VoxelIndex(shape, rows.gather(raw_index.indices)), rows
+
+
+@profiled
+def build_voxel_index(mask: np.ndarray, shape: tuple[int]) -> VoxelIndex:
+    """Build the index of the voxels of a boolean mask of the volume"""
+    mask = mask.reshape(-1)
+    bounds = chunk_bounds(len(mask))
+    counts = _count_chunks(mask, bounds)
+
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    indices = np.empty(offsets[-1], dtype=index_dtype(len(mask)))
+    _fill_indices(mask, bounds, offsets, indices)
+
+    return VoxelIndex(shape, indices)
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _count_chunks(mask, bounds):
+    counts = np.zeros(len(bounds) - 1, dtype=np.int64)
+    for chunk in numba.prange(len(bounds) - 1):
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            if mask[i]:
+                counts[chunk] += 1
+
+    return counts
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _fill_indices(mask, bounds, offsets, indices):
+    # Each chunk writes its indices after those of the previous chunks
+    for chunk in numba.prange(len(bounds) - 1):
+        j = offsets[chunk]
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            if mask[i]:
+                indices[j] = i
+                j += 1
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _gather_rows(rows, indices, bounds):
+    result = np.empty((len(indices), rows.shape[1]), dtype=rows.dtype)
+    for chunk in numba.prange(len(bounds) - 1):
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            for j in range(rows.shape[1]):
+                result[i, j] = rows[indices[i], j]
+
+    return result
+
+
+@numba.njit(cache=True, nogil=True, parallel=True)
+def _scatter_rows(values, indices, out, bounds):
+    for chunk in numba.prange(len(bounds) - 1):
+        for i in range(bounds[chunk], bounds[chunk + 1]):
+            for j in range(values.shape[1]):
+                out[indices[i], j] = values[i, j]
@@ -0,0 +1,146 @@
+"""Compile the numba kernels before the data is loaded
+
+The first call of a kernel, for each combination of argument types,
+compiles it, or loads it from the on-disk cache. `warm_up()` runs the
+pipeline on a tiny volume instead, so this happens while the data is
+still being read, rather than on the way to the first frame.
+"""
+
+import numpy as np
+
+from ..profiling import profiled
+from .clip import clip_box, voxels_in_box
+from .composition import build_composition_grid
+from .density import compute_density, density_to_image
+from .gbc import compute_gbc, rotate_coordinates
+from .histogram import HistogramCache, SelectionHistograms
+from .hsl import gbc_to_rgb
+from .labels import build_label_index
+from .preprocess import (
+    nonzero_voxels,
+    normalize_channels,
+    normalization_ranges,
+    normalize_data,
+    normalized_nonzero_voxels,
+    remove_padding_uniform,
+)
+from .pyramid import build_level
+from .rgba import masked_rgba_uint8
+from .sampling import GBCSampler
+from .segmentation import (
+    SEGMENTATION_METHODS,
+    segment_voxels,
+    segmentation_label_map,
+)
+from .selection import label_means, lens_alpha, mean_composition
+from .voxels import SparseVolume, VoxelIndex, build_voxel_index, index_rows
+
+# Side length of the volume used to warm up the kernels
+WARM_UP_SIZE = 8
+
+
+@profiled(category='warm-up')
+def warm_up(dtypes=(np.float32, np.float64), num_channels: int = 3):
+    """Call every kernel with the argument types used by the application
+
+    The pipeline runs once per data type that datasets may be read as.
+    The session kernels also run on read-only arrays, like the arrays
+    memory-mapped from a dataset store.
+    """
+    for dtype in dtypes:
+        _warm_up_pipeline(_warm_up_volume(dtype, num_channels))
+
+
+def _warm_up_volume(dtype, num_channels):
+    rng = np.random.default_rng(0)
+    n = WARM_UP_SIZE
+    data = np.zeros((n, n, n, num_channels), dtype=dtype)
+    data[1:-2, 1:-2, 1:-2] = rng.random((n - 3, n - 3, n - 3, num_channels))
+    data[2:4, 2:4, 2:4] = 0
+    return data
+
+
+def _warm_up_pipeline(data):
+    data = remove_padding_uniform(data)
+    shape = data.shape[:-1]
+    num_channels = data.shape[-1]
+
+    histograms = HistogramCache(data.reshape(-1, num_channels))
+
+    # An opacity channel is normalized on its own
+    normalize_data(data[..., 0])
+    normalize_channels(data, True)
+    normalized = normalize_channels(data, False)
+
+    flattened = normalized.reshape(-1, num_channels)
+    index = build_voxel_index(nonzero_voxels(flattened), shape)
+
+    # The data is also normalized on demand, when it is memory-mapped
+    raw = data.reshape(-1, num_channels)
+    normalized_nonzero_voxels(raw, *normalization_ranges(data, True))
+    raw.setflags(write=False)
+    normalized_nonzero_voxels(raw, *normalization_ranges(data, True))
+    nonzero_data = index.gather(flattened)
+
+    # Sparse data has a row per listed voxel
+    sparse = SparseVolume(index, index.gather(raw))
+    _, rows = index_rows(nonzero_voxels(sparse.values), sparse.index, shape)
+    rows.gather(sparse.values)
+    gbc, _ = compute_gbc(nonzero_data)
+    density_to_image(compute_density(gbc))
+
+    label_index = build_label_index(np.arange(np.prod(shape)) % 3)
+    label_means(flattened, label_index)
+
+    # The volume of the CPU render backends
+    rgba = np.zeros((np.prod(shape), 4))
+    masked_rgba_uint8(rgba, np.ones(len(rgba), dtype=np.uint8))
+
+    flat_indices = index.indices
+    arrays = (gbc, nonzero_data, flat_indices, shape, histograms)
+    _warm_up_session(*arrays, data.reshape(-1, num_channels))
+
+    for array in (gbc, nonzero_data, flat_indices, histograms.bins):
+        array.setflags(write=False)
+
+    _warm_up_session(*arrays, raw)
+
+
+def _warm_up_session(gbc, nonzero_data, flat_indices, shape, histograms, raw):
+    sampler = GBCSampler(gbc, seed=0)
+    sampler.bin_data(4, len(gbc))
+    sampler.bin_data(4, len(gbc), stratified=True)
+
+    build_level(flat_indices, nonzero_data, shape, 2)
+
+    box = clip_box(shape, [[0, 1]] * 3)
+    positions, box_indices = voxels_in_box(flat_indices, shape, box)
+    rotated = rotate_coordinates(gbc[positions], 0.5)
+    rgb = gbc_to_rgb(rotated)
+
+    alpha = lens_alpha(rotated, [0, 0], 0.5)
+
+    # The uploads of the volume and of the mask
+    box_index = VoxelIndex(shape, box_indices)
+    rgba = np.zeros((box_index.num_voxels, 4))
+    box_index.scatter(rgb.T, rgba[:, :3])
+    box_index.scatter(nonzero_data[positions].mean(axis=1), rgba[:, 3])
+    box_index.scatter(box_index.gather(rgba[:, 3]), rgba[:, 3])
+    box_index.scatter(alpha, np.zeros(box_index.num_voxels, dtype=np.uint8))
+    mean_composition(nonzero_data[alpha])
+
+    grid = build_composition_grid(gbc, positions, flat_indices, raw)
+    grid.lens_statistics([0, 0], 0.5)
+
+    # The first update computes the counts, and the second one updates
+    # them incrementally
+    selection = SelectionHistograms(histograms, flat_indices)
+    selection.update(alpha)
+    alpha[0] = not alpha[0]
+    selection.update(alpha)
+
+    for method in SEGMENTATION_METHODS:
+        clusters = segment_voxels(method, nonzero_data, gbc, 3, seed=0)
+
+    index = VoxelIndex(shape, flat_indices)
+    segmentation_label_map(index, clusters, 3)
@@ -0,0 +1,119 @@
+"""Export the selected voxels to HDF5 or NPZ, in chunks
+
+Selections may hold hundreds of millions of voxels, so the exported
+arrays are never built in memory. Each one is computed and written a
+chunk of the selection at a time, and only one chunk is held at once.
+"""
+
+from pathlib import Path
+from typing import Callable
+import zipfile
+
+import numpy as np
+
+from multivariate_view.typing import PathLike
+from .profiling import profiled
+
+EXPORT_FORMATS = ('h5', 'npz')
+
+# Number of elements of the selection mask scanned per chunk
+CHUNK_SIZE = 2**20
+
+# A function that computes a column for the positions of a chunk
+Column = Callable[[np.ndarray], np.ndarray]
+
+
+def selection_chunks(selected: np.ndarray, chunk_size: int = CHUNK_SIZE):
+    """Yield the positions of the selected elements, a chunk at a time"""
+    for start in range(0, len(selected), chunk_size):
+        positions = np.flatnonzero(selected[start : start + chunk_size])
+        if len(positions):
+            yield positions + start
+
+
+@profiled
+def export_selection(
+    path: PathLike,
+    selected: np.ndarray,
+    columns: dict[str, Column],
+    metadata: dict[str, np.ndarray] | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """Write the columns of the selected elements to an HDF5 or NPZ file
+
+    `selected` is a boolean mask, and every column is computed from an
+    array of positions in it. The format depends on the suffix of the
+    path. The metadata arrays are written as they are.
+
+    Returns the number of selected elements.
+    """
+    path = Path(path)
+    if path.suffix not in ('.h5', '.npz'):
+        msg = f'Unknown export format: {path.suffix}'
+        raise ValueError(msg)
+
+    num_selected = int(np.count_nonzero(selected))
+
+    # Compute the columns of no voxels to find their types and shapes
+    empty = np.zeros(0, dtype=np.int64)
+    specs = {}
+    for name, column in columns.items():
+        array = np.asarray(column(empty))
+        specs[name] = (array.dtype, (num_selected, *array.shape[1:]))
+
+    if path.suffix == '.npz':
+        writer = _write_npz
+    else:
+        writer = _write_hdf5
+
+    writer(path, selected, columns, specs, metadata or {}, chunk_size)
+    return num_selected
+
+
+def _write_hdf5(path, selected, columns, specs, metadata, chunk_size):
+    import h5py
+
+    with h5py.File(path, 'w') as f:
+        for name, array in metadata.items():
+            array = np.asarray(array)
+            if array.dtype.kind == 'U':
+                array = array.astype(h5py.string_dtype())
+
+            f.create_dataset(name, data=array)
+
+        for name, (dtype, shape) in specs.items():
+            chunks = None
+            if shape[0]:
+                chunks = (min(shape[0], chunk_size), *shape[1:])
+
+            dataset = f.create_dataset(
+                name, shape=shape, dtype=dtype, chunks=chunks
+            )
+            start = 0
+            for positions in selection_chunks(selected, chunk_size):
+                stop = start + len(positions)
+                dataset[start:stop] = columns[name](positions)
+                start = stop
+
+
+def _write_npz(path, selected, columns, specs, metadata, chunk_size):
+    # Stream the raw bytes of each array after its header, like np.save.
+    # The arrays are stored uncompressed, like np.savez.
+    with zipfile.ZipFile(path, 'w', allowZip64=True) as zf:
+        for name, array in metadata.items():
+            with zf.open(f'{name}.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, np.asarray(array))
+
+        for name, (dtype, shape) in specs.items():
+            with zf.open(f'{name}.npy', 'w', force_zip64=True) as f:
+                header = {
+                    'descr': np.lib.format.dtype_to_descr(dtype),
+                    'fortran_order': False,
+                    'shape': shape,
+                }
+                np.lib.format.write_array_header_2_0(f, header)
+                for positions in selection_chunks(selected, chunk_size):
+                    chunk = np.ascontiguousarray(
+                        columns[name](positions), dtype=dtype
+                    )
+                    f.write(memoryview(chunk).cast('B'))
@@ -3,25 +3,41 @@ from pathlib import Path
 import re
 from typing import Callable
 
-import h5py
 import numpy as np
-from PIL import Image
-from vtkmodules.vtkIOXML import vtkXMLImageDataReader
-from vtkmodules.util import numpy_support as np_s
 
 from multivariate_view.typing import PathLike
+from .compute.voxels import SparseVolume
+from .profiling import profiled
+from .remote import (
+    is_remote,
+    open_file,
+    path_name,
+    prefetch_datasets,
+    prefetch_file,
+)
 
+# The libraries of each format are imported by its loader, so that
+# starting the application only imports those of the data it loads.
 
-# First is a list of labels, second is an array
-LoadReturnType = tuple[list[str], np.ndarray]
+# First is a list of labels, second is an array (or a sparse volume)
+LoadReturnType = tuple[list[str], np.ndarray | SparseVolume]
 
+# The arrays of a sparse dataset, besides the channels
+SPARSE_ARRAYS = ('coordinates', 'shape')
 
+
+@profiled(category='io')
 def load_dataset(path: PathLike) -> LoadReturnType:
     """Automatically determine format and load a dataset
 
-    Labels and data are returned
+    Labels and data are returned. HDF5 and NPZ files may also be read
+    from URLs.
     """
     loader = identify_loader_function(path)
+    if is_remote(path) and loader not in REMOTE_READERS:
+        msg = f'Only HDF5 and NPZ files can be read from URLs: {path}'
+        raise ValueError(msg)
+
     return loader(path)
 
 
@@ -30,7 +46,7 @@ def identify_loader_function(
 ) -> Callable[[PathLike], np.ndarray]:
     """Identify the loader function for the specified file"""
 
-    extension = Path(path).suffix[1:]
+    extension = Path(path_name(path)).suffix[1:]
     for regex, func in READERS.items():
         if re.match(regex, extension):
             return func
@@ -54,10 +70,15 @@ def load_csv_dataset(path: PathLike) -> LoadReturnType:
 def load_npz_dataset(path: PathLike) -> LoadReturnType:
     # This assumes each channel is saved as a separate array in the npz file
     datasets = {}
-    with np.load(path) as f:
-        for k, v in f.items():
-            # Transpose to Fortran indexing
-            datasets[k] = v
+    with open_file(path) as file:
+        prefetch_file(file)
+        with np.load(file) as f:
+            if all(k in f for k in SPARSE_ARRAYS):
+                return load_sparse_arrays(dict(f.items()))
+
+            for k, v in f.items():
+                # Transpose to Fortran indexing
+                datasets[k] = v
 
     # Stack the datasets together
     data = np.ascontiguousarray(np.stack(list(datasets.values()), axis=3))
@@ -67,6 +88,8 @@ def load_npz_dataset(path: PathLike) -> LoadReturnType:
 
 
 def load_radvolviz_png_dataset(path: PathLike) -> LoadReturnType:
+    from PIL import Image
+
     # Load a radvolviz-style multi-channel PNG dataset
     img = Image.open(path)
     data = (
@@ -84,41 +107,140 @@ def load_radvolviz_png_dataset(path: PathLike) -> LoadReturnType:
 
 
 def load_vti_dataset(path: PathLike) -> LoadReturnType:
+    """Load the point data of a VTK image
+
+    The channels are the components of the scalars, if they have more
+    than one, or else those of every point data array, which is how one
+    array per element is stored. The channels are written straight into
+    the C-ordered volume. A single array that is already in that order
+    is wrapped without copying.
+    """
+    from vtkmodules.vtkIOXML import vtkXMLImageDataReader
+    from vtkmodules.util import numpy_support as np_s
+
     reader = vtkXMLImageDataReader()
     reader.SetFileName(path)
     reader.Update()
     image_data = reader.GetOutput()
+    point_data = image_data.GetPointData()
+
+    vtk_arrays = [point_data.GetScalars()]
+    if vtk_arrays[0] is None or vtk_arrays[0].GetNumberOfComponents() == 1:
+        vtk_arrays = [
+            point_data.GetArray(i)
+            for i in range(point_data.GetNumberOfArrays())
+        ]
+
+    if not vtk_arrays:
+        msg = f'No point data arrays in {path}'
+        raise ValueError(msg)
+
+    # VTK images are in Fortran order, so the views of the arrays in our
+    # (x, y, z) C order are transposed
+    nx, ny, nz = image_data.GetDimensions()
+    labels = []
+    views = []
+    for vtk_array in vtk_arrays:
+        num_components = vtk_array.GetNumberOfComponents()
+        array = np_s.vtk_to_numpy(vtk_array)
+        array = array.reshape(nz, ny, nx, num_components)
+        views.append(array.transpose(2, 1, 0, 3))
+        labels += vti_component_labels(vtk_array)
+
+    if len(views) == 1 and views[0].flags.c_contiguous:
+        return labels, views[0]
+
+    dtype = np.result_type(*views)
+    data = np.empty((nx, ny, nz, len(labels)), dtype=dtype)
+    channel = 0
+    for view in views:
+        stop = channel + view.shape[3]
+        np.copyto(data[..., channel:stop], view)
+        channel = stop
 
-    vtk_array = image_data.GetPointData().GetScalars()
-    data_shape = image_data.GetDimensions()
+    return labels, data
+
+
+def vti_component_labels(vtk_array) -> list[str]:
+    """The labels of the channels of the components of a VTK array
+
+    A single component is labeled with the name of the array.
+    """
+    name = vtk_array.GetName()
     num_components = vtk_array.GetNumberOfComponents()
-    labels = [vtk_array.GetComponentName(i) for i in range(num_components)]
-    data = np_s.vtk_to_numpy(vtk_array).reshape(*data_shape, num_components)
+    if num_components == 1 and name:
+        return [name]
 
-    # This is in fortran ordering, but our program expects C ordering.
-    # So transpose to C ordering
-    data = data.reshape(*(data_shape[::-1]), num_components).transpose(
-        2, 1, 0, 3
-    )
-    data = np.ascontiguousarray(data)
+    labels = []
+    for i in range(num_components):
+        label = vtk_array.GetComponentName(i)
+        if label is None:
+            label = f'{name} {i}' if name else str(i)
 
-    return labels, data
+        labels.append(label)
 
+    return labels
+
+
+def load_hdf5_dataset(path: PathLike, group: str = '/') -> LoadReturnType:
+    import h5py
 
-def load_hdf5_dataset(path: PathLike) -> LoadReturnType:
     labels = []
     data = []
 
-    with h5py.File(path, 'r') as f:
-        for key in f:
+    with open_file(path) as file, h5py.File(file, 'r') as f:
+        # Fetch the chunks of every channel at once
+        datasets = dict(f[group].items())
+        prefetch_datasets(
+            file,
+            [x for x in datasets.values() if isinstance(x, h5py.Dataset)],
+        )
+
+        if all(k in datasets for k in SPARSE_ARRAYS):
+            return load_sparse_arrays({k: v[()] for k, v in datasets.items()})
+
+        for key, dataset in datasets.items():
             labels.append(key)
-            data.append(f[key][()])
+            data.append(dataset[()])
 
     data = np.stack(data, axis=3)
 
     return labels, data
 
 
+def load_sparse_arrays(arrays: dict[str, np.ndarray]) -> LoadReturnType:
+    """Load the arrays of a sparse dataset, without the dense volume
+
+    `coordinates` has the `(z, y, x)` index of each listed voxel, and
+    `shape` is the shape of the volume. Every other array has the value
+    of a channel for each listed voxel. The other voxels are zero.
+    """
+    coordinates = arrays.pop('coordinates')
+    shape = arrays.pop('shape')
+    if coordinates.ndim != 2 or coordinates.shape[1] != 3:
+        msg = f'Expected (N, 3) coordinates, got {coordinates.shape}'
+        raise ValueError(msg)
+
+    labels = list(arrays)
+    values = np.stack(list(arrays.values()), axis=1)
+    return labels, SparseVolume.from_coordinates(coordinates, shape, values)
+
+
+def list_hdf5_groups(path: PathLike) -> list[str]:
+    """List the groups at the root of an HDF5 file
+
+    An empty list is returned unless every item at the root is a group.
+    """
+    import h5py
+
+    with open_file(path) as file, h5py.File(file, 'r') as f:
+        items = list(f.values())
+        if not items or not all(isinstance(x, h5py.Group) for x in items):
+            return []
+
+        return list(f)
+
+
 # The key for these readers is the regular expression
 # that the extension should match.
 READERS = {
@@ -131,3 +253,6 @@ READERS = {
 
 # Compile the regular expressions (and make them case-insensitive)
 READERS = {re.compile(k, re.I): v for k, v in READERS.items()}
+
+# The readers of files that may be read from URLs
+REMOTE_READERS = (load_npz_dataset, load_hdf5_dataset)
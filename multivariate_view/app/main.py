@@ -1,7 +1,15 @@
-from multivariate_view.app.app import App
+import sys
 
 
 def main():
+    if sys.argv[1:2] == ['batch']:
+        # Headless processing. This does not need trame or rendering.
+        from multivariate_view.app.batch import main as batch_main
+
+        sys.exit(batch_main(sys.argv[2:]))
+
+    from multivariate_view.app.app import App
+
     app = App()
     app.server.start()
 
@@ -0,0 +1,221 @@
+"""Account for the memory of the arrays, and fit the data in a budget
+
+Arrays that share memory, like views of the same data, are counted
+once. Memory-mapped arrays are counted separately, since the OS may
+evict their pages.
+
+The footprint of a dataset is estimated from its size before it is
+prepared, so that it may be decimated, or its prepared arrays
+memory-mapped, to fit in the budget given with `--max-memory`.
+"""
+
+import mmap
+import re
+
+import numpy as np
+
+SIZE_UNITS = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+# The arrays that are prepared once from the data. These are saved to,
+# and memory-mapped from, the dataset store.
+PREPARED_ARRAYS = (
+    'raw_data',
+    'raw_indices',
+    'histogram_bins',
+    'nonzero_indices',
+    'nonzero_rows',
+    'nonzero_data',
+    'nonzero_means',
+    'gbc',
+)
+
+# The downsampling factors of the coarse levels (`PYRAMID_FACTORS`)
+LEVEL_FACTORS = (2, 4)
+
+
+def parse_size(text: str) -> int:
+    """Parse a number of bytes, with an optional unit, like `512M`"""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?)(?:i?B)?\s*', text, re.I)
+    if match is None:
+        raise ValueError(f'Invalid size: {text}')
+
+    value, unit = match.groups()
+    return int(float(value) * SIZE_UNITS[unit.upper()])
+
+
+def format_size(num_bytes: int) -> str:
+    for unit in ('B', 'K', 'M', 'G'):
+        if num_bytes < 1024:
+            break
+
+        num_bytes /= 1024
+    else:
+        unit = 'T'
+
+    return f'{num_bytes:.1f} {unit}' if unit != 'B' else f'{num_bytes} B'
+
+
+def memory_report(arrays: dict[str, np.ndarray]) -> list[dict]:
+    """Describe the memory used by each array
+
+    The `bytes` of an array are the bytes that it owns: none for a view
+    of a previous array, and all of the base of a view of another array
+    (e.g. the uncropped data). The `mapped` bytes are memory-mapped.
+    """
+    rows = []
+    counted = []
+    for name, array in arrays.items():
+        if array is None:
+            continue
+
+        row = {
+            'name': name,
+            'shape': array.shape,
+            'dtype': str(array.dtype),
+            'bytes': 0,
+            'mapped': 0,
+            'owner': None,
+        }
+        rows.append(row)
+
+        owner = next(
+            (n for n, a in counted if np.may_share_memory(array, a)), None
+        )
+        if owner is not None:
+            row['owner'] = owner
+            continue
+
+        counted.append((name, array))
+        base = _base(array)
+        if isinstance(base, mmap.mmap):
+            row['mapped'] = array.nbytes
+        elif isinstance(base, np.ndarray):
+            row['bytes'] = base.nbytes
+        else:
+            # e.g. the memory of a VTK array
+            row['bytes'] = array.nbytes
+
+    return rows
+
+
+def format_report(rows: list[dict]) -> str:
+    lines = [f'{"array":<28} {"shape":>22} {"dtype":>8} {"memory":>12}']
+    for row in rows:
+        if row['owner'] is not None:
+            memory = f'view of {row["owner"]}'
+        elif row['mapped']:
+            memory = f'{format_size(row["mapped"])} (mapped)'
+        else:
+            memory = format_size(row['bytes'])
+
+        shape = 'x'.join(map(str, row['shape']))
+        lines.append(
+            f'{row["name"]:<28} {shape:>22} {row["dtype"]:>8} {memory:>12}'
+        )
+
+    total = sum(row['bytes'] for row in rows)
+    mapped = sum(row['mapped'] for row in rows)
+    lines.append(
+        f'{"total":<28} {"":>22} {"":>8} {format_size(total):>12}'
+        f' (+ {format_size(mapped)} mapped)'
+    )
+    return '\n'.join(lines)
+
+
+def _base(array):
+    # The object that owns the memory of an array
+    while isinstance(getattr(array, 'base', None), (np.ndarray, mmap.mmap)):
+        array = array.base
+
+    return array
+
+
+def estimate_arrays(
+    num_voxels: int,
+    num_channels: int,
+    itemsize: int,
+    nonzero_fraction: float = 1,
+    label_map: bool = False,
+    sparse: bool = False,
+) -> dict[str, int]:
+    """Estimate the bytes of each array of the application
+
+    The names match the arrays of `App.memory_arrays`, except for the
+    transient `level_blocks`. Each voxel is an item of the raw data per
+    channel, and the nonzero voxels also have a float64 normalized value
+    per channel, and their GBC and colors. If the data is `sparse`, only
+    the nonzero voxels are in the raw data.
+    """
+    n = num_voxels
+    m = int(num_voxels * nonzero_fraction)
+    c = num_channels
+    raw = m if sparse else n
+
+    # The occupied blocks of the coarse levels. There are at most as many
+    # as the nonzero voxels, or as the blocks of the volume.
+    level_blocks = [min(m, n // f**3) for f in LEVEL_FACTORS]
+    estimates = {
+        'raw_data': raw * c * itemsize,
+        'histogram_bins': raw * c,
+        'nonzero_indices': 4 * m,
+        'nonzero_data': 8 * c * m,
+        'nonzero_means': 8 * m,
+        'gbc': 16 * m,
+        'sampler_permutation': 8 * m,
+        'levels': (8 * c + 25) * sum(level_blocks),
+        # The blocks of the finest level, which are copied once while
+        # building it if some of them are zero
+        'level_blocks': (8 * c + 8) * level_blocks[0],
+        'box_positions': 8 * m,
+        'box_indices': 4 * m,
+        'gbc_data': 16 * m,
+        'rgb_data': 24 * m,
+        'alpha': m,
+        'composition_order': 8 * m,
+        'volume_rgba': 32 * n,
+        'volume_mask': n,
+    }
+    if sparse:
+        estimates['raw_indices'] = 4 * m
+        estimates['nonzero_rows'] = 4 * m
+
+    if label_map:
+        estimates['label_map'] = 8 * n
+        estimates['label_index'] = 8 * n
+        estimates['base_alpha'] = 8 * n
+
+    return estimates
+
+
+def estimate_footprint(*args, mapped: bool = False, **kwargs) -> int:
+    """Estimate the bytes used by the application for a volume
+
+    If `mapped`, the prepared arrays are memory-mapped, and not counted.
+    The arguments are those of `estimate_arrays`.
+    """
+    estimates = estimate_arrays(*args, **kwargs)
+    return sum(
+        size
+        for name, size in estimates.items()
+        if not (mapped and name in PREPARED_ARRAYS)
+    )
+
+
+def choose_decimation(
+    shape: tuple[int], budget: int, *args, mapped: bool = False, **kwargs
+) -> int:
+    """Find the smallest stride that fits a volume in the budget
+
+    The arguments after the budget are those of `estimate_arrays`,
+    without the number of voxels.
+    """
+    factor = 1
+    while True:
+        num_voxels = int(np.prod([-(-n // factor) for n in shape]))
+        footprint = estimate_footprint(
+            num_voxels, *args, mapped=mapped, **kwargs
+        )
+        if footprint <= budget or num_voxels == 1:
+            return factor
+
+        factor += 1
@@ -0,0 +1,193 @@
+"""Opt-in profiling of the pipeline stages and state callbacks
+
+Functions decorated with `profiled` are recorded as spans by the global
+`PROFILER` once it is enabled (with `mv-view --profile`). Each span has
+its duration, its thread, and the memory that it allocated and kept, as
+seen by `tracemalloc`. The spans can be summarized, or exported as a
+Chrome trace, which can be opened in Perfetto or `chrome://tracing`.
+
+When the profiler is disabled, decorated functions only check a flag.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+            self.version += 1
+
+    def span(self, name: str, category: str = 'function'):
+        """A context manager that records a span, if enabled"""
+        if not self.enabled:
+            return _NULL_SPAN
+
+        return _Span(self, name, category)
+
+    def record(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+            self.version += 1
+
+    def summary(self) -> list[dict]:
+        """Aggregate the spans by name, from the slowest in total"""
+        with self._lock:
+            spans = list(self.spans)
+
+        stats = {}
+        for span in spans:
+            s = stats.setdefault(
+                span['name'],
+                {
+                    'name': span['name'],
+                    'category': span['category'],
+                    'count': 0,
+                    'total': 0,
+                    'max': 0,
+                    'allocated': 0,
+                },
+            )
+            s['count'] += 1
+            s['total'] += span['duration']
+            s['max'] = max(s['max'], span['duration'])
+            s['allocated'] += span['allocated']
+
+        for s in stats.values():
+            s['mean'] = s['total'] / s['count']
+
+        return sorted(stats.values(), key=lambda s: -s['total'])
+
+    def chrome_trace(self) -> dict:
+        """Convert the spans to the Chrome trace event format"""
+        with self._lock:
+            spans = list(self.spans)
+
+        pid = os.getpid()
+        events = []
+        thread_names = {}
+        for span in spans:
+            thread_names[span['thread_id']] = span['thread_name']
+            events.append(
+                {
+                    'name': span['name'],
+                    'cat': span['category'],
+                    'ph': 'X',
+                    'ts': span['start'] * 1e6,
+                    'dur': span['duration'] * 1e6,
+                    'pid': pid,
+                    'tid': span['thread_id'],
+                    'args': {'allocated_bytes': span['allocated']},
+                }
+            )
+
+        for tid, name in thread_names.items():
+            events.append(
+                {
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': pid,
+                    'tid': tid,
+                    'args': {'name': name},
+                }
+            )
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class _Span:
+    def __init__(self, profiler, name, category):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.memory = _traced_memory()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        thread = threading.current_thread()
+        self.profiler.record(
+            {
+                'name': self.name,
+                'category': self.category,
+                'start': self.start,
+                'duration': end - self.start,
+                'thread_id': thread.ident,
+                'thread_name': thread.name,
+                'allocated': max(_traced_memory() - self.memory, 0),
+            }
+        )
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _traced_memory():
+    if not tracemalloc.is_tracing():
+        return 0
+
+    return tracemalloc.get_traced_memory()[0]
+
+
+PROFILER = Profiler()
+
+
+def profiled(func=None, *, name: str = None, category: str = 'function'):
+    """Record the calls of a function as spans of the global profiler
+
+    This may be used with or without arguments. The name of the span is
+    the qualified name of the function by default.
+    """
+    if func is None:
+        return functools.partial(profiled, name=name, category=category)
+
+    # Numba kernels are wrapped like their Python function
+    py_func = getattr(func, 'py_func', func)
+    span_name = name or py_func.__qualname__
+
+    @functools.wraps(py_func)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return func(*args, **kwargs)
+
+        with PROFILER.span(span_name, category):
+            return func(*args, **kwargs)
+
+    wrapper.__wrapped__ = func
+    return wrapper
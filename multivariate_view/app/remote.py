@@ -0,0 +1,339 @@
+"""Read remote files with HTTP range requests, through a block cache
+
+Datasets on an object store, or any HTTP server that supports range
+requests, are opened as read-only file-like objects, which h5py and
+`np.load` accept. They are read in blocks that are saved to an on-disk
+cache, so that reopening a file mostly reads the cache. The blocks of
+the chunks that a dataset needs are fetched concurrently before it is
+read, instead of one by one as HDF5 asks for them.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+from multivariate_view.typing import PathLike
+from .profiling import profiled
+
+REMOTE_SCHEMES = ('http', 'https')
+
+# Bytes per block of the cache
+BLOCK_SIZE = 2**20
+
+# Number of blocks fetched at once when prefetching
+PREFETCH_THREADS = 8
+
+# Number of the most recently read blocks kept in memory
+MEMORY_BLOCKS = 16
+
+# Seconds to wait for the server
+TIMEOUT = 60
+
+
+def is_remote(path: PathLike) -> bool:
+    """Whether a path is the URL of a remote file"""
+    return urlparse(str(path)).scheme in REMOTE_SCHEMES
+
+
+def path_name(path: PathLike) -> str:
+    """The path of a local file, or of the file of a URL"""
+    if is_remote(path):
+        return urlparse(str(path)).path
+
+    return str(path)
+
+
+def default_cache_directory() -> Path:
+    cache = os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')
+    return Path(cache) / 'multivariate-view' / 'blocks'
+
+
+class BlockCache:
+    """The blocks of remote files, saved to a directory
+
+    The blocks of a file are kept under a key that changes with the
+    file. Nothing is saved if the directory is None.
+    """
+
+    def __init__(self, directory: PathLike | None, block_size=BLOCK_SIZE):
+        self.directory = None if directory is None else Path(directory)
+        self.block_size = block_size
+
+    def key(self, url: str, size: int, version: str) -> str:
+        description = {
+            'url': url,
+            'size': size,
+            'version': version,
+            'block_size': self.block_size,
+        }
+        encoded = json.dumps(description, sort_keys=True).encode()
+        return hashlib.sha1(encoded).hexdigest()
+
+    def load(self, key: str, index: int) -> bytes | None:
+        if self.directory is None:
+            return None
+
+        try:
+            return self._path(key, index).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def contains(self, key: str, index: int) -> bool:
+        return self.directory is not None and self._path(key, index).exists()
+
+    def save(self, key: str, index: int, block: bytes):
+        if self.directory is None:
+            return
+
+        # Write to a temporary file first, so that other processes never
+        # read a partial block
+        path = self._path(key, index)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(block)
+
+        os.replace(temporary, path)
+
+    def _path(self, key, index):
+        return self.directory / key / f'{index}.block'
+
+
+BLOCK_CACHE = BlockCache(default_cache_directory())
+
+
+class RemoteFile(io.RawIOBase):
+    """A read-only file-like object of a remote file
+
+    Reads are served from the blocks of `cache` (the `BLOCK_CACHE` by
+    default), and the missing blocks are fetched with range requests.
+    """
+
+    def __init__(self, url: str, cache: BlockCache | None = None):
+        super().__init__()
+        self.url = url
+        self.cache = BLOCK_CACHE if cache is None else cache
+        self.position = 0
+        self.num_requests = 0
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._blocks = OrderedDict()
+
+        self.size, version = remote_version(url, self._session())
+        self.key = self.cache.key(url, self.size, version)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+
+        if offset < 0:
+            raise ValueError(f'Negative seek position {offset}')
+
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast('B')
+        end = min(self.position + len(view), self.size)
+        count = 0
+        while self.position < end:
+            index, offset = divmod(self.position, self.cache.block_size)
+            block = self.block(index)
+            n = min(len(block) - offset, end - self.position)
+            view[count : count + n] = block[offset : offset + n]
+            count += n
+            self.position += n
+
+        return count
+
+    def block(self, index: int) -> bytes:
+        """Get a block, from memory, the cache, or the server"""
+        with self._lock:
+            block = self._blocks.get(index)
+            if block is not None:
+                self._blocks.move_to_end(index)
+                return block
+
+        block = self.cache.load(self.key, index)
+        if block is None:
+            block = self._fetch(index)
+
+        with self._lock:
+            self._blocks[index] = block
+            while len(self._blocks) > MEMORY_BLOCKS:
+                self._blocks.popitem(last=False)
+
+        return block
+
+    @profiled(category='io')
+    def prefetch(self, ranges: list[tuple[int, int]]):
+        """Fetch the missing blocks of the `(offset, size)` byte ranges
+
+        The blocks are fetched concurrently, and saved to the cache. If
+        the cache has no directory, nothing is prefetched.
+        """
+        if self.cache.directory is None:
+            return
+
+        block_size = self.cache.block_size
+        indices = set()
+        for offset, size in ranges:
+            if size > 0:
+                first = offset // block_size
+                last = (offset + size - 1) // block_size
+                indices.update(range(first, last + 1))
+
+        missing = [
+            i for i in sorted(indices) if not self.cache.contains(self.key, i)
+        ]
+        if not missing:
+            return
+
+        with ThreadPoolExecutor(PREFETCH_THREADS) as executor:
+            # Raise the first error
+            list(executor.map(self._fetch, missing))
+
+    def _fetch(self, index):
+        start = index * self.cache.block_size
+        stop = min(start + self.cache.block_size, self.size)
+        response = self._session().get(
+            self.url,
+            headers={'Range': f'bytes={start}-{stop - 1}'},
+            timeout=TIMEOUT,
+        )
+        response.raise_for_status()
+        block = response.content
+        with self._lock:
+            self.num_requests += 1
+
+        if response.status_code != 206 or len(block) != stop - start:
+            msg = f'The server does not support range requests: {self.url}'
+            raise ValueError(msg)
+
+        self.cache.save(self.key, index, block)
+        return block
+
+    def _session(self):
+        # Sessions are not shared between the prefetch threads
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+
+            session = requests.Session()
+            self._local.session = session
+
+        return session
+
+
+def remote_version(url: str, session=None) -> tuple[int, str]:
+    """Get the size of a remote file, and a version that changes with it
+
+    The version is the ETag or the modification time given by the server.
+    A ranged GET is used, since the URLs signed for GET may not allow
+    HEAD requests.
+    """
+    if session is None:
+        import requests
+
+        session = requests
+
+    response = session.get(
+        url, headers={'Range': 'bytes=0-0'}, timeout=TIMEOUT
+    )
+    response.raise_for_status()
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code != 206 or '/' not in content_range:
+        msg = f'The server does not support range requests: {url}'
+        raise ValueError(msg)
+
+    size = int(content_range.rsplit('/', 1)[1])
+    headers = response.headers
+    version = headers.get('ETag') or headers.get('Last-Modified') or ''
+    return size, version
+
+
+def open_file(path: PathLike):
+    """Open a remote file, or pass a local path through
+
+    The result is used in a `with` statement, and may be given to the
+    readers that accept paths and file-like objects, like h5py.
+    """
+    if is_remote(path):
+        return RemoteFile(str(path))
+
+    return nullcontext(path)
+
+
+def prefetch_file(file):
+    """Prefetch all of a remote file, whose contents are all read
+
+    `file` is the result of `open_file`. Nothing is done for local files.
+    """
+    if isinstance(file, RemoteFile):
+        file.prefetch([(0, file.size)])
+
+
+def chunk_ranges(dataset, selection: tuple[slice] = ()) -> list[tuple]:
+    """The `(offset, size)` byte ranges that an HDF5 hyperslab is in
+
+    The hyperslab is a tuple of slices, of all of the dataset by default.
+    Compact datasets are stored with the metadata, so they have none.
+    """
+    dsid = dataset.id
+    if dataset.chunks is None:
+        offset = dsid.get_offset()
+        if offset is None:
+            return []
+
+        return [(offset, dsid.get_storage_size())]
+
+    selection = selection + (slice(None),) * (dataset.ndim - len(selection))
+    bounds = [s.indices(n)[:2] for s, n in zip(selection, dataset.shape)]
+
+    ranges = []
+    for i in range(dsid.get_num_chunks()):
+        info = dsid.get_chunk_info(i)
+        if all(
+            start < offset + size and offset < stop
+            for (start, stop), offset, size in zip(
+                bounds, info.chunk_offset, dataset.chunks
+            )
+        ):
+            ranges.append((info.byte_offset, info.size))
+
+    return ranges
+
+
+def prefetch_datasets(file, datasets, selection: tuple[slice] = ()):
+    """Prefetch the chunks of hyperslabs of HDF5 datasets of a file
+
+    `file` is the result of `open_file`. Nothing is done for local files.
+    """
+    if not isinstance(file, RemoteFile):
+        return
+
+    ranges = []
+    for dataset in datasets:
+        ranges.extend(chunk_ranges(dataset, selection))
+
+    file.prefetch(ranges)
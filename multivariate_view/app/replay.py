@@ -0,0 +1,350 @@
+"""Record interactions with the application, and replay them headlessly
+
+A session is a JSON lines file. Each line is an event: the state
+changes made by one interaction, e.g. `{"w_rotation": 45}`. Replaying
+a session applies the events one by one, and measures the latency of
+the state callbacks that each event triggers, along with the bytes
+pushed to VTK and to the client.
+
+Usage:
+
+    mv-view --data data.h5 --record session.jsonl
+    python -m multivariate_view.app.replay --session session.jsonl \
+        --data data.h5
+
+Use `--scripted` instead of `--session` to replay a built-in session
+with a rotation scrub, a lens drag, clipping, channel edits, and table
+selections.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import msgpack
+import numpy as np
+
+# The state keys that are changed by interactions in the UI
+INTERACTION_KEYS = (
+    'w_rotation',
+    'lens_center',
+    'w_lradius',
+    'w_linvert',
+    'show_groups',
+    'w_clip_x',
+    'w_clip_y',
+    'w_clip_z',
+    'w_bins',
+    'w_sample_size',
+    'w_stratified_sampling',
+    'w_show_density',
+    'w_rendering_shadow',
+    'w_rendering_bg',
+    'use_log_histogram',
+    'normalize_ranges',
+    'array_modified',
+    'data_channels',
+    'table_selection',
+    'unselected_opacity_multiplier',
+)
+
+PERCENTILES = (50, 90, 99)
+
+
+class SessionRecorder:
+    """Append the interactions made on a state to a session file
+
+    Nothing is recorded until `start()` is called, e.g. once the data is
+    loaded.
+    """
+
+    def __init__(self, state, path):
+        self.state = state
+        self.path = path
+        self.recording = False
+        self.start_time = None
+        state.change(*INTERACTION_KEYS)(self.on_change)
+
+    def start(self):
+        self.recording = True
+        self.start_time = time.perf_counter()
+        # Start a new session
+        open(self.path, 'w').close()
+
+    def on_change(self, **kwargs):
+        if not self.recording:
+            return
+
+        keys = sorted(set(self.state.modified_keys) & set(INTERACTION_KEYS))
+        if not keys:
+            return
+
+        event = {
+            'time': time.perf_counter() - self.start_time,
+            'changes': {key: _recordable(key, kwargs[key]) for key in keys},
+        }
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(event) + '\n')
+
+
+def _recordable(key, value):
+    if key == 'data_channels' and value:
+        # The histograms are computed from the data
+        return {
+            name: {k: v for k, v in channel.items() if k != 'histogram'}
+            for name, channel in value.items()
+        }
+
+    return value
+
+
+def load_session(path) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def scripted_session(app) -> list[dict]:
+    """A session with the interactions that are typical of an analysis"""
+    events = []
+
+    def add(**changes):
+        events.append({'changes': changes})
+
+    # Rotation scrub
+    for angle in range(0, 365, 5):
+        add(w_rotation=angle)
+
+    # Lens drag, along a circle
+    add(show_groups=['lens', 'voxel-means'])
+    for angle in np.linspace(0, 2 * np.pi, 40):
+        add(lens_center=[0.4 * np.cos(angle), 0.4 * np.sin(angle)])
+
+    add(w_lradius=0.3)
+    add(w_linvert=True)
+    add(w_linvert=False)
+
+    # Clip sweep
+    for fraction in np.linspace(0, 0.4, 9):
+        add(w_clip_x=[fraction, 1], w_clip_z=[0, 1 - fraction])
+
+    add(w_clip_x=[0, 1], w_clip_z=[0, 1])
+
+    # Channel edits
+    channels = app.state.data_channels or {}
+    for name, channel in channels.items():
+        low, high = channel['data_range']
+        for focus_range in ([low + 0.1 * (high - low), high], [low, high]):
+            edited = _recordable('data_channels', channels)
+            edited[name]['focus_range'] = focus_range
+            add(data_channels=edited, array_modified=name)
+
+    # Table selection
+    if app.label_index is not None:
+        values = app.label_index.values.tolist()
+        for value in values:
+            add(table_selection=[value])
+
+        add(table_selection=values[: len(values) // 2])
+        add(unselected_opacity_multiplier=0.5)
+        add(table_selection=[])
+
+    return events
+
+
+def event_name(changes: dict) -> str:
+    return '+'.join(sorted(changes))
+
+
+def replay(app, events, render=True) -> list[dict]:
+    """Apply the events to the application, and measure each of them
+
+    The time includes every state callback triggered by the event, and
+    the render of the view if it was modified.
+    """
+    counter = _PushCounter(app.state)
+    volume_view = app.volume_view
+
+    stats = []
+    for event in events:
+        changes = _merge_changes(app.state, event['changes'])
+        mtimes = _data_mtimes(volume_view)
+        counter.num_bytes = 0
+
+        start = time.perf_counter()
+        with app.state:
+            app.state.update(changes)
+
+        vtk_bytes = _modified_bytes(volume_view, mtimes)
+        if render and vtk_bytes:
+            volume_view.render_window.Render()
+
+        stats.append(
+            {
+                'name': event_name(event['changes']),
+                'time': time.perf_counter() - start,
+                'vtk_bytes': vtk_bytes,
+                'client_bytes': counter.num_bytes,
+            }
+        )
+
+    counter.detach()
+    return stats
+
+
+def summarize(stats: list[dict]) -> dict:
+    """Compute the latency percentiles and bytes of each kind of event"""
+    names = ['all'] + sorted({s['name'] for s in stats})
+    summary = {}
+    for name in names:
+        selected = [s for s in stats if name == 'all' or s['name'] == name]
+        times = np.array([s['time'] for s in selected])
+        summary[name] = {
+            'count': len(selected),
+            **{
+                f'p{p}': float(np.percentile(times, p)) if len(times) else 0
+                for p in PERCENTILES
+            },
+            'max': float(times.max()) if len(times) else 0,
+            'vtk_bytes': sum(s['vtk_bytes'] for s in selected),
+            'client_bytes': sum(s['client_bytes'] for s in selected),
+        }
+
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    columns = [f'p{p} (ms)' for p in PERCENTILES] + ['max (ms)']
+    header = (
+        f'{"event":<36} {"count":>6} '
+        + ' '.join(f'{c:>10}' for c in columns)
+        + f' {"VTK (MB)":>10} {"client (MB)":>12}'
+    )
+    lines = [header]
+    for name, s in summary.items():
+        times = [s[f'p{p}'] for p in PERCENTILES] + [s['max']]
+        lines.append(
+            f'{name:<36} {s["count"]:>6} '
+            + ' '.join(f'{t * 1000:>10.2f}' for t in times)
+            + f' {s["vtk_bytes"] / 2**20:>10.2f}'
+            + f' {s["client_bytes"] / 2**20:>12.2f}'
+        )
+
+    return '\n'.join(lines)
+
+
+class _PushCounter:
+    # Count the bytes of the state updates pushed to the client. They
+    # are encoded with msgpack, with bytes as binary attachments.
+
+    def __init__(self, state):
+        self.state = state
+        self.num_bytes = 0
+        self.push_fn = state._push_state_fn
+        object.__setattr__(state, '_push_state_fn', self.push)
+
+    def push(self, update):
+        self.num_bytes += len(msgpack.packb(update, default=_encode_default))
+        if self.push_fn is not None:
+            self.push_fn(update)
+
+    def detach(self):
+        object.__setattr__(self.state, '_push_state_fn', self.push_fn)
+
+
+def _encode_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+
+    return str(value)
+
+
+def _merge_changes(state, changes):
+    # Recorded channels have no histograms. Keep the current ones.
+    channels = changes.get('data_channels')
+    if not channels or not state.data_channels:
+        return changes
+
+    merged = {}
+    for name, channel in channels.items():
+        merged[name] = {**state.data_channels.get(name, {}), **channel}
+
+    return {**changes, 'data_channels': merged}
+
+
+def _data_mtimes(volume_view):
+    return [
+        d.GetMTime() for d in (volume_view.volume_data, volume_view.mask_data)
+    ]
+
+
+def _modified_bytes(volume_view, mtimes):
+    # The scalars of modified image data are uploaded again
+    num_bytes = 0
+    image_data = (volume_view.volume_data, volume_view.mask_data)
+    for data, mtime in zip(image_data, mtimes):
+        scalars = data.GetPointData().GetScalars()
+        if scalars is not None and data.GetMTime() != mtime:
+            num_bytes += (
+                scalars.GetNumberOfValues() * scalars.GetDataTypeSize()
+            )
+
+    return num_bytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Replay a session, and measure the latency of events',
+    )
+    parser.add_argument('--session', help='Session file to replay')
+    parser.add_argument(
+        '--scripted',
+        action='store_true',
+        help='Replay the built-in session instead of a session file',
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=1, help='Number of replays'
+    )
+    parser.add_argument(
+        '--no-render',
+        action='store_true',
+        help='Do not render the view after each event',
+    )
+    parser.add_argument('--output', help='Save the stats as JSON')
+    args, _ = parser.parse_known_args(argv)
+
+    if args.session is None and not args.scripted:
+        parser.error('--session or --scripted is required')
+
+    from trame.app import get_server
+
+    from .app import App
+
+    # The remaining arguments are the options of the application
+    app = App(get_server('replay', client_type='vue3'))
+    app.state.ready()
+    with app.state:
+        app.load_data(app.file_to_load)
+
+    if args.scripted:
+        events = scripted_session(app)
+    else:
+        events = load_session(args.session)
+
+    stats = []
+    for _ in range(args.repeat):
+        stats += replay(app, events, render=not args.no_render)
+
+    summary = summarize(stats)
+    print(format_summary(summary))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'events': stats, 'summary': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
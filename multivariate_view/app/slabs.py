@@ -0,0 +1,257 @@
+"""Prepare large volumes in z-slabs, with a pool of worker processes
+
+The kernels release the GIL, but the NumPy code around them does not,
+so a single process does not use every core of a large node. The pool
+splits the cropped volume into slabs along z, which are processed by
+worker processes over shared memory. Since the voxels are in C order,
+the results of consecutive slabs are consecutive rows of the results
+of the volume, so they are written in place, without sorting.
+
+Like `voxels.build_voxel_index`, this takes two passes: the nonzero
+voxels of each slab are counted first, so that each slab knows where to
+write its rows of the results.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+import os
+
+import numba
+import numpy as np
+
+from .compute import compute_gbc, gbc_to_rgb, rotate_coordinates
+from .compute.preprocess import normalize_rows, normalized_nonzero_voxels
+from .compute.voxels import build_voxel_index, index_dtype
+from .profiling import profiled
+
+# Volumes (and voxels) with fewer rows are processed by the calling
+# process, where the pool costs more than it saves
+MIN_ROWS = 2**22
+
+# Number of slabs per worker, so that the slabs with the most nonzero
+# voxels do not leave the other workers idle
+SLABS_PER_WORKER = 4
+
+
+class SharedArray:
+    """An array in shared memory, which other processes attach to
+
+    Processes attach with the `spec` of the array. The array must not be
+    used once it is closed.
+    """
+
+    def __init__(self, shm: SharedMemory, shape: tuple[int], dtype):
+        self.shm = shm
+        self.array = np.ndarray(shape, dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, shape: tuple[int], dtype) -> 'SharedArray':
+        dtype = np.dtype(dtype)
+        # Shared memory may not be empty
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        return cls(SharedMemory(create=True, size=size), shape, dtype)
+
+    @classmethod
+    def attach(cls, spec: tuple) -> 'SharedArray':
+        name, shape, dtype = spec
+        return cls(SharedMemory(name=name), shape, dtype)
+
+    @property
+    def spec(self) -> tuple:
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        # The buffer cannot be closed while the array uses it
+        del self.array
+        self.shm.close()
+
+
+class SlabPool:
+    """A pool of worker processes that prepare volumes slab by slab
+
+    The workers are spawned, since the parallel kernels are not
+    fork-safe, and the cores are shared between them. Only the volumes
+    (and voxels) of at least `min_rows` rows are worth sending to them.
+    """
+
+    def __init__(self, num_workers: int, min_rows: int = MIN_ROWS):
+        self.num_workers = num_workers
+        self.min_rows = min_rows
+        num_threads = max(os.cpu_count() // num_workers, 1)
+        self._executor = ProcessPoolExecutor(
+            num_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(num_threads,),
+        )
+
+    def handles(self, num_rows: int) -> bool:
+        return num_rows >= self.min_rows
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _run(self, function, tasks):
+        # Run the tasks in the workers, and wait for all of their results
+        futures = [self._executor.submit(function, *x) for x in tasks]
+        return [x.result() for x in futures]
+
+    @profiled(category='stage')
+    def prepare(
+        self, data: np.ndarray, lo: np.ndarray, hi: np.ndarray
+    ) -> dict[str, np.ndarray]:
+        """Find the nonzero voxels of a volume, and their GBC and alpha
+
+        `lo` and `hi` are the normalization ranges. The results are those
+        of the application: the sorted linear indices of the nonzero
+        voxels, their normalized data, their unrotated GBC (and the GBC
+        components), and the mean of their channels, which is their
+        default alpha.
+
+        The volume is copied to shared memory first.
+        """
+        shape = data.shape[:-1]
+        num_channels = data.shape[-1]
+        bounds = slab_bounds(shape[0], self.num_workers * SLABS_PER_WORKER)
+        slabs = list(zip(bounds[:-1], bounds[1:]))
+
+        shared = SharedArray.create(data.shape, data.dtype)
+        mask = SharedArray.create(shape, bool)
+        outputs = {}
+        try:
+            shared.array[:] = data
+            specs = (shared.spec, mask.spec)
+            counts = self._run(
+                _count_slab, [(specs, lo, hi, z0, z1) for z0, z1 in slabs]
+            )
+            offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            num_rows = int(offsets[-1])
+
+            # The columns of the results, in the order that `_prepare_slab`
+            # unpacks them
+            columns = {
+                'nonzero_indices': (index_dtype(int(np.prod(shape))), ()),
+                'nonzero_data': (np.float64, (num_channels,)),
+                'gbc': (np.float64, (2,)),
+                'nonzero_means': (np.float64, ()),
+            }
+            for name, (dtype, width) in columns.items():
+                outputs[name] = SharedArray.create((num_rows, *width), dtype)
+
+            specs += tuple(x.spec for x in outputs.values())
+            self._run(
+                _prepare_slab,
+                [
+                    (specs, lo, hi, z0, z1, offset)
+                    for (z0, z1), offset in zip(slabs, offsets)
+                ],
+            )
+            results = {k: v.array.copy() for k, v in outputs.items()}
+        finally:
+            for array in (shared, mask, *outputs.values()):
+                array.close()
+                array.shm.unlink()
+
+        # The components only depend on the number of channels
+        _, results['components'] = compute_gbc(np.zeros((0, num_channels)))
+        return results
+
+    @profiled(category='stage')
+    def colors(
+        self, gbc: np.ndarray, angle: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Rotate the GBC of voxels, and compute their RGB colors
+
+        The results are those of `rotate_coordinates` and `gbc_to_rgb`.
+        The voxels are split into runs, which are slabs of the volume.
+        """
+        bounds = slab_bounds(len(gbc), self.num_workers * SLABS_PER_WORKER)
+        shared = SharedArray.create(gbc.shape, np.float64)
+        rotated = SharedArray.create(gbc.shape, np.float64)
+        rgb = SharedArray.create((3, len(gbc)), np.float64)
+        try:
+            shared.array[:] = gbc
+            specs = (shared.spec, rotated.spec, rgb.spec)
+            self._run(
+                _color_rows,
+                [
+                    (specs, angle, start, stop)
+                    for start, stop in zip(bounds[:-1], bounds[1:])
+                ],
+            )
+            return rotated.array.copy(), rgb.array.copy()
+        finally:
+            for array in (shared, rotated, rgb):
+                array.close()
+                array.shm.unlink()
+
+
+def slab_bounds(length: int, num_slabs: int) -> np.ndarray:
+    """Split `length` rows into at most `num_slabs` slabs
+
+    Slab `i` is the rows `bounds[i]:bounds[i + 1]`.
+    """
+    num_slabs = max(min(num_slabs, length), 1)
+    return np.linspace(0, length, num_slabs + 1).astype(np.int64)
+
+
+def _init_worker(num_threads):
+    # Share the cores between the workers
+    numba.set_num_threads(num_threads)
+
+
+def attached(function):
+    """Call a worker function with the shared arrays of its specs
+
+    The specs are the first argument. The arrays are closed once the
+    function returns, so it must not keep views of them.
+    """
+
+    @functools.wraps(function)
+    def wrapper(specs, *args):
+        shared = [SharedArray.attach(spec) for spec in specs]
+        try:
+            return function([x.array for x in shared], *args)
+        finally:
+            for array in shared:
+                array.close()
+
+    return wrapper
+
+
+@attached
+def _count_slab(arrays, lo, hi, z0, z1):
+    data, mask = arrays
+    rows = data[z0:z1].reshape(-1, data.shape[-1])
+    nonzero = normalized_nonzero_voxels(rows, lo, hi)
+    mask[z0:z1] = nonzero.reshape(mask[z0:z1].shape)
+    return int(np.count_nonzero(nonzero))
+
+
+@attached
+def _prepare_slab(arrays, lo, hi, z0, z1, offset):
+    data, mask, indices, nonzero_data, gbc, means = arrays
+    slab = data[z0:z1]
+    index = build_voxel_index(mask[z0:z1], slab.shape[:-1])
+    rows = slice(offset, offset + len(index))
+
+    # The linear indices of the slab start at its first voxel
+    indices[rows] = index.indices
+    indices[rows] += z0 * int(np.prod(data.shape[1:-1]))
+
+    nonzero_data[rows] = normalize_rows(
+        index.gather(slab.reshape(-1, slab.shape[-1])), lo, hi
+    )
+    slab_gbc, _ = compute_gbc(nonzero_data[rows])
+    gbc[rows] = slab_gbc
+    means[rows] = nonzero_data[rows].mean(axis=1)
+
+
+@attached
+def _color_rows(arrays, angle, start, stop):
+    gbc, rotated, rgb = arrays
+    rotated[start:stop] = rotate_coordinates(gbc[start:stop], angle)
+    rgb[:, start:stop] = gbc_to_rgb(rotated[start:stop])
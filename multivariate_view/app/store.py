@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+
+import numpy as np
+
+from multivariate_view.typing import PathLike
+from .remote import is_remote, remote_version
+
+METADATA_FILE = 'metadata.json'
+
+
+class DatasetStore:
+    """Immutable dataset arrays, saved once per host and shared
+
+    Every entry is a directory of `.npy` files, plus JSON metadata.
+    Loaded arrays are memory-mapped read-only, so every process that
+    loads the same entry shares its pages through the OS page cache,
+    rather than keeping its own copy.
+    """
+
+    def __init__(self, directory: PathLike):
+        self.directory = Path(directory)
+
+    def key(self, path: PathLike, **options) -> str:
+        """Identify a dataset file, and the options used to prepare it
+
+        The key changes if the file is modified. Remote files are
+        identified by their URL, size and version (ETag).
+        """
+        if is_remote(path):
+            size, version = remote_version(str(path))
+            description = {'url': str(path), 'size': size, 'version': version}
+        else:
+            path = Path(path).resolve()
+            stat = path.stat()
+            description = {
+                'path': str(path),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+            }
+
+        description['options'] = options
+        encoded = json.dumps(description, sort_keys=True).encode()
+        return hashlib.sha1(encoded).hexdigest()
+
+    def load(self, key: str) -> tuple[dict, dict[str, np.ndarray]] | None:
+        """Load the metadata and the memory-mapped arrays of an entry
+
+        None is returned if there is no such entry.
+        """
+        entry = self.directory / key
+        if not entry.is_dir():
+            return None
+
+        with open(entry / METADATA_FILE) as f:
+            metadata = json.load(f)
+
+        arrays = {
+            name: np.load(entry / f'{name}.npy', mmap_mode='r')
+            for name in metadata['arrays']
+        }
+        return metadata['metadata'], arrays
+
+    def save(
+        self, key: str, metadata: dict, arrays: dict[str, np.ndarray]
+    ) -> tuple[dict, dict[str, np.ndarray]]:
+        """Save an entry, and load it back
+
+        The entry is written to a temporary directory that is then
+        renamed, so other processes never see a partial entry. If another
+        process saved the same entry first, that one is kept.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = self.directory / key
+
+        tmp_entry = Path(tempfile.mkdtemp(dir=self.directory))
+        try:
+            for name, array in arrays.items():
+                np.save(tmp_entry / f'{name}.npy', array)
+
+            with open(tmp_entry / METADATA_FILE, 'w') as f:
+                json.dump({'metadata': metadata, 'arrays': list(arrays)}, f)
+
+            os.rename(tmp_entry, entry)
+        except OSError:
+            if not entry.is_dir():
+                raise
+        finally:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+        return self.load(key)
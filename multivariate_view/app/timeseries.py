@@ -0,0 +1,157 @@
+"""Time series of volumes, and a cache of prepared timesteps
+
+A time series is either a file pattern, like `scan_*.h5`, with a file
+per timestep, or an HDF5 file with a group per timestep at the root
+(each group has a dataset per channel). The timesteps are sorted by
+name, with numbers in the names compared as numbers. Patterns are not
+expanded in URLs.
+
+The `TimestepCache` prepares timesteps in a background worker, so that
+the adjacent timesteps are ready before the user steps to them.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import glob
+from pathlib import Path
+import re
+import threading
+from typing import Callable
+
+from multivariate_view.typing import PathLike
+from .io import (
+    LoadReturnType,
+    list_hdf5_groups,
+    load_dataset,
+    load_hdf5_dataset,
+)
+from .remote import is_remote, path_name
+
+
+class Timestep:
+    """A volume of a time series: a file, or a group of an HDF5 file"""
+
+    def __init__(self, path: PathLike, group: str | None = None):
+        # URLs are kept as they are
+        self.path = path if is_remote(path) else Path(path)
+        self.group = group
+
+    def load(self) -> LoadReturnType:
+        if self.group is None:
+            return load_dataset(self.path)
+
+        return load_hdf5_dataset(self.path, self.group)
+
+    def __str__(self):
+        if self.group is None:
+            return str(self.path)
+
+        return f'{self.path}:{self.group}'
+
+
+def find_timesteps(path: PathLike) -> list[Timestep]:
+    """Find the timesteps of the data given with `--data`
+
+    A path that is neither a pattern nor an HDF5 file of groups is a
+    single timestep.
+    """
+    text = str(path)
+    remote = is_remote(text)
+    if not remote and glob.has_magic(text):
+        paths = sorted(glob.glob(text), key=natural_key)
+        if not paths:
+            raise FileNotFoundError(f'No files match: {text}')
+
+        return [Timestep(p) for p in paths]
+
+    path = text if remote else Path(path)
+    is_hdf5 = Path(path_name(path)).suffix.lower() == '.h5'
+    if is_hdf5 and (remote or path.exists()):
+        groups = sorted(list_hdf5_groups(path), key=natural_key)
+        if groups:
+            return [Timestep(path, group) for group in groups]
+
+    return [Timestep(path)]
+
+
+def natural_key(text: str) -> list:
+    # Sort `t2` before `t10`
+    return [
+        (0, int(part), '') if part.isdigit() else (1, 0, part)
+        for part in re.split(r'(\d+)', str(text))
+        if part
+    ]
+
+
+class TimestepCache:
+    """A bounded cache of prepared timesteps
+
+    Timesteps are prepared with `prepare(index)` by a single background
+    worker, since the kernels already use every core. The cache keeps the
+    `size` most recently requested timesteps. Evicted timesteps that are
+    still queued are cancelled.
+    """
+
+    def __init__(self, prepare: Callable[[int], object], size: int = 3):
+        self.prepare = prepare
+        self.size = size
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='prefetch'
+        )
+
+    def get(self, index: int) -> Future:
+        """Get the future of a prepared timestep, preparing it if needed"""
+        with self._lock:
+            future = self._futures.get(index)
+            if future is None or _failed(future):
+                future = self._executor.submit(self.prepare, index)
+                self._futures[index] = future
+
+            self._futures.move_to_end(index)
+            self._evict()
+            return future
+
+    def put(self, index: int, prepared):
+        """Cache a timestep that was prepared elsewhere"""
+        future = Future()
+        future.set_result(prepared)
+        with self._lock:
+            self._futures[index] = future
+            self._futures.move_to_end(index)
+            self._evict()
+
+    def prefetch(self, indices: list[int]):
+        """Prepare timesteps in the background, in order
+
+        The timesteps requested last are the last ones to be evicted.
+        """
+        for index in indices:
+            self.get(index)
+
+    def cached(self) -> list[int]:
+        """The timesteps that are prepared, or being prepared"""
+        with self._lock:
+            return list(self._futures)
+
+    def shutdown(self):
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+
+            self._futures.clear()
+
+        self._executor.shutdown(wait=True)
+
+    def _evict(self):
+        while len(self._futures) > self.size:
+            _, future = self._futures.popitem(last=False)
+            future.cancel()
+
+
+def _failed(future):
+    # Cancelled and failed timesteps are prepared again
+    return future.cancelled() or (
+        future.done() and future.exception() is not None
+    )
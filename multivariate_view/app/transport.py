@@ -0,0 +1,18 @@
+import numpy as np
+
+# Arrays are sent to the client as raw bytes, rather than as (nested)
+# lists. The bytes are sent as binary attachments, and the client wraps
+# them in typed arrays without any parsing.
+
+
+def float32_buffer(array: np.ndarray) -> bytes:
+    """Encode an array as C-ordered float32 bytes
+
+    Coordinate arrays of shape `(n, 2)` become `[x0, y0, x1, y1, ...]`.
+    """
+    return np.ascontiguousarray(array, dtype=np.float32).tobytes()
+
+
+def uint8_buffer(array: np.ndarray) -> bytes:
+    """Encode an array of values between 0 and 255 as bytes"""
+    return np.ascontiguousarray(array, dtype=np.uint8).tobytes()
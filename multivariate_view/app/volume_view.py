@@ -1,5 +1,7 @@
 import numpy as np
 
+from vtkmodules.util.vtkAlgorithm import VTKPythonAlgorithmBase
+from vtkmodules.vtkCommonCore import vtkSMPTools
 from vtkmodules.vtkCommonDataModel import vtkImageData
 from vtkmodules.vtkInteractionStyle import vtkInteractorStyleTrackballCamera
 from vtkmodules.vtkInteractionWidgets import vtkOrientationMarkerWidget
@@ -11,13 +13,40 @@ from vtkmodules.vtkRenderingCore import (
     vtkVolume,
     vtkVolumeProperty,
 )
-from vtkmodules.vtkRenderingVolume import vtkGPUVolumeRayCastMapper
+from vtkmodules.vtkRenderingVolume import (
+    vtkFixedPointVolumeRayCastMapper,
+    vtkGPUVolumeRayCastMapper,
+)
 import vtkmodules.util.numpy_support as np_s
-import vtkmodules.vtkRenderingVolumeOpenGL2  # noqa - this is required
+from vtkmodules.vtkRenderingVolumeOpenGL2 import vtkSmartVolumeMapper
+
+from .compute.rgba import masked_rgba_uint8
+from .profiling import profiled
+
+# The volume mappers that may be chosen with `--render-backend`. Only the
+# GPU mapper needs a GPU. The smart mapper uses the GPU if it can, and
+# the CPU otherwise.
+RENDER_BACKENDS = ('gpu', 'cpu', 'smart')
+
+# Frames per second while interacting. The CPU mappers increase the
+# sample distances (in the volume and in the image) to reach it, and
+# render at full quality once the interaction ends.
+INTERACTIVE_UPDATE_RATE = 10
+
+# The largest image sample distance (in pixels) of the CPU mapper
+MAX_IMAGE_SAMPLE_DISTANCE = 4
 
 
 class VolumeView:
-    def __init__(self):
+    def __init__(self, backend='gpu', num_threads=None):
+        """Set up the rendering of the RGBA volume
+
+        The `num_threads` of the CPU mappers default to the number of
+        cores.
+        """
+        if num_threads is not None:
+            vtkSMPTools.Initialize(num_threads)
+
         # Set up the VTK volume
         ren = vtkRenderer()
         ren_win = vtkRenderWindow()
@@ -44,21 +73,37 @@ class VolumeView:
         volume_property.SetSpecular(0.9)
         volume_property.SetSpecularPower(10)
 
-        # Fix the scalar opacity to be a no-op
-        pwf = volume_property.GetScalarOpacity()
-        pwf.RemoveAllPoints()
-        pwf.AddPoint(0, 0)
-        pwf.AddPoint(1, 1)
-
         volume_data = vtkImageData()
         mask_data = vtkImageData()
 
-        volume_mapper = vtkGPUVolumeRayCastMapper()
-        volume_mapper.SetInputData(volume_data)
-        volume_mapper.UseJitteringOn()
+        if backend == 'gpu':
+            volume_mapper = vtkGPUVolumeRayCastMapper()
+            volume_mapper.SetInputData(volume_data)
+            volume_mapper.UseJitteringOn()
+
+            volume_mapper.SetMaskInput(mask_data)
+            volume_mapper.SetMaskTypeToBinary()
+            max_alpha = 1
+        else:
+            volume_mapper = cpu_volume_mapper(backend, num_threads)
+
+            # The other mappers have no masks, and only render unsigned
+            # char RGBA. The mask is applied to the alpha instead.
+            masked_rgba = MaskedRGBA()
+            masked_rgba.SetInputDataObject(0, volume_data)
+            masked_rgba.SetInputDataObject(1, mask_data)
+            volume_mapper.SetInputConnection(masked_rgba.GetOutputPort())
+            max_alpha = 255
+
+            # The update rate of the interactor is the frame rate that the
+            # mapper aims for while interacting
+            iren.SetDesiredUpdateRate(INTERACTIVE_UPDATE_RATE)
 
-        volume_mapper.SetMaskInput(mask_data)
-        volume_mapper.SetMaskTypeToBinary()
+        # Fix the scalar opacity to be a no-op
+        pwf = volume_property.GetScalarOpacity()
+        pwf.RemoveAllPoints()
+        pwf.AddPoint(0, 0)
+        pwf.AddPoint(max_alpha, 1)
 
         volume = vtkVolume()
         volume.SetMapper(volume_mapper)
@@ -77,34 +122,116 @@ class VolumeView:
         self.volume_data = volume_data
         self.mask_data = mask_data
         self.volume_property = volume_property
+        self.volume_mapper = volume_mapper
+        self.backend = backend
 
-    def set_data(self, data):
+    @profiled(category='vtk')
+    def set_data(self, data, spacing=1, offset=(0, 0, 0)):
         # We use C ordering throughout the application, but VTK uses
         # Fortran ordering. Reverse the shape to fix this.
         shape = data.shape[:3][::-1]
         raveled = data.reshape((np.prod(shape), 4))
 
-        set_array_to_image_data(raveled, self.volume_data, shape)
+        # The data may be a sub-extent (e.g. the clipped box), starting at
+        # the offset (in C ordering) within the full volume.
+        offset = offset[::-1]
+        set_array_to_image_data(raveled, self.volume_data, shape, offset)
 
         # Set a default mask array of ones
         set_array_to_image_data(
-            np.zeros(np.prod(shape)), self.mask_data, shape
+            np.zeros(np.prod(shape), dtype=np.uint8),
+            self.mask_data,
+            shape,
+            offset,
         )
 
+        # Downsampled data covers the same bounds as full resolution.
+        # Each voxel is centered on the block it was averaged from.
+        origin = [(spacing - 1) / 2] * 3
+        for image_data in (self.volume_data, self.mask_data):
+            image_data.SetSpacing([spacing] * 3)
+            image_data.SetOrigin(origin)
+
         self.volume_data.Modified()
         self.render_window.Render()
 
+    @property
+    def volume_reference(self):
+        # Return a numpy array that refers to the VTK RGBA array
+        return np_s.vtk_to_numpy(self.volume_data.GetPointData().GetScalars())
+
     @property
     def mask_reference(self):
         # Return a numpy array that refers to the VTK mask array
         return np_s.vtk_to_numpy(self.mask_data.GetPointData().GetScalars())
 
 
+def cpu_volume_mapper(backend, num_threads=None):
+    if backend == 'cpu':
+        mapper = vtkFixedPointVolumeRayCastMapper()
+        if num_threads is not None:
+            mapper.SetNumberOfThreads(num_threads)
+
+        # Lower the sample distances while interacting
+        mapper.AutoAdjustSampleDistancesOn()
+        mapper.SetMaximumImageSampleDistance(MAX_IMAGE_SAMPLE_DISTANCE)
+        return mapper
+
+    if backend == 'smart':
+        mapper = vtkSmartVolumeMapper()
+        mapper.SetRequestedRenderModeToDefault()
+        mapper.InteractiveAdjustSampleDistancesOn()
+        mapper.SetInteractiveUpdateRate(INTERACTIVE_UPDATE_RATE)
+        return mapper
+
+    msg = f'Unknown render backend: {backend}'
+    raise ValueError(msg)
+
+
+class MaskedRGBA(VTKPythonAlgorithmBase):
+    """Apply the mask to the RGBA volume, as unsigned char
+
+    The first input is the RGBA volume, and the second one the mask. This
+    only runs again when either of them is modified.
+    """
+
+    def __init__(self):
+        super().__init__(
+            nInputPorts=2,
+            inputType='vtkImageData',
+            nOutputPorts=1,
+            outputType='vtkImageData',
+        )
+
+    def RequestData(self, request, in_info, out_info):
+        volume_data = vtkImageData.GetData(in_info[0])
+        mask_data = vtkImageData.GetData(in_info[1])
+        output = vtkImageData.GetData(out_info)
+
+        rgba = np_s.vtk_to_numpy(volume_data.GetPointData().GetScalars())
+        mask = np_s.vtk_to_numpy(mask_data.GetPointData().GetScalars())
+
+        output.CopyStructure(volume_data)
+        output.GetPointData().SetScalars(
+            np_s.numpy_to_vtk(masked_rgba_uint8(rgba, mask), deep=False)
+        )
+        return 1
+
+
 def set_array_to_image_data(
-    array: np.ndarray, image_data: vtkImageData, shape: tuple[int], clear=True
+    array: np.ndarray,
+    image_data: vtkImageData,
+    shape: tuple[int],
+    offset: tuple[int] = (0, 0, 0),
+    clear=True,
 ):
-    vtk_array = np_s.numpy_to_vtk(array, deep=True)
-    image_data.SetDimensions(shape)
+    # The VTK array uses the memory of the numpy array, and keeps a
+    # reference to it, rather than copying it.
+    vtk_array = np_s.numpy_to_vtk(np.ascontiguousarray(array), deep=False)
+    extent = []
+    for start, size in zip(offset, shape):
+        extent += [start, start + size - 1]
+    image_data.SetExtent(extent)
     pd = image_data.GetPointData()
 
     if clear:
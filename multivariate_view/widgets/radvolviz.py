@@ -21,9 +21,12 @@ class NdColorMap(HtmlElement):
             "rotation",
             ("brush_mode", "brushMode"),
             ("component_labels", "componentLabels"),
+            ("density_image", "densityImage"),
+            ("density_resolution", "densityResolution"),
             ("lens_radius", "lensRadius"),
             ("number_of_bins", "numberOfBins"),
             ("sample_size", "sampleSize"),
+            ("show_density", "showDensity"),
             ("show_lens", "showLens"),
             ("unrotated_bin_data", "unrotatedBinData"),
             ("unrotated_component_coords", "unrotatedComponentCoords"),
@@ -0,0 +1,118 @@
+import json
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def volume_path(tmp_path):
+    # Random compositions, in an empty volume, with an empty corner
+    rng = np.random.default_rng(0)
+    data = np.zeros((3, 12, 10, 8))
+    data[:, 1:11, 1:9, 1:7] = rng.random((3, 10, 8, 6))
+    data[:, 1:7, 1:6, 1:5] = 0
+
+    path = tmp_path / 'data.h5'
+    with h5py.File(path, 'w') as f:
+        for name, channel in zip(('A', 'B', 'C'), data):
+            f[name] = channel
+
+    return path
+
+
+def run_app(volume_path, args: list[str], code: str):
+    # Run the application in a new interpreter, since importing pytest
+    # makes trame ignore the command line. `code` runs once the data is
+    # loaded, and prints its results as JSON on the last line.
+    script = f'''
+import json, sys
+import numpy as np
+sys.argv = ['multivariate-view', '--data', {str(volume_path)!r}, *{args!r}]
+from trame.app import get_server
+from multivariate_view.app.app import App
+
+app = App(get_server(client_type='vue3'))
+state = app.state
+state.ready()
+with state:
+    app.load_data(app.file_to_load)
+{code}
+'''
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_default_lens(volume_path):
+    # The default center of the lens is [0, 0], in ints
+    code = '''
+assert state.lens_center == [0, 0]
+state.show_groups = ['lens', 'voxel-means']
+state.flush()
+print(json.dumps([
+    state.selected_voxel_count,
+    int(np.count_nonzero(app.compute_alpha())),
+]))
+'''
+    count, expected = run_app(volume_path, [], code)
+    assert count == expected
+    assert 0 < count < 10 * 8 * 6
+
+
+@pytest.mark.parametrize('method', ['composition', 'gbc', 'density'])
+def test_segmentation_table(volume_path, method):
+    code = '''
+print(json.dumps(state.table_content))
+'''
+    args = ['--segment', method, '--num-phases', '3']
+    table = run_app(volume_path, args, code)
+
+    # The zero voxels are not a phase
+    assert 0 < len(table) <= 3
+    for i, row in enumerate(table, 1):
+        assert row['id'] == i
+        assert row['name'] == f'Phase {i}'
+        percents = [float(row[str(j)]) for j in range(3)]
+        assert np.isclose(sum(percents), 100, atol=0.05)
+
+
+def test_empty_clip_box(volume_path):
+    # A clip slider of zero width, and the empty corner of the volume
+    code = '''
+results = []
+for ranges in ([[0.5, 0.5], [0, 1], [0, 1]], [[0, 0.3], [0, 0.5], [0, 0.5]]):
+    state.w_clip_x, state.w_clip_y, state.w_clip_z = ranges
+    state.flush()
+    full = app.volume_view.volume_reference.copy()
+    num_points = app.volume_view.volume_data.GetNumberOfPoints()
+
+    # The coarse level of the previews
+    app.render_level(app.levels[0])
+    preview = app.volume_view.volume_reference.copy()
+    results.append([
+        len(app.box_index),
+        num_points,
+        len(full),
+        float(np.abs(full).sum()),
+        len(preview),
+        float(np.abs(preview).sum()),
+    ])
+
+print(json.dumps(results))
+'''
+    zero_width, empty = run_app(volume_path, [], code)
+    assert zero_width == [0, 0, 0, 0, 0, 0]
+
+    # The boxes have voxels, which are all zero
+    num_voxels, num_points, num_rows, total, num_preview_rows, _ = empty
+    assert num_voxels == 0
+    assert num_points == num_rows > 0
+    assert num_preview_rows > 0
+    assert empty[3] == empty[5] == 0
@@ -0,0 +1,62 @@
+import h5py
+import numpy as np
+
+from multivariate_view.app.batch import build_parser, main, run_pipeline
+
+
+def _write_dataset(path, seed=0):
+    rng = np.random.default_rng(seed)
+    channels = {}
+    for name in ('A', 'B', 'C'):
+        channels[name] = rng.random((8, 10, 12))
+
+    np.savez(path, **channels)
+
+
+def test_run_pipeline(tmp_path):
+    data_path = tmp_path / 'scan.npz'
+    _write_dataset(data_path)
+
+    label_map = np.random.default_rng(1).integers(0, 4, size=(8, 10, 12))
+    np.save(tmp_path / 'labels.npy', label_map)
+
+    options = build_parser().parse_args(
+        [
+            str(data_path),
+            '--label-map',
+            str(tmp_path / 'labels.npy'),
+            '--lens-radius',
+            '0.3',
+        ]
+    )
+    results = run_pipeline(data_path, options)
+
+    assert results['channels'].tolist() == ['A', 'B', 'C']
+    assert results['rgba'].shape == (8, 10, 12, 4)
+
+    num_nonzero = len(results['nonzero_indices'])
+    assert results['gbc'].shape == (num_nonzero, 2)
+    assert results['lens_alpha'].shape == (num_nonzero,)
+    assert np.isclose(results['lens_means'].sum(), 100)
+    assert results['label_values'].tolist() == [0, 1, 2, 3]
+    assert np.allclose(results['label_means'].sum(axis=1), 1)
+
+
+def test_batch_main(tmp_path):
+    paths = [tmp_path / f'scan{i}.npz' for i in range(2)]
+    for i, path in enumerate(paths):
+        _write_dataset(path, seed=i)
+
+    output_dir = tmp_path / 'out'
+    args = [str(p) for p in paths] + ['-o', str(output_dir), '-j', '2']
+    assert main(args) == 0
+
+    for path in paths:
+        with h5py.File(output_dir / f'{path.stem}.h5', 'r') as f:
+            assert f['rgba'].shape == (8, 10, 12, 4)
+            assert f['channels'].asstr()[()].tolist() == ['A', 'B', 'C']
+
+    # Missing files fail, without stopping the others
+    args = [str(paths[0]), str(tmp_path / 'missing.npz')]
+    assert main(args + ['-o', str(output_dir), '--format', 'npz']) == 1
+    assert (output_dir / 'scan0.npz').exists()
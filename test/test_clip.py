@@ -0,0 +1,31 @@
+import numpy as np
+
+from multivariate_view.app.compute.clip import (
+    box_shape,
+    clip_box,
+    voxels_in_box,
+)
+
+
+def test_clip_box():
+    box = clip_box((10, 20, 30), [[0, 1], [0.25, 0.5], [0.5, 0.4]])
+    assert box == (slice(0, 10), slice(5, 10), slice(15, 15))
+    assert box_shape(box) == (10, 5, 0)
+
+
+def test_voxels_in_box():
+    rng = np.random.default_rng(0)
+    shape = (12, 10, 8)
+    nonzero = rng.random(shape) < 0.3
+    flat_indices = np.flatnonzero(nonzero)
+
+    box = clip_box(shape, [[0.2, 0.7], [0, 0.5], [0.3, 1]])
+    positions, box_indices = voxels_in_box(flat_indices, shape, box)
+
+    # Compare against cropping the dense volume
+    ref = np.zeros(shape, dtype=int)
+    ref.ravel()[flat_indices] = np.arange(len(flat_indices)) + 1
+    cropped = ref[box].ravel()
+
+    assert np.array_equal(box_indices, np.flatnonzero(cropped))
+    assert np.array_equal(positions, cropped[box_indices] - 1)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from multivariate_view.app.compute.composition import build_composition_grid
+from multivariate_view.app.compute.selection import (
+    lens_alpha,
+    mean_composition,
+)
+
+
+@pytest.fixture
+def voxels():
+    rng = np.random.default_rng(0)
+    n = 20000
+    data = rng.random((n, 4))
+    data[::9] = 0
+
+    radius = np.sqrt(rng.random(n))
+    angle = rng.random(n) * 2 * np.pi
+    gbc = np.stack([radius * np.cos(angle), radius * np.sin(angle)], axis=1)
+
+    # Some points are outside of the unit disc
+    gbc[:20] *= 1.5
+
+    flat_indices = np.sort(rng.choice(2 * n, n, replace=False))
+    full_data = np.zeros((2 * n, 4))
+    full_data[flat_indices] = data
+
+    positions = np.flatnonzero(rng.random(n) < 0.7)
+    return gbc, positions, flat_indices, full_data
+
+
+@pytest.mark.parametrize(
+    'center, radius',
+    [
+        ((0.1, 0.2), 0.5),
+        ((0.9, -0.9), 0.6),
+        ((-1.2, 0), 0.5),
+        ((0, 0), 2),
+        ((0.3, -0.3), 0.001),
+    ],
+)
+@pytest.mark.parametrize('invert', [False, True])
+def test_lens_statistics(voxels, center, radius, invert):
+    gbc, positions, flat_indices, data = voxels
+    grid = build_composition_grid(
+        gbc, positions, flat_indices, data, resolution=64
+    )
+
+    alpha = lens_alpha(gbc[positions], center, radius, invert)
+    ref = mean_composition(data[flat_indices[positions[alpha]]])
+
+    count, means = grid.lens_statistics(center, radius, invert)
+    assert count == alpha.sum()
+    assert np.allclose(means, ref)
+
+
+def test_statistics(voxels):
+    gbc, positions, flat_indices, data = voxels
+    grid = build_composition_grid(gbc, positions, flat_indices, data)
+
+    count, means = grid.statistics()
+    assert count == len(positions)
+    assert np.allclose(means, mean_composition(data[flat_indices[positions]]))
+
+    # No voxels
+    grid = build_composition_grid(gbc, positions[:0], flat_indices, data)
+    count, means = grid.lens_statistics((0, 0), 0.5)
+    assert count == 0
+    assert np.array_equal(means, np.zeros(4))
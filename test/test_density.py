@@ -0,0 +1,29 @@
+import numpy as np
+
+from multivariate_view.app.compute.density import (
+    compute_density,
+    density_to_image,
+)
+
+
+def test_density():
+    rng = np.random.default_rng(0)
+    gbc = np.clip(rng.normal(scale=0.4, size=(50000, 2)), -0.999, 0.999)
+
+    resolution = 64
+    counts = compute_density(gbc, resolution)
+    assert counts.shape == (resolution, resolution)
+    assert counts.sum() == len(gbc)
+
+    # Rows are y, and columns are x
+    edges = np.linspace(-1, 1, resolution + 1)
+    ref = np.histogram2d(gbc[:, 1], gbc[:, 0], bins=(edges, edges))[0]
+    assert np.array_equal(counts, ref)
+
+
+def test_density_image():
+    counts = np.array([[0, 1], [9, 99]])
+    image = np.frombuffer(density_to_image(counts), dtype=np.uint8)
+
+    assert image.tolist() == [0, 38, 128, 255]
+    assert density_to_image(np.zeros((2, 2), dtype=int)) == bytes(4)
@@ -0,0 +1,55 @@
+import h5py
+import numpy as np
+import pytest
+
+from multivariate_view.app.export import export_selection, selection_chunks
+
+
+def test_selection_chunks():
+    selected = np.random.default_rng(0).random(1000) < 0.3
+    chunks = list(selection_chunks(selected, 64))
+    assert all(len(chunk) <= 64 for chunk in chunks)
+    assert np.array_equal(np.concatenate(chunks), np.flatnonzero(selected))
+
+
+@pytest.mark.parametrize('suffix', ['.h5', '.npz'])
+def test_export_selection(tmp_path, suffix):
+    rng = np.random.default_rng(0)
+    values = rng.random((1000, 3)).astype(np.float32)
+    coords = rng.integers(0, 100, size=(1000, 3))
+    selected = rng.random(1000) < 0.4
+
+    columns = {
+        'values': lambda positions: values[positions],
+        'coordinates': lambda positions: coords[positions],
+        'sums': lambda positions: values[positions].sum(axis=1),
+    }
+    metadata = {'channels': np.array(['a', 'b', 'c']), 'shape': [10, 10]}
+
+    path = tmp_path / f'selection{suffix}'
+    num_selected = export_selection(
+        path, selected, columns, metadata, chunk_size=64
+    )
+    assert num_selected == selected.sum()
+
+    if suffix == '.npz':
+        exported = dict(np.load(path))
+    else:
+        with h5py.File(path, 'r') as f:
+            exported = {name: f[name][()] for name in f}
+
+        exported['channels'] = exported['channels'].astype(str)
+
+    assert list(exported['channels']) == ['a', 'b', 'c']
+    assert list(exported['shape']) == [10, 10]
+    assert exported['values'].dtype == np.float32
+    for name, column in columns.items():
+        assert np.array_equal(exported[name], column(selected.nonzero()[0]))
+
+    # Nothing is selected
+    export_selection(path, np.zeros(1000, dtype=bool), columns)
+    if suffix == '.npz':
+        assert np.load(path)['values'].shape == (0, 3)
+
+    with pytest.raises(ValueError):
+        export_selection(tmp_path / 'selection.csv', selected, columns)
@@ -0,0 +1,61 @@
+import numpy as np
+
+from multivariate_view.app.compute.histogram import (
+    HistogramCache,
+    SelectionHistograms,
+    scale_histogram,
+)
+
+
+def _random_data(seed=0, num_rows=5000, num_channels=4):
+    rng = np.random.default_rng(seed)
+    data = rng.random((num_rows, num_channels)) * 10
+    # Make some rows all zero, and some values zero
+    data[rng.random(num_rows) < 0.3] = 0
+    data[rng.random(data.shape) < 0.1] = 0
+    return data
+
+
+def test_histogram_counts():
+    data = _random_data()
+    cache = HistogramCache(data, num_bins=200)
+
+    nonzero_data = data[~np.all(np.isclose(data, 0), axis=1)]
+    for idx in range(data.shape[1]):
+        ref_counts, ref_edges = np.histogram(nonzero_data[:, idx], bins=200)
+        assert np.array_equal(cache.counts[idx], ref_counts)
+        assert np.allclose(cache.edges[idx], ref_edges)
+
+
+def test_scale_histogram():
+    counts = np.array([0, 1, 10, 100, 1000])
+
+    assert scale_histogram(counts, False).tolist() == [0, 0, 1, 10, 100]
+    assert scale_histogram(counts, True).tolist() == [0, 0, 33, 66, 100]
+
+    # Subsets are scaled relative to the reference
+    scaled = scale_histogram(counts // 10, False, counts)
+    assert scaled.tolist() == [0, 0, 0, 1, 10]
+
+
+def test_selection_histograms():
+    rng = np.random.default_rng(1)
+    data = _random_data(seed=1)
+    cache = HistogramCache(data, num_bins=50)
+
+    indices = np.nonzero(~np.all(np.isclose(data, 0), axis=1))[0]
+    selection = SelectionHistograms(cache, indices)
+
+    mask = rng.random(len(indices)) < 0.5
+    for _ in range(5):
+        counts = selection.update(mask)
+        ref = cache.subset_counts(indices[mask])
+        assert np.array_equal(counts, ref)
+
+        # Flip a few voxels in and out of the selection
+        flip = rng.choice(len(indices), size=100, replace=False)
+        mask = mask.copy()
+        mask[flip] = ~mask[flip]
+
+    ref_counts = np.histogram(data[indices[mask], 0], bins=cache.edges[0])[0]
+    assert np.array_equal(selection.update(mask)[0], ref_counts)
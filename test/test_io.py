@@ -0,0 +1,89 @@
+import h5py
+import numpy as np
+import pytest
+
+from multivariate_view.app.compute.voxels import SparseVolume
+from multivariate_view.app.io import load_dataset
+
+
+@pytest.mark.parametrize('suffix', ['npz', 'h5'])
+def test_load_sparse_dataset(tmp_path, suffix):
+    rng = np.random.default_rng(0)
+    coordinates = np.array([[3, 1, 0], [0, 2, 1], [1, 0, 4]])
+    arrays = {
+        'shape': np.array([4, 3, 5]),
+        'coordinates': coordinates,
+        'A': rng.random(3),
+        'B': rng.random(3),
+    }
+    path = tmp_path / f'sparse.{suffix}'
+    if suffix == 'npz':
+        np.savez(path, **arrays)
+    else:
+        with h5py.File(path, 'w') as f:
+            for name, array in arrays.items():
+                f[name] = array
+
+    labels, data = load_dataset(path)
+    assert labels == ['A', 'B']
+    assert isinstance(data, SparseVolume)
+    assert data.shape == (4, 3, 5, 2)
+
+    dense = data.to_dense()
+    assert np.count_nonzero(dense.any(axis=3)) == 3
+    assert np.array_equal(dense[tuple(coordinates.T)][:, 0], arrays['A'])
+    assert np.array_equal(dense[tuple(coordinates.T)][:, 1], arrays['B'])
+
+
+def write_vti(path, arrays, scalars=None):
+    from vtkmodules.util import numpy_support as np_s
+    from vtkmodules.vtkCommonDataModel import vtkImageData
+    from vtkmodules.vtkIOXML import vtkXMLImageDataWriter
+
+    # The arrays are (x, y, z, components), and are written in VTK order
+    image_data = vtkImageData()
+    image_data.SetDimensions(next(iter(arrays.values())).shape[:3])
+    for name, array in arrays.items():
+        flat = array.transpose(2, 1, 0, 3).reshape(-1, array.shape[3])
+        vtk_array = np_s.numpy_to_vtk(flat, deep=True)
+        vtk_array.SetName(name)
+        image_data.GetPointData().AddArray(vtk_array)
+
+    if scalars is not None:
+        image_data.GetPointData().SetActiveScalars(scalars)
+
+    writer = vtkXMLImageDataWriter()
+    writer.SetFileName(str(path))
+    writer.SetInputData(image_data)
+    writer.Write()
+
+
+def test_load_vti_dataset(tmp_path):
+    rng = np.random.default_rng(1)
+
+    # One array per element
+    arrays = {
+        'Fe': rng.random((5, 4, 3, 1)),
+        'Co': rng.random((5, 4, 3, 1)).astype(np.float32),
+    }
+    write_vti(tmp_path / 'elements.vti', arrays)
+    labels, data = load_dataset(tmp_path / 'elements.vti')
+    assert labels == ['Fe', 'Co']
+    assert data.flags.c_contiguous
+    assert data.dtype == np.float64
+    assert np.array_equal(data, np.concatenate(list(arrays.values()), 3))
+
+    # The components of multi-component scalars, without the other arrays
+    scalars = rng.random((5, 4, 3, 2))
+    arrays = {'scalars': scalars, 'other': rng.random((5, 4, 3, 1))}
+    write_vti(tmp_path / 'scalars.vti', arrays, scalars='scalars')
+    labels, data = load_dataset(tmp_path / 'scalars.vti')
+    assert labels == ['scalars 0', 'scalars 1']
+    assert np.array_equal(data, scalars)
+
+    # A single array in C order is not copied
+    array = rng.random((7, 1, 1, 3))
+    write_vti(tmp_path / 'line.vti', {'line': array}, scalars='line')
+    labels, data = load_dataset(tmp_path / 'line.vti')
+    assert np.array_equal(data, array)
+    assert not data.flags.owndata
@@ -0,0 +1,68 @@
+import numpy as np
+
+from multivariate_view.app.compute.labels import (
+    apply_label_factors,
+    build_label_index,
+    label_mask,
+    selection_factors,
+)
+
+
+def test_label_index():
+    rng = np.random.default_rng(0)
+    label_map = rng.choice([2, 5, 7, 11], size=(6, 5, 4))
+    label_index = build_label_index(label_map)
+
+    assert np.array_equal(label_index.values, [2, 5, 7, 11])
+    assert label_index.offsets[-1] == label_map.size
+
+    flattened = label_map.ravel()
+    for value in label_index.values:
+        ref = np.nonzero(flattened == value)[0]
+        assert np.array_equal(label_index.voxels(value), ref)
+
+    # Missing labels have no voxels
+    assert len(label_index.voxels(3)) == 0
+
+
+def test_selection_changes():
+    rng = np.random.default_rng(1)
+    label_map = rng.integers(0, 5, size=(8, 8, 8))
+    label_index = build_label_index(label_map)
+    flattened = label_map.ravel()
+
+    base_alpha = rng.random(label_map.size)
+    alpha = base_alpha.copy()
+    multiplier = 0.1
+
+    previous = np.ones(len(label_index))
+    for selection in ([1], [3], [1, 4], []):
+        factors = selection_factors(label_index, selection, multiplier)
+        apply_label_factors(alpha, base_alpha, label_index, factors, previous)
+        previous = factors
+
+        # Compare against the full volume approach
+        ref = base_alpha.copy()
+        if selection:
+            ref[~np.isin(flattened, selection)] *= multiplier
+
+        assert np.allclose(alpha, ref)
+
+    # Swapping a single selection only touches the two labels involved
+    old = selection_factors(label_index, [1], multiplier)
+    new = selection_factors(label_index, [2], multiplier)
+    num_modified = apply_label_factors(
+        alpha, base_alpha, label_index, new, old
+    )
+    assert num_modified == np.isin(flattened, [1, 2]).sum()
+
+
+def test_label_mask():
+    rng = np.random.default_rng(2)
+    label_map = rng.integers(0, 5, size=(6, 7, 8))
+    label_index = build_label_index(label_map)
+    flat_indices = np.flatnonzero(rng.random(label_map.size) < 0.5)
+
+    mask = label_mask(label_index, [1, 3, 9], flat_indices)
+    ref = np.isin(label_map.ravel()[flat_indices], [1, 3])
+    assert np.array_equal(mask, ref)
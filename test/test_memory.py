@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from multivariate_view.app.compute.preprocess import (
+    nonzero_voxels,
+    normalization_ranges,
+    normalize_channels,
+    normalize_rows,
+    normalized_nonzero_voxels,
+)
+from multivariate_view.app.compute.pyramid import build_level
+from multivariate_view.app.memory import (
+    LEVEL_FACTORS,
+    choose_decimation,
+    estimate_arrays,
+    estimate_footprint,
+    format_report,
+    memory_report,
+    parse_size,
+)
+
+
+def test_parse_size():
+    assert parse_size('100') == 100
+    assert parse_size('2k') == 2048
+    assert parse_size('1.5 GiB') == 3 * 2**29
+    assert parse_size('8GB') == 8 * 2**30
+
+    with pytest.raises(ValueError):
+        parse_size('8 gigs')
+
+
+def test_memory_report(tmp_path):
+    data = np.zeros((10, 10, 10, 4))
+    cropped = np.zeros((20, 10, 10, 4))[5:15]
+    np.save(tmp_path / 'mapped.npy', np.ones(100))
+    mapped = np.load(tmp_path / 'mapped.npy', mmap_mode='r')
+
+    rows = memory_report(
+        {
+            'data': data,
+            'flattened': data.reshape(-1, 4),
+            'channel': data[..., 1],
+            'cropped': cropped,
+            'mapped': mapped,
+            'missing': None,
+        }
+    )
+    rows = {row['name']: row for row in rows}
+    assert 'missing' not in rows
+
+    # Views are counted once, in the array that they are views of
+    assert rows['data']['bytes'] == data.nbytes
+    assert rows['flattened']['owner'] == 'data'
+    assert rows['channel']['owner'] == 'data'
+    assert rows['flattened']['bytes'] == rows['channel']['bytes'] == 0
+
+    # A view of another array counts all of that array
+    assert rows['cropped']['bytes'] == 2 * cropped.nbytes
+
+    assert rows['mapped']['bytes'] == 0
+    assert rows['mapped']['mapped'] == mapped.nbytes
+
+    report = format_report(list(rows.values()))
+    assert 'view of data' in report
+    assert '(mapped)' in report
+
+
+def test_choose_decimation():
+    shape = (100, 100, 100)
+    options = {'num_channels': 4, 'itemsize': 4, 'nonzero_fraction': 0.5}
+    footprint = estimate_footprint(np.prod(shape), **options)
+    mapped = estimate_footprint(np.prod(shape), mapped=True, **options)
+    assert mapped < footprint
+
+    assert choose_decimation(shape, footprint, **options) == 1
+    assert choose_decimation(shape, mapped, mapped=True, **options) == 1
+
+    factor = choose_decimation(shape, footprint / 10, **options)
+    assert factor > 1
+    decimated = [-(-n // factor) for n in shape]
+    assert estimate_footprint(np.prod(decimated), **options) <= footprint / 10
+
+    # The budget can not be met, so the data is decimated to one voxel
+    assert choose_decimation(shape, 1, **options) == 100
+
+
+@pytest.mark.parametrize('nonzero_fraction', [0.05, 0.5, 1])
+def test_estimate_levels(nonzero_fraction):
+    # Most blocks of sparse volumes have a single nonzero voxel
+    rng = np.random.default_rng(0)
+    shape = (20, 24, 28)
+    mask = rng.random(np.prod(shape)) < nonzero_fraction
+    indices = np.flatnonzero(mask).astype(np.int32)
+    data = rng.random((len(indices), 3))
+
+    levels = [build_level(indices, data, shape, f) for f in LEVEL_FACTORS]
+    nbytes = sum(
+        x.nonzero_data.nbytes + x.gbc.nbytes + x.index.indices.nbytes
+        for x in levels
+    )
+    estimates = estimate_arrays(
+        np.prod(shape),
+        num_channels=3,
+        itemsize=8,
+        nonzero_fraction=len(indices) / np.prod(shape),
+    )
+    assert nbytes <= estimates['levels']
+    assert levels[0].nonzero_data.nbytes < estimates['level_blocks']
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64, np.uint8])
+@pytest.mark.parametrize('separately', [False, True])
+def test_normalized_nonzero_voxels(dtype, separately):
+    rng = np.random.default_rng(0)
+    data = (rng.random((6, 7, 8, 3)) * 200 + 10).astype(dtype)
+    data[rng.random(data.shape[:3]) < 0.3] = data.min()
+    data[0, 0, 0, 1] = data.max()
+
+    # A constant channel is never zero once normalized
+    constant = data.copy()
+    constant[..., 2] = 5
+
+    for array in (data, constant):
+        normalized = normalize_channels(array, separately)
+        ranges = normalization_ranges(array, separately)
+        flattened = array.reshape(-1, 3)
+
+        ref = nonzero_voxels(normalized.reshape(-1, 3))
+        nonzero = normalized_nonzero_voxels(flattened, *ranges)
+        assert np.array_equal(nonzero, ref)
+
+        # The normalized rows match the normalized data
+        assert np.array_equal(
+            normalize_rows(flattened[nonzero], *ranges),
+            normalized.reshape(-1, 3)[nonzero],
+            equal_nan=True,
+        )
@@ -0,0 +1,75 @@
+import json
+import threading
+
+import numpy as np
+
+from multivariate_view.app.compute import compute_gbc
+from multivariate_view.app.profiling import PROFILER, Profiler, profiled
+
+
+def test_spans():
+    profiler = Profiler()
+    profiler.enable()
+    try:
+        for _ in range(3):
+            with profiler.span('allocate', 'stage'):
+                data = np.ones(2**20, dtype=np.uint8)
+
+        thread = threading.Thread(
+            target=lambda: profiler.span('thread').__enter__().__exit__(),
+            name='worker',
+        )
+        thread.start()
+        thread.join()
+    finally:
+        profiler.disable()
+
+    summary = {s['name']: s for s in profiler.summary()}
+    assert summary['allocate']['count'] == 3
+    assert summary['allocate']['category'] == 'stage'
+    assert summary['allocate']['allocated'] >= data.nbytes
+    assert summary['allocate']['max'] <= summary['allocate']['total']
+    assert summary['thread']['count'] == 1
+
+    trace = json.loads(json.dumps(profiler.chrome_trace()))
+    events = trace['traceEvents']
+    spans = [e for e in events if e['ph'] == 'X']
+    assert len(spans) == 4
+    assert all(e['dur'] >= 0 for e in spans)
+
+    thread_names = {
+        e['args']['name'] for e in events if e['name'] == 'thread_name'
+    }
+    assert {'worker', threading.current_thread().name} <= thread_names
+
+    profiler.clear()
+    assert profiler.summary() == []
+
+
+def test_profiled():
+    @profiled(category='stage')
+    def double(x):
+        """Double x"""
+        return 2 * x
+
+    assert double.__name__ == 'double'
+    assert double.__doc__ == 'Double x'
+
+    # Nothing is recorded while disabled
+    num_spans = len(PROFILER.spans)
+    assert double(2) == 4
+    assert len(PROFILER.spans) == num_spans
+
+    PROFILER.enable()
+    try:
+        assert double(3) == 6
+        compute_gbc(np.random.default_rng(0).random((10, 3)))
+    finally:
+        PROFILER.disable()
+
+    names = {s['name']: s['category'] for s in PROFILER.spans[num_spans:]}
+    assert names == {
+        'test_profiled.<locals>.double': 'stage',
+        'compute_gbc': 'kernel',
+    }
+    PROFILER.clear()
@@ -0,0 +1,74 @@
+import numpy as np
+
+from multivariate_view.app.compute.gbc import compute_gbc
+from multivariate_view.app.compute.pyramid import (
+    LatencyModel,
+    build_level,
+    choose_level,
+)
+
+
+def _block_mean(data, factor):
+    # Reference implementation on the dense volume
+    shape = data.shape[:3]
+    coarse_shape = tuple(-(-n // factor) for n in shape)
+    out = np.zeros((*coarse_shape, data.shape[3]))
+    for z, y, x in np.ndindex(coarse_shape):
+        block = data[
+            z * factor : (z + 1) * factor,
+            y * factor : (y + 1) * factor,
+            x * factor : (x + 1) * factor,
+        ]
+        out[z, y, x] = block.reshape(-1, data.shape[3]).mean(axis=0)
+
+    return out
+
+
+def test_build_level():
+    rng = np.random.default_rng(0)
+    shape = (9, 8, 7)
+    data = rng.random((*shape, 3))
+    data[rng.random(shape) < 0.6] = 0
+
+    flattened = data.reshape(-1, 3)
+    nonzero = ~np.all(np.isclose(flattened, 0), axis=1)
+
+    for factor in (2, 4):
+        level = build_level(
+            np.flatnonzero(nonzero), flattened[nonzero], shape, factor
+        )
+        ref = _block_mean(data, factor).reshape(-1, 3)
+        ref_nonzero = ~np.all(np.isclose(ref, 0), axis=1)
+
+        assert level.shape == tuple(-(-n // factor) for n in shape)
+        assert np.array_equal(level.index.mask(), ref_nonzero)
+        assert np.allclose(level.nonzero_data, ref[ref_nonzero])
+        assert np.allclose(level.gbc, compute_gbc(ref[ref_nonzero])[0])
+
+
+def test_build_empty_level():
+    indices = np.zeros(0, dtype=np.int32)
+    level = build_level(indices, np.zeros((0, 3)), (9, 8, 7), 2)
+    assert level.shape == (5, 4, 4)
+    assert len(level.index) == 0
+    assert level.index.indices.dtype == np.int32
+    assert level.nonzero_data.shape == (0, 3)
+
+
+def test_choose_level():
+    rng = np.random.default_rng(0)
+    shape = (16, 16, 16)
+    data = rng.random((np.prod(shape), 2))
+    indices = np.arange(len(data))
+    levels = [build_level(indices, data, shape, f) for f in (2, 4)]
+
+    latency = LatencyModel()
+    # Without any measurement, use full resolution
+    assert choose_level(levels, 4096, latency, 0.1) is None
+
+    # 1 ms per voxel
+    latency.record(1000, 1)
+    assert choose_level(levels, 4096, latency, 5) is None
+    assert choose_level(levels, 4096, latency, 0.6) is levels[0]
+    assert choose_level(levels, 4096, latency, 0.1) is levels[1]
+    assert choose_level(levels, 4096, latency, 0.01) is levels[1]
@@ -0,0 +1,161 @@
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import re
+import threading
+
+import h5py
+import numpy as np
+import pytest
+
+from multivariate_view.app import remote
+from multivariate_view.app.io import load_dataset
+from multivariate_view.app.remote import (
+    BlockCache,
+    RemoteFile,
+    chunk_ranges,
+)
+from multivariate_view.app.timeseries import find_timesteps
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    # Serves the files of `server.files`, with range requests, like an
+    # object store
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        content = self.server.files.get(path)
+        if content is None:
+            self.send_error(404)
+            return
+
+        match = re.fullmatch(
+            r'bytes=(\d+)-(\d+)', self.headers.get('Range', '')
+        )
+        if match is None:
+            self.send_error(400)
+            return
+
+        start, stop = int(match[1]), int(match[2]) + 1
+        self.server.ranges.append((path, start, stop))
+        body = content[start:stop]
+        self.send_response(206)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header(
+            'Content-Range', f'bytes {start}-{stop - 1}/{len(content)}'
+        )
+        etag = hashlib.md5(content).hexdigest()
+        self.send_header('ETag', f'"{etag}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.files = {}
+    server.ranges = []
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = BlockCache(tmp_path / 'blocks', block_size=4096)
+    monkeypatch.setattr(remote, 'BLOCK_CACHE', cache)
+    return cache
+
+
+def write_hdf5(path, rng):
+    arrays = {}
+    with h5py.File(path, 'w') as f:
+        for name in ('A', 'B', 'C'):
+            arrays[name] = rng.random((20, 16, 12))
+            f.create_dataset(name, data=arrays[name], chunks=(5, 8, 12))
+
+    return arrays
+
+
+def test_remote_file(server, cache):
+    content = np.random.default_rng(0).bytes(20000)
+    server.files['/data.bin'] = content
+    url = f'{server.url}/data.bin'
+
+    with RemoteFile(url) as f:
+        assert f.size == len(content)
+        f.seek(4000)
+        assert f.read(1000) == content[4000:5000]
+        f.seek(-100, 2)
+        assert f.read() == content[-100:]
+        f.seek(0)
+        assert f.read() == content
+
+        # Each block was fetched once
+        assert f.num_requests == 5
+
+    # Reopening reads the cache
+    with RemoteFile(url) as f:
+        assert f.read() == content
+        assert f.num_requests == 0
+
+    # A modified file is fetched again
+    server.files['/data.bin'] = content[::-1]
+    with RemoteFile(url) as f:
+        assert f.read() == content[::-1]
+        assert f.num_requests == 5
+
+
+def test_chunk_ranges(tmp_path):
+    rng = np.random.default_rng(1)
+    write_hdf5(tmp_path / 'data.h5', rng)
+    with h5py.File(tmp_path / 'data.h5', 'r') as f:
+        ranges = chunk_ranges(f['A'])
+        assert len(ranges) == 8
+        assert sum(size for _, size in ranges) == 20 * 16 * 12 * 8
+
+        # The hyperslab is in the chunks of the first two rows, at the
+        # second column
+        ranges = chunk_ranges(f['A'], (slice(3, 7), slice(10, 12)))
+        assert len(ranges) == 2
+
+
+def test_load_remote_hdf5(tmp_path, server, cache):
+    rng = np.random.default_rng(2)
+    path = tmp_path / 'data.h5'
+    arrays = write_hdf5(path, rng)
+    server.files['/scans/data.h5'] = path.read_bytes()
+    url = f'{server.url}/scans/data.h5'
+
+    labels, data = load_dataset(url)
+    assert labels == list(arrays)
+    assert np.array_equal(data, np.stack(list(arrays.values()), axis=3))
+
+    # Only the probe of the size is requested when reopening
+    num_requests = len(server.ranges)
+    assert num_requests > 1
+    labels, cached = load_dataset(url)
+    assert np.array_equal(cached, data)
+    assert server.ranges[num_requests:] == [('/scans/data.h5', 0, 1)]
+
+    timesteps = find_timesteps(url)
+    assert len(timesteps) == 1
+    assert timesteps[0].path == url
+
+
+def test_load_remote_npz(tmp_path, server, cache):
+    rng = np.random.default_rng(3)
+    arrays = {'A': rng.random((4, 5, 6)), 'B': rng.random((4, 5, 6))}
+    np.savez(tmp_path / 'data.npz', **arrays)
+    server.files['/data.npz'] = (tmp_path / 'data.npz').read_bytes()
+
+    labels, data = load_dataset(f'{server.url}/data.npz?version=1')
+    assert labels == ['A', 'B']
+    assert np.array_equal(data, np.stack([arrays['A'], arrays['B']], axis=3))
+
+    with pytest.raises(ValueError):
+        load_dataset(f'{server.url}/data.csv')
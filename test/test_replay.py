@@ -0,0 +1,60 @@
+import numpy as np
+from trame_server.state import State
+
+from multivariate_view.app.replay import (
+    load_session,
+    SessionRecorder,
+    summarize,
+)
+
+
+def test_record_session(tmp_path):
+    path = tmp_path / 'session.jsonl'
+    state = State(ready=True)
+    recorder = SessionRecorder(state, path)
+
+    # Nothing is recorded before starting
+    with state:
+        state.w_rotation = 10
+
+    recorder.start()
+    with state:
+        state.w_rotation = 20
+    with state:
+        state.lens_center = [0.1, 0.2]
+        state.w_lradius = 0.3
+    with state:
+        # Not an interaction
+        state.displayed_voxel_means = {}
+    with state:
+        state.data_channels = {
+            'Fe': {'label': 'Fe', 'histogram': b'\x01', 'enabled': True}
+        }
+
+    events = load_session(path)
+    assert [e['changes'] for e in events] == [
+        {'w_rotation': 20},
+        {'lens_center': [0.1, 0.2], 'w_lradius': 0.3},
+        {'data_channels': {'Fe': {'label': 'Fe', 'enabled': True}}},
+    ]
+    assert events[0]['time'] <= events[1]['time']
+
+
+def test_summarize():
+    stats = [
+        {'name': 'w_rotation', 'time': t, 'vtk_bytes': 10, 'client_bytes': 1}
+        for t in np.linspace(0.01, 0.1, 10)
+    ]
+    stats.append(
+        {'name': 'lens_center', 'time': 1, 'vtk_bytes': 5, 'client_bytes': 2}
+    )
+
+    summary = summarize(stats)
+    assert summary['all']['count'] == 11
+    assert summary['all']['max'] == 1
+    assert summary['all']['vtk_bytes'] == 105
+
+    rotation = summary['w_rotation']
+    assert rotation['count'] == 10
+    assert np.isclose(rotation['p50'], 0.055)
+    assert rotation['client_bytes'] == 10
@@ -0,0 +1,49 @@
+import numpy as np
+
+from multivariate_view.app.compute.bin import bin_indices
+from multivariate_view.app.compute.sampling import GBCSampler
+
+
+def _random_gbc(seed=0, size=20000):
+    rng = np.random.default_rng(seed)
+    gbc = rng.normal(scale=0.3, size=(size, 2))
+    # Add a small, separate cluster that random samples tend to miss
+    gbc[:5] = [0.9, -0.9]
+    return np.clip(gbc, -1, 1)
+
+
+def test_prefix_samples():
+    gbc = _random_gbc()
+    sampler = GBCSampler(gbc, seed=3)
+
+    # Samples do not have duplicates, and smaller samples are prefixes
+    small = sampler.sample(100)
+    large = sampler.sample(1000)
+    assert len(np.unique(large, axis=0)) == 1000
+    assert np.array_equal(small, large[:100])
+
+    # Results are cached, and reproducible with the same seed
+    result = sampler.bin_data(6, 1100)
+    assert sampler.bin_data(6, 1100) is result
+
+    other = GBCSampler(gbc, seed=3)
+    other.bin_data(4, 600)
+    assert np.array_equal(other.bin_data(6, 1100), result)
+
+
+def test_stratified_sampling():
+    gbc = _random_gbc()
+    sampler = GBCSampler(gbc, seed=0)
+
+    num_bins = 6
+    result = sampler.bin_data(num_bins, 100, stratified=True)
+
+    # Every non-empty bin of the whole population is represented
+    population_bins = np.unique(bin_indices(gbc, num_bins))
+    assert np.array_equal(
+        np.unique(bin_indices(result, num_bins)), population_bins
+    )
+
+    # And every sampled point is a point of the population
+    assert len(np.unique(result, axis=0)) == len(result)
+    assert np.isin(result.view(complex), gbc.view(complex)).all()
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from multivariate_view.app.compute.segmentation import (
+    SEGMENTATION_METHODS,
+    segment_voxels,
+    segmentation_label_map,
+)
+from multivariate_view.app.compute.voxels import build_voxel_index
+from multivariate_view.app.compute import compute_gbc
+
+
+def blobs(rng):
+    # Voxels of three phases, each rich in one of the channels, with
+    # 3000, 2000 and 1000 voxels
+    sizes = (3000, 2000, 1000)
+    data = []
+    for channel, size in enumerate(sizes):
+        values = rng.random((size, 3)) * 0.1
+        values[:, channel] += 1
+        data.append(values)
+
+    phases = np.repeat(np.arange(1, 4), sizes)
+    return np.vstack(data), phases
+
+
+@pytest.mark.parametrize('method', SEGMENTATION_METHODS)
+def test_segment_voxels(method):
+    rng = np.random.default_rng(0)
+    data, phases = blobs(rng)
+    order = rng.permutation(len(data))
+    data, phases = data[order], phases[order]
+    gbc, _ = compute_gbc(data)
+
+    clusters = segment_voxels(method, data, gbc, 3, seed=0)
+    assert clusters.dtype == np.int32
+
+    # The clusters are numbered by decreasing size
+    assert np.array_equal(clusters, phases)
+
+
+def test_segmentation_label_map():
+    rng = np.random.default_rng(1)
+    mask = rng.random((5, 6, 7)) < 0.5
+    index = build_voxel_index(mask.ravel(), mask.shape)
+    clusters = rng.integers(1, 4, len(index)).astype(np.int32)
+
+    label_map = segmentation_label_map(index, clusters, 3)
+    assert label_map.dtype == np.uint8
+    assert label_map.shape == mask.shape
+    assert np.all(label_map[~mask] == 0)
+    assert np.array_equal(label_map[mask], clusters)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        segment_voxels('watershed', np.zeros((1, 3)), np.zeros((1, 2)), 2)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from multivariate_view.app.compute.labels import build_label_index
+from multivariate_view.app.compute.selection import (
+    label_means,
+    lens_alpha,
+    mean_composition,
+)
+
+
+def test_lens_alpha():
+    gbc = np.array([[0, 0], [0.3, 0.4], [0.5, 0.5], [-1, 0]])
+
+    alpha = lens_alpha(gbc, [0, 0], 0.6)
+    assert alpha.tolist() == [True, True, False, False]
+
+    alpha = lens_alpha(gbc, [0, 0], 0.6, invert=True)
+    assert alpha.tolist() == [False, False, True, True]
+
+
+def test_mean_composition():
+    data = np.array([[1, 1, 0], [0, 0, 0], [0, 3, 1]], dtype=float)
+
+    # The all-zero voxel counts as zero in every channel
+    means = mean_composition(data)
+    assert np.allclose(means, [50 / 3, 125 / 3, 25 / 3])
+
+    assert mean_composition(data[:0]).tolist() == [0, 0, 0]
+
+
+def test_label_means():
+    rng = np.random.default_rng(0)
+    label_map = rng.integers(0, 3, size=(4, 5, 6))
+    data = rng.random((label_map.size, 3))
+    data[rng.random(label_map.size) < 0.2] = 0
+
+    label_index = build_label_index(label_map)
+    means = label_means(data, label_index)
+    assert means.shape == (3, 3)
+
+    for i, value in enumerate(label_index.values):
+        voxels = data[label_map.ravel() == value]
+        voxels = voxels[~np.all(voxels == 0, axis=1)]
+        ref = voxels.mean(axis=0)
+        assert np.allclose(means[i], ref / ref.sum())
+
+    # Normalizing the voxels of each label matches normalizing the data
+    ranges = (data.min(axis=0), data.max(axis=0))
+    normalized = (data - ranges[0]) / (ranges[1] - ranges[0])
+    assert np.allclose(
+        label_means(data, label_index, ranges),
+        label_means(normalized, label_index),
+    )
+
+    # The labels of only zero voxels have no composition
+    data[label_map.ravel() == 0] = 0
+    means = label_means(data, label_index)
+    assert means[0].tolist() == [0, 0, 0]
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from multivariate_view.app.compute import (
+    compute_gbc,
+    gbc_to_rgb,
+    rotate_coordinates,
+)
+from multivariate_view.app.compute.preprocess import (
+    normalization_ranges,
+    normalize_rows,
+    normalized_nonzero_voxels,
+)
+from multivariate_view.app.compute.voxels import build_voxel_index
+from multivariate_view.app.slabs import SlabPool, slab_bounds
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = SlabPool(2, min_rows=0)
+    yield pool
+    pool.close()
+
+
+def test_slab_bounds():
+    assert slab_bounds(10, 4).tolist() == [0, 2, 5, 7, 10]
+    assert slab_bounds(2, 8).tolist() == [0, 1, 2]
+    assert slab_bounds(0, 8).tolist() == [0, 0]
+
+
+def test_prepare_slabs(pool):
+    rng = np.random.default_rng(0)
+    data = rng.random((13, 7, 6, 3)).astype(np.float32)
+    data[rng.random(data.shape[:3]) < 0.6] = 0
+    data[:2] = 0
+
+    lo, hi = normalization_ranges(data, True)
+    prepared = pool.prepare(data, lo, hi)
+
+    flattened_data = data.reshape(-1, 3)
+    index = build_voxel_index(
+        normalized_nonzero_voxels(flattened_data, lo, hi), data.shape[:3]
+    )
+    nonzero_data = normalize_rows(index.gather(flattened_data), lo, hi)
+    gbc, components = compute_gbc(nonzero_data)
+
+    indices = prepared['nonzero_indices']
+    assert indices.dtype == index.indices.dtype
+    assert np.array_equal(indices, index.indices)
+    assert np.array_equal(prepared['nonzero_data'], nonzero_data)
+    assert np.array_equal(prepared['gbc'], gbc)
+    assert np.array_equal(prepared['components'], components)
+    assert np.array_equal(prepared['nonzero_means'], nonzero_data.mean(1))
+
+
+def test_slab_colors(pool):
+    gbc = np.random.default_rng(1).uniform(-1, 1, (1000, 2))
+    rotated, rgb = pool.colors(gbc, 0.5)
+
+    expected = rotate_coordinates(gbc, 0.5)
+    assert np.array_equal(rotated, expected)
+    assert np.allclose(rgb, gbc_to_rgb(expected))
@@ -0,0 +1,98 @@
+import json
+import subprocess
+import sys
+
+# Modules that are only needed by some formats, or some panels
+LAZY_MODULES = ('h5py', 'PIL', 'plotly.graph_objects', 'vtkmodules.vtkIOXML')
+
+# Kernels that are only called by other kernels
+INLINED_KERNELS = (
+    '_is_zero_row',
+    '_v',
+    '_cell_of',
+    '_add_composition',
+    '_corners_inside',
+    '_add_lens_voxels',
+)
+
+# Seconds to import the application and warm up its kernels, once they
+# are in numba's on-disk cache. This is about 2 s on a single core; the
+# bound leaves room for slower machines. Compiling them instead, on the
+# first run, takes minutes.
+STARTUP_SECONDS = 10
+
+
+def run_python(code: str):
+    # Run in a new interpreter, where nothing was imported or compiled
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_lazy_imports():
+    code = f'''
+import json, sys
+import multivariate_view.app.app
+print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))
+'''
+    assert run_python(code) == []
+
+
+def test_warm_up():
+    code = '''
+import importlib, json, pkgutil
+from numba.core.registry import CPUDispatcher
+import multivariate_view.app.compute as compute
+from multivariate_view.app.compute.parallel import start_threading_layer
+from multivariate_view.app.compute.warmup import warm_up
+
+start_threading_layer()
+warm_up()
+
+cold = []
+for info in pkgutil.iter_modules(compute.__path__):
+    module = importlib.import_module(f'{compute.__name__}.{info.name}')
+    for name, obj in vars(module).items():
+        kernel = getattr(obj, '__wrapped__', None)
+        if not isinstance(kernel, CPUDispatcher):
+            kernel = obj
+
+        if (
+            isinstance(kernel, CPUDispatcher)
+            and kernel.__module__ == module.__name__
+            and not kernel.signatures
+        ):
+            cold.append(name)
+
+print(json.dumps(cold))
+'''
+    assert sorted(run_python(code)) == sorted(INLINED_KERNELS)
+
+
+def test_startup_time(record_property):
+    code = '''
+import json, time
+start = time.perf_counter()
+import multivariate_view.app.app
+from multivariate_view.app.compute.parallel import start_threading_layer
+from multivariate_view.app.compute.warmup import warm_up
+
+imported = time.perf_counter()
+start_threading_layer()
+warm_up()
+end = time.perf_counter()
+print(json.dumps({'import': imported - start, 'warm_up': end - imported}))
+'''
+    # The first run fills the cache of the kernels, if needed
+    run_python(code)
+    times = run_python(code)
+    for stage, seconds in times.items():
+        record_property(f'{stage}_seconds', seconds)
+
+    total = sum(times.values())
+    print(f'Startup: {total:.2f} s ({times})')
+    assert total < STARTUP_SECONDS
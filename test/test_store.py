@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from multivariate_view.app.compute.histogram import HistogramCache
+from multivariate_view.app.store import DatasetStore
+
+
+def test_store_round_trip(tmp_path):
+    data_path = tmp_path / 'data.npz'
+    data_path.write_bytes(b'data')
+
+    store = DatasetStore(tmp_path / 'store')
+    key = store.key(data_path, normalize_channels=False)
+    assert store.load(key) is None
+
+    rng = np.random.default_rng(0)
+    arrays = {
+        'gbc': rng.random((100, 2)),
+        'nonzero_indices': rng.random(200) < 0.5,
+    }
+    metadata = {'header': ['a', 'b', 'c'], 'data_shape': [2, 10, 10]}
+    saved_metadata, saved_arrays = store.save(key, metadata, arrays)
+    assert saved_metadata == metadata
+
+    loaded_metadata, loaded_arrays = store.load(key)
+    assert loaded_metadata == metadata
+    for name, array in arrays.items():
+        assert np.array_equal(loaded_arrays[name], array)
+        assert loaded_arrays[name].dtype == array.dtype
+
+        # The arrays are memory-mapped, and shared
+        assert isinstance(loaded_arrays[name], np.memmap)
+        with pytest.raises(ValueError):
+            loaded_arrays[name][0] = 0
+
+    # Saving again keeps the first entry
+    store.save(key, {'header': []}, {'gbc': np.zeros(3)})
+    assert store.load(key)[0] == metadata
+    assert os.listdir(store.directory) == [key]
+
+
+def test_store_key(tmp_path):
+    data_path = tmp_path / 'data.npz'
+    data_path.write_bytes(b'data')
+
+    store = DatasetStore(tmp_path)
+    key = store.key(data_path, opacity_channel=None)
+    assert key == store.key(data_path, opacity_channel=None)
+    assert key != store.key(data_path, opacity_channel='Fe')
+
+    # Modifying the file changes the key
+    data_path.write_bytes(b'other data')
+    assert key != store.key(data_path, opacity_channel=None)
+
+
+def test_histogram_cache_from_arrays():
+    data = np.random.default_rng(0).random((1000, 3))
+    cache = HistogramCache(data, num_bins=20)
+    restored = HistogramCache.from_arrays(
+        cache.counts, cache.bins, cache.edges
+    )
+
+    assert restored.num_bins == 20
+    indices = np.arange(0, 1000, 3)
+    assert np.array_equal(
+        restored.subset_counts(indices), cache.subset_counts(indices)
+    )
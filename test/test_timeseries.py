@@ -0,0 +1,85 @@
+import threading
+
+import h5py
+import numpy as np
+import pytest
+
+from multivariate_view.app.timeseries import (
+    TimestepCache,
+    find_timesteps,
+)
+
+
+def test_find_timesteps(tmp_path):
+    rng = np.random.default_rng(0)
+    volumes = {t: rng.random((2, 3, 4)) for t in (1, 2, 10)}
+    with h5py.File(tmp_path / 'series.h5', 'w') as series:
+        for t, volume in volumes.items():
+            np.savez(tmp_path / f'scan_{t}.npz', a=volume, b=2 * volume)
+            series[f't{t}/a'] = volume
+            series[f't{t}/b'] = 2 * volume
+
+    # Numbers in the names are sorted as numbers
+    timesteps = find_timesteps(tmp_path / 'scan_*.npz')
+    assert [t.path.name for t in timesteps] == [
+        'scan_1.npz',
+        'scan_2.npz',
+        'scan_10.npz',
+    ]
+
+    timesteps = find_timesteps(tmp_path / 'series.h5')
+    assert [t.group for t in timesteps] == ['t1', 't2', 't10']
+
+    for timestep, volume in zip(timesteps, volumes.values()):
+        labels, data = timestep.load()
+        assert labels == ['a', 'b']
+        assert np.array_equal(data, np.stack([volume, 2 * volume], axis=3))
+
+    # A file of datasets is a single timestep
+    with h5py.File(tmp_path / 'single.h5', 'w') as f:
+        f['a'] = volumes[1]
+
+    timesteps = find_timesteps(tmp_path / 'single.h5')
+    assert len(timesteps) == 1
+    assert timesteps[0].group is None
+
+    with pytest.raises(FileNotFoundError):
+        find_timesteps(tmp_path / 'missing_*.h5')
+
+
+def test_timestep_cache():
+    prepared = []
+    release = threading.Event()
+
+    def prepare(index):
+        release.wait()
+        if index < 0:
+            raise ValueError('Invalid timestep')
+
+        prepared.append(index)
+        return index * 10
+
+    cache = TimestepCache(prepare, size=3)
+    cache.put(0, 0)
+    cache.prefetch([1, 2])
+    assert cache.cached() == [0, 1, 2]
+
+    # The least recently requested timestep is evicted, and cancelled
+    # if it is still queued
+    future = cache.get(2)
+    cache.get(3)
+    assert cache.cached() == [1, 2, 3]
+
+    release.set()
+    assert future.result() == 20
+    assert cache.get(3).result() == 30
+    assert cache.get(0).result() == 0
+    assert prepared.count(2) == 1
+
+    # Failed timesteps are prepared again
+    failed = cache.get(-1)
+    with pytest.raises(ValueError):
+        failed.result()
+
+    assert cache.get(-1) is not failed
+    cache.shutdown()
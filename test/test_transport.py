@@ -0,0 +1,43 @@
+import timeit
+
+import msgpack
+import numpy as np
+
+from multivariate_view.app.transport import float32_buffer, uint8_buffer
+
+
+def test_float32_payload_size():
+    rng = np.random.default_rng(0)
+    coords = rng.random((10000, 2)) * 2 - 1
+
+    payload = float32_buffer(coords)
+    assert len(payload) == coords.size * 4
+
+    decoded = np.frombuffer(payload, dtype=np.float32).reshape(-1, 2)
+    assert np.array_equal(decoded, coords.astype(np.float32))
+
+    # Compare the messages as they are sent to the client
+    binary_message = msgpack.packb(payload)
+    list_message = msgpack.packb(coords.tolist())
+    assert len(binary_message) < len(list_message) / 2
+    assert len(binary_message) - len(payload) < 16
+
+
+def test_float32_encode_time():
+    rng = np.random.default_rng(0)
+    coords = rng.random((100000, 2))
+
+    def encode_binary():
+        msgpack.packb(float32_buffer(coords))
+
+    def encode_list():
+        msgpack.packb(coords.tolist())
+
+    binary_time = min(timeit.repeat(encode_binary, number=3, repeat=3))
+    list_time = min(timeit.repeat(encode_list, number=3, repeat=3))
+    assert binary_time < list_time / 5
+
+
+def test_uint8_payload():
+    histogram = np.array([0, 5, 100])
+    assert uint8_buffer(histogram) == bytes([0, 5, 100])
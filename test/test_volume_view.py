@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from vtkmodules.vtkRenderingCore import vtkWindowToImageFilter
+import vtkmodules.util.numpy_support as np_s
+
+from multivariate_view.app.compute.rgba import masked_rgba_uint8
+from multivariate_view.app.volume_view import RENDER_BACKENDS, VolumeView
+
+
+def test_masked_rgba_uint8():
+    rgba = np.array(
+        [
+            [0, 0.5, 1, 1],
+            [-0.5, 1.5, 0.2, 0.6],
+            [0.1, 0.2, 0.3, 0.4],
+        ]
+    )
+    mask = np.array([1, 1, 0], dtype=np.uint8)
+
+    result = masked_rgba_uint8(rgba, mask)
+    assert result.dtype == np.uint8
+    assert result.tolist() == [
+        [0, 128, 255, 255],
+        [0, 255, 51, 153],
+        [26, 51, 77, 0],
+    ]
+
+
+@pytest.mark.parametrize('backend', RENDER_BACKENDS)
+def test_render_backends(backend):
+    rng = np.random.default_rng(0)
+    data = np.zeros((24, 24, 24, 4))
+    data[4:-4, 4:-4, 4:-4, :3] = rng.random((16, 16, 16, 3))
+    data[4:-4, 4:-4, 4:-4, 3] = 0.5
+
+    view = VolumeView(backend)
+    view.render_window.SetOffScreenRendering(True)
+    view.render_window.SetSize(64, 64)
+    view.set_data(data)
+    view.renderer.ResetCamera()
+
+    def render():
+        view.render_window.Render()
+        image = vtkWindowToImageFilter()
+        image.SetInput(view.render_window)
+        image.Update()
+        scalars = image.GetOutput().GetPointData().GetScalars()
+        return np_s.vtk_to_numpy(scalars)
+
+    view.mask_reference[:] = 1
+    view.mask_data.Modified()
+    assert render().max() > 0
+
+    # The masked voxels are not rendered
+    view.mask_reference[:] = 0
+    view.mask_data.Modified()
+    assert render().max() == 0
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        VolumeView('opengl')
@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+from multivariate_view.app.compute.preprocess import (
+    crop_padding,
+    normalization_ranges,
+    padding_width,
+    remove_padding_uniform,
+)
+from multivariate_view.app.compute.voxels import (
+    SparseVolume,
+    VoxelIndex,
+    build_voxel_index,
+    index_dtype,
+    index_rows,
+)
+
+
+def test_build_voxel_index():
+    rng = np.random.default_rng(0)
+    mask = rng.random((9, 7, 5)) < 0.3
+    index = build_voxel_index(mask.ravel(), mask.shape)
+
+    assert index.indices.dtype == np.int32
+    assert np.array_equal(index.indices, np.flatnonzero(mask))
+    assert np.array_equal(index.mask(), mask.ravel())
+    assert len(index) == np.count_nonzero(mask)
+    assert index.num_voxels == mask.size
+
+    # Empty masks have no voxels
+    empty = build_voxel_index(np.zeros(mask.size, dtype=bool), mask.shape)
+    assert len(empty) == 0
+
+
+def test_index_dtype():
+    assert index_dtype(1000) == np.int32
+    assert index_dtype(2**31 - 1) == np.int32
+    assert index_dtype(2**31) == np.int64
+
+
+def test_gather_scatter():
+    rng = np.random.default_rng(1)
+    shape = (6, 5, 4)
+    mask = rng.random(shape).ravel() < 0.5
+    index = build_voxel_index(mask, shape)
+
+    data = rng.random((mask.size, 3)).astype(np.float32)
+    gathered = index.gather(data)
+    assert gathered.dtype == np.float32
+    assert np.array_equal(gathered, data[mask])
+    assert np.array_equal(index.gather(data[:, 0]), data[mask, 0])
+
+    # Scatter into the columns of a larger array
+    rgba = np.zeros((mask.size, 4))
+    index.scatter(gathered.T.astype(np.float64).T, rgba[:, :3])
+    index.scatter(gathered.mean(axis=1), rgba[:, 3])
+
+    expected = np.zeros((mask.size, 4))
+    expected[mask, :3] = data[mask]
+    expected[mask, 3] = data[mask].mean(axis=1)
+    assert np.allclose(rgba, expected)
+
+    # Booleans are scattered into a uint8 mask
+    alpha = rng.random(len(index)) < 0.5
+    out = np.zeros(mask.size, dtype=np.uint8)
+    index.scatter(alpha, out)
+    assert np.array_equal(np.flatnonzero(out), index.indices[alpha])
+
+    with pytest.raises(ValueError):
+        index.scatter(alpha, out[:-1])
+
+
+def test_empty_voxel_index():
+    indices = np.zeros(0, dtype=np.int32)
+    for shape in ((2, 3), (2, 0)):
+        index = VoxelIndex(shape, indices)
+        num_voxels = index.num_voxels
+
+        values = np.arange(num_voxels * 4.0).reshape(num_voxels, 4)
+        assert index.gather(values).shape == (0, 4)
+        assert index.gather(values[:, 0]).shape == (0,)
+
+        rgba = values.copy()
+        index.scatter(np.zeros((3, 0)).T, rgba[:, :3])
+        index.scatter(np.zeros(0, dtype=bool), rgba[:, 3])
+        assert np.array_equal(rgba, values)
+
+
+def test_voxel_index_of_indices():
+    indices = np.array([0, 3, 5], dtype=np.int32)
+    index = VoxelIndex((2, 3), indices)
+
+    values = np.arange(12.0).reshape(6, 2)
+    assert np.array_equal(index.gather(values), [[0, 1], [6, 7], [10, 11]])
+    assert index.mask().tolist() == [1, 0, 0, 1, 0, 1]
+
+
+def test_sparse_volume():
+    rng = np.random.default_rng(2)
+    data = np.zeros((10, 9, 8, 2))
+    data[2:7, 3:6, 2:6] = rng.random((5, 3, 4, 2))
+    data[4, 4, 4] = 0
+
+    # List the voxels out of order, with a zero voxel
+    coordinates = np.argwhere(~np.all(data == 0, axis=3))
+    coordinates = np.vstack([coordinates, [[0, 0, 0]]])
+    coordinates = coordinates[rng.permutation(len(coordinates))]
+    values = data[tuple(coordinates.T)]
+    volume = SparseVolume.from_coordinates(coordinates, (10, 9, 8), values)
+
+    assert volume.shape == data.shape
+    assert np.all(np.diff(volume.index.indices) > 0)
+    assert np.array_equal(volume.to_dense(), data)
+
+    # The voxels that are not listed are zeros
+    lo, hi = volume.normalization_ranges(True)
+    assert np.array_equal(lo, normalization_ranges(data, True)[0])
+    assert np.array_equal(hi, normalization_ranges(data, True)[1])
+
+    width = volume.padding_width()
+    cropped = volume.crop(width)
+    assert width == padding_width(data, remove_padding_uniform(data))
+    assert np.array_equal(cropped.to_dense(), crop_padding(data, width))
+
+    decimated = cropped.decimate(2)
+    assert np.array_equal(
+        decimated.to_dense(), crop_padding(data, width)[::2, ::2, ::2]
+    )
+
+    with pytest.raises(ValueError):
+        SparseVolume.from_coordinates(
+            coordinates[[0, 0]], (10, 9, 8), values[[0, 0]]
+        )
+
+
+def test_index_rows():
+    rng = np.random.default_rng(3)
+    raw_index = build_voxel_index(rng.random(60) < 0.5, (3, 4, 5))
+    mask = rng.random(len(raw_index)) < 0.5
+
+    index, rows = index_rows(mask, raw_index, (3, 4, 5))
+    assert np.array_equal(rows.indices, np.flatnonzero(mask))
+    assert np.array_equal(index.indices, raw_index.indices[mask])
+
+    # Dense data has a row per voxel
+    mask = rng.random(60) < 0.5
+    index, rows = index_rows(mask, None, (3, 4, 5))
+    assert np.array_equal(index.indices, np.flatnonzero(mask))
+    assert np.array_equal(rows.indices, index.indices)
@@ -1,6 +1,10 @@
 import * as d3 from "d3";
-import { computeColorMapImage } from "../utils/colors";
-import { rotateCoordinates } from "../utils/compute";
+import { computeColorMapImage, computeDensityImage } from "../utils/colors";
+import {
+  rotateCoordinates,
+  toFloat32Array,
+  toPoints,
+} from "../utils/compute";
 
 const { ref, unref, toRefs, computed, watch } = window.Vue;
 
@@ -42,11 +46,25 @@ export default {
     componentLabels: {
       type: Array,
     },
+    densityImage: {
+      default: null,
+      help: "Row-major 8-bit density of all voxels over the unrotated GBC plane",
+    },
+    densityResolution: {
+      type: Number,
+      default: 128,
+    },
+    showDensity: {
+      type: Boolean,
+      default: true,
+    },
     unrotatedComponentCoords: {
-      type: Array,
+      default: null,
+      help: "float32 buffer (or nested array) of the [x, y] of each component",
     },
     unrotatedBinData: {
-      type: Array,
+      default: null,
+      help: "float32 buffer (or nested array) of the [x, y] of each sample",
     },
   },
   setup(props, { emit }) {
@@ -55,10 +73,21 @@ export default {
     const bgImage = computed(() =>
       computeColorMapImage(props.size, props.brushMode)
     );
+    const densityImage = computed(() =>
+      computeDensityImage(props.densityImage, props.densityResolution)
+    );
+    // The density is computed without rotation, so rotate the image instead
+    const densityTransform = computed(
+      () => `rotate(${props.rotation}, ${props.size / 2}, ${props.size / 2})`
+    );
+    const binData = computed(() => toFloat32Array(props.unrotatedBinData));
+    const componentCoords = computed(() =>
+      toFloat32Array(props.unrotatedComponentCoords)
+    );
     const dataToDraw = computed(() =>
       ({
-        data: rotateCoordinates(props.unrotatedBinData, unref(radRotationAngle)),
-        components: rotateCoordinates(props.unrotatedComponentCoords, unref(radRotationAngle))
+        data: toPoints(rotateCoordinates(unref(binData), unref(radRotationAngle))),
+        components: toPoints(rotateCoordinates(unref(componentCoords), unref(radRotationAngle)))
       })
     );
     const diameter = computed(() => Math.round(props.size * 2.4) / 3.1);
@@ -123,19 +152,30 @@ export default {
       }
     );
 
-    const { componentLabels, lensRadius, showLens, size } = toRefs(props);
+    const {
+      componentLabels,
+      lensRadius,
+      showDensity,
+      showLens,
+      size,
+    } = toRefs(props);
     return {
       bgImage,
       componentLabels,
       container,
       dataToDraw,
+      densityImage,
+      densityTransform,
+      diameter,
       lensLocation,
       lensRadius,
       lensRadiusDisplayUnits,
       onMousePress,
       scaleGBC,
+      showDensity,
       showLens,
       size,
+      xyOffset,
     };
   },
   template: `
@@ -143,6 +183,18 @@ export default {
           <svg :width="size" :height="size">
             <image :href="bgImage" x="0" y="0" :width="size" :height="size" />
 
+            <image
+              v-if="showDensity && densityImage"
+              :href="densityImage"
+              :x="xyOffset"
+              :y="xyOffset"
+              :width="diameter"
+              :height="diameter"
+              :transform="densityTransform"
+              preserveAspectRatio="none"
+              style="image-rendering: pixelated;"
+            />
+
             <g fill="#fff" stroke="black" stroke-opacity="0.5">
               <circle
                 :key="'scatter-' + i"
@@ -1,6 +1,7 @@
 import * as d3 from "d3";
 
 const CANVAS_COLOR_MAP = document.createElement("canvas");
+const CANVAS_DENSITY = document.createElement("canvas");
 
 export function colorConstrainInUnit(cx, cy) {
   const r = Math.sqrt(Math.pow(cx, 2) + Math.pow(cy, 2));
@@ -62,3 +63,27 @@ export function computeColorMapImage(size, brushMode) {
 
   return CANVAS_COLOR_MAP.toDataURL("image/png");
 }
+
+export function computeDensityImage(density, resolution) {
+  // density is a row-major 8-bit grayscale image of resolution x resolution
+  if (!density || !resolution) {
+    return null;
+  }
+
+  const values = ArrayBuffer.isView(density)
+    ? new Uint8Array(density.buffer, density.byteOffset, density.byteLength)
+    : new Uint8Array(density);
+
+  CANVAS_DENSITY.width = resolution;
+  CANVAS_DENSITY.height = resolution;
+  const ctx = CANVAS_DENSITY.getContext("2d");
+  const image = ctx.createImageData(resolution, resolution);
+
+  // Darken the color map where there are many voxels
+  for (let i = 0; i < values.length; i++) {
+    image.data[i * 4 + 3] = values[i] * 0.8;
+  }
+  ctx.putImageData(image, 0, 0);
+
+  return CANVAS_DENSITY.toDataURL("image/png");
+}
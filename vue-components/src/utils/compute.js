@@ -2,16 +2,58 @@
 // Helper local methods
 // ----------------------------------------------------------------------------
 
+export function toFloat32Array(data) {
+  // Coordinates are either sent as binary float32 buffers, or as nested
+  // [[x, y], ...] arrays. Both are converted to flat [x0, y0, x1, y1, ...]
+  if (!data) {
+    return new Float32Array(0);
+  }
+  if (data instanceof Float32Array) {
+    return data;
+  }
+  if (data instanceof ArrayBuffer) {
+    return new Float32Array(data);
+  }
+  if (ArrayBuffer.isView(data)) {
+    if (data.byteOffset % Float32Array.BYTES_PER_ELEMENT === 0) {
+      return new Float32Array(
+        data.buffer,
+        data.byteOffset,
+        data.byteLength / Float32Array.BYTES_PER_ELEMENT
+      );
+    }
+    // Unaligned views need to be copied first
+    const bytes = new Uint8Array(
+      data.buffer,
+      data.byteOffset,
+      data.byteLength
+    ).slice();
+    return new Float32Array(bytes.buffer);
+  }
+
+  return Float32Array.from(data.flat());
+}
+
 export function rotateCoordinates(coords, angle) {
-  // Rotate coordinates about the center by the angle (radians)
+  // Rotate flat [x0, y0, x1, y1, ...] coordinates about the center by the
+  // angle (radians)
   const cosAngle = Math.cos(angle);
   const sinAngle = Math.sin(angle);
 
-  const out = new Array(coords.length);
-  for (let i = 0; i < coords.length; i++) {
-    out[i] = new Array(2);
-    out[i][0] = cosAngle * coords[i][0] - sinAngle * coords[i][1];
-    out[i][1] = sinAngle * coords[i][0] + cosAngle * coords[i][1];
+  const out = new Float32Array(coords.length);
+  for (let i = 0; i < coords.length; i += 2) {
+    out[i] = cosAngle * coords[i] - sinAngle * coords[i + 1];
+    out[i + 1] = sinAngle * coords[i] + cosAngle * coords[i + 1];
+  }
+
+  return out;
+}
+
+export function toPoints(coords) {
+  // Views of each [x, y] pair of flat coordinates, without copying
+  const out = new Array(coords.length / 2);
+  for (let i = 0; i < out.length; i++) {
+    out[i] = coords.subarray(2 * i, 2 * i + 2);
   }
 
   return out;